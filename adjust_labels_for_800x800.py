@@ -1,4 +1,35 @@
 import os
+import label_transforms as transforms
+from label_store import LabelStore, StoreWriter, is_store, write_arrays
+
+# 800x600 -> 800x800: 100 pixel black bars are added to the top and bottom
+PADDING = transforms.pad(0, 100, 0, 100, 800, 600)
+
+def adjust_store(input_store, output_folder):
+    """
+    Same adjustment as adjust_coordinates for a label store, as one array operation.
+    """
+    store = LabelStore(input_store)
+    coords = PADDING(store.coords)
+
+    if is_store(output_folder):
+        write_arrays(output_folder, store.names, store.file_offsets, store.class_ids, store.vertex_offsets, coords)
+        return
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    flat = coords.reshape(-1).tolist()
+    offsets = store.vertex_offsets.tolist()
+    for i, name in enumerate(store.names):
+        adjusted_lines = []
+        for obj in range(store.file_offsets[i], store.file_offsets[i + 1]):
+            start, end = offsets[obj], offsets[obj + 1]
+            if end > start:
+                adjusted_lines.append(f"{store.class_ids[obj]} " + " ".join(map(str, flat[2 * start:2 * end])))
+
+        with open(os.path.join(output_folder, name + ".txt"), "w") as outfile:
+            outfile.write("\n".join(adjusted_lines) + "\n")
 
 def adjust_coordinates(input_folder, output_folder):
     """
@@ -6,13 +37,19 @@ def adjust_coordinates(input_folder, output_folder):
     Black bars are added to the top and bottom, so y-coordinates need scaling.
 
     Parameters:
-    - input_folder: Folder containing input .txt files.
-    - output_folder: Folder to save adjusted .txt files.
+    - input_folder: Folder containing input .txt files, or a label store (.ylbl).
+    - output_folder: Folder to save adjusted .txt files, or a label store (.ylbl).
     """
-    if not os.path.exists(output_folder):
+    if is_store(input_folder):
+        adjust_store(input_folder, output_folder)
+        print(f"Adjusted files saved to: {output_folder}")
+        return
+
+    writer = StoreWriter(output_folder) if is_store(output_folder) else None
+    if writer is None and not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
+    for filename in sorted(os.listdir(input_folder)):
         if filename.endswith(".txt"):
             input_path = os.path.join(input_folder, filename)
             output_path = os.path.join(output_folder, filename)
@@ -20,23 +57,27 @@ def adjust_coordinates(input_folder, output_folder):
             with open(input_path, "r") as infile:
                 lines = infile.readlines()
 
-            adjusted_lines = []
+            objects = []
             for line in lines:
                 parts = line.strip().split()
                 if len(parts) > 1:
-                    class_id = parts[0]
-                    coords = list(map(float, parts[1:]))
+                    objects.append((int(parts[0]), list(map(float, parts[1:]))))
 
-                    # Adjust y-coordinates (odd indices in the coords list)
-                    for i in range(1, len(coords), 2):
-                        coords[i] = (coords[i] * 600 + 100) / 800
+            # Adjust y-coordinates of all polygons at once
+            class_ids, vertex_offsets, coords = transforms.pack(objects)
+            adjusted_objects = transforms.unpack(class_ids, vertex_offsets, PADDING(coords))
+            adjusted_lines = [f"{class_id} " + " ".join(map(str, coords)) for class_id, coords in adjusted_objects]
 
-                    adjusted_line = f"{class_id} " + " ".join(map(str, coords))
-                    adjusted_lines.append(adjusted_line)
+            if writer is not None:
+                writer.add(os.path.splitext(filename)[0], adjusted_objects)
+                continue
 
             with open(output_path, "w") as outfile:
                 outfile.write("\n".join(adjusted_lines) + "\n")
 
+    if writer is not None:
+        writer.close()
+
     print(f"Adjusted files saved to: {output_folder}")
 
 # Example usage
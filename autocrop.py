@@ -1,108 +1,216 @@
 import argparse
+import io
 import os
+import sys
 from PIL import Image
-from PIL import ImageDraw
 from pathlib import Path    
+import math
+from batch import default_workers, print_failures, run_batch
+from crop_plan import read_plan, write_plan
+from crop_search import SEARCH_METHODS, absolute_polygons, crop_losses, pack_polygons, profile_crop, vectorized_crop
+from crop_cache import CacheReport, close_caches, evict_cache, open_cache
+from dataset_index import DatasetIndex
+from polygon_clip import CLIP_METHODS, clip_crop, clip_objects, crop_loss, frame_polygons, split_losses
+from polygon_simplify import SimplifyReport, simplify_objects
+from prefetch import Prefetcher, WriteBehind
+from image_backends import PillowBackend, add_backend_arguments, backend_from_args
+from jpeg_lossless import available_engine, is_aligned, lossless_crop, mcu_size, read_bytes, write_bytes
+from instrumentation import NO_TIMER, StageTimer, TimingLog, file_size
+import label_transforms as transforms
+from label_store import LabelStore, StoreWriter, format_label_text, is_store, load_from_store, load_store, parse_label_text
+from manifest import MANIFEST_FILENAME, ManifestWriter, fingerprint, is_up_to_date, load_manifest, remove_outputs
+from overlay import render_overlay
+
+def parse_size(text):
+    """Parse a WIDTHxHEIGHT argument."""
+    try:
+        width, height = (int(value) for value in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive, got {text!r}")
+    return width, height
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Autocrop and resize images, adjusting YOLOv11 labels.")
     parser.add_argument("width", type=int, help="Target width of the cropped/resized image.")
     parser.add_argument("height", type=int, help="Target height of the cropped/resized image.")
+    parser.add_argument("--target", type=parse_size, action="append", default=[], metavar="WIDTHxHEIGHT",
+                        help="Also produce this size from the same decode (repeatable). With several sizes each goes to ./output/WIDTHxHEIGHT/.")
     parser.add_argument("--debug", help="Output preview images for debugging.", action="store_true")
-    return parser.parse_args()
+    parser.add_argument("--labels", default="./input/labels",
+                        help="Input labels: a directory of .txt files or a label store (.ylbl). Defaults to ./input/labels.")
+    parser.add_argument("--label-store", action="store_true",
+                        help="Write the output labels to one label store, ./output/labels.ylbl, instead of a .txt file per image.")
+    parser.add_argument("--search", choices=SEARCH_METHODS, default=None,
+                        help="Crop search engine for --clip clamp (default 'profile'). 'vectorized' scores splits in NumPy batches; 'exhaustive' scores every split directly and is kept as a reference. --clip exact has a search of its own.")
+    parser.add_argument("--clip", choices=CLIP_METHODS, default="exact",
+                        help="How polygons are cut at the crop window: 'exact' clips them (and drops objects left with no area); 'clamp' moves each vertex into the window, as older versions did.")
+    parser.add_argument("--fit", choices=FIT_METHODS, default="crop",
+                        help="'crop' to the target aspect ratio; 'pad' to scale the whole image to fit and add black bars (letterbox), which loses no labels; 'hybrid' to crop unless the best crop loses more than --pad-threshold of the labelled area, and pad then.")
+    parser.add_argument("--pad-threshold", type=float, default=0.01, metavar="FRACTION",
+                        help="Share of the labelled area a crop may lose before --fit hybrid pads instead. Defaults to 0.01.")
+    parser.add_argument("--lossless", action="store_true",
+                        help="Cut JPEGs that need no resize (the target is the cropped size) without re-encoding them, nudging crops onto MCU boundaries. Needs PyTurboJPEG or jpegtran.")
+    parser.add_argument("--align-tolerance", type=float, default=0.0, metavar="FRACTION",
+                        help="Share of the labelled area --lossless may lose, beyond the best crop, to reach an MCU-aligned crop.")
+    parser.add_argument("--crop-cache", metavar="CACHE_FILE",
+                        help="Reuse crop decisions for identical image sizes and label geometry, from memory and from CACHE_FILE (SQLite), shared by workers and later runs.")
+    parser.add_argument("--cache-entries", type=int, default=1000000, help="Crops kept in --crop-cache; the least recently used go first.")
+    parser.add_argument("--cache-quantum", type=float, default=0.0, metavar="PIXELS",
+                        help="Round label coordinates to PIXELS for --crop-cache keys, so near-identical layouts share a crop. 0 (default) only reuses exact matches.")
+    parser.add_argument("--simplify", type=float, default=None, metavar="PIXELS",
+                        help="Simplify polygons (Douglas-Peucker) right after loading, dropping vertices that move the outline by less than PIXELS of the output image.")
+    parser.add_argument("--precision", type=int, default=6,
+                        help="Decimal places per coordinate in the output labels (older versions wrote 16).")
+    parser.add_argument("--quality", type=int, default=75, help="JPEG quality of the output images.")
+    add_backend_arguments(parser)
+    parser.add_argument("--no-draft", dest="draft", action="store_false",
+                        help="Always decode JPEGs at full size instead of using reduced-size (DCT scaled) decoding.")
+    plan_group = parser.add_mutually_exclusive_group()
+    plan_group.add_argument("--plan", metavar="PLAN_FILE",
+                            help="Only decide the crops, from image headers and labels, and write them to PLAN_FILE.")
+    plan_group.add_argument("--apply", metavar="PLAN_FILE",
+                            help="Crop and resize using the decisions in PLAN_FILE instead of searching.")
+    parser.add_argument("--force", help="Reprocess every image, even those the manifest records as unchanged. Outputs of removed inputs are still deleted.", action="store_true")
+    parser.add_argument("--timings", metavar="LOG_FILE",
+                        help="Record per-image stage timings and counters to LOG_FILE (JSONL) and print the slowest images.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="DEPTH",
+                        help="Read up to DEPTH images and labels ahead of processing, from threads. Helps on network storage.")
+    parser.add_argument("--write-behind", type=int, default=0, metavar="DEPTH",
+                        help="Write outputs from threads, with up to DEPTH images waiting to be written.")
+    parser.add_argument("--io-threads", type=int, default=4, help="Threads used by --prefetch and --write-behind, each.")
+    args = parser.parse_args()
+    if args.search is not None and args.clip == "exact":
+        parser.error("--search only applies to --clip clamp; exact clipping scores crops with its own search")
+    if args.search is None:
+        args.search = "profile"
+    return args
 
 def load_label(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        objects = []
-        for line in lines:
-            parts = line.strip().split()
-            class_index = int(parts[0])
-            points = list(map(float, parts[1:]))
-            objects.append((class_index, points))
-        return objects
-
-def save_label(file_path, objects):
-    with open(file_path, 'w') as file:
-        for i, obj in enumerate(objects):
-            class_index, points = obj
-            points_str = ' '.join(map(lambda x: f"{x:.16f}", points))
-            # Add a newline for all but the last object
-            if i < len(objects) - 1:
-                file.write(f"{class_index} {points_str}\n")
-            else:
-                file.write(f"{class_index} {points_str}")
+    if isinstance(file_path, tuple):
+        # (store path, name) of a label file in a label store
+        return load_from_store(*file_path)
+    if hasattr(file_path, "read"):
+        # Label text already read into memory (io.StringIO)
+        return parse_label_text(file_path.read())
 
-def generate_debug_image(image, labels, output_path, orig_image):
-    img = Image.open(image).convert('RGBA')
-    width = img.size[0]
-    height = img.size[1]
+    with open(file_path, 'r') as file:
+        return parse_label_text(file.read())
 
-    labeled_images = []
+def save_label(file_path, objects, precision=6):
+    # No newline after the last object, as autocrop has always written
+    text = format_label_text(objects, precision).rstrip("\n")
+    if hasattr(file_path, "write"):
+        file_path.write(text)
+        return
+    with open(file_path, 'w') as file:
+        file.write(text)
 
+def render_debug_image(image, labels, orig_image):
+    """The original image above the output image with its labels drawn on it."""
     # YOLO labels file format:
     # https://docs.ultralytics.com/datasets/segment/#supported-dataset-formats
-    with open(labels) as polygons:
-        for line in polygons:
-            x = []
-            y = []
-
-            points = line.split()[1:]
-            x = points[::2] # all even indexes
-            y = points[1::2] # all odd indexes
-
-            # Convert from percentages to actual pixel values
-            x = [float(pt) * width for pt in x]
-            y = [float(pt) * height for pt in y]
-
-            # convert values to ints
-            x_int = map(int, x)
-            y_int = map(int, y)
-
-            polygon_image = img.copy()
-            draw = ImageDraw.Draw(polygon_image)
-            if len(x) != 0:
-                draw.polygon(list(zip(x_int,y_int)), fill = "green")
-
-            merged_image = Image.blend(img, polygon_image, 0.5)
-            img = merged_image
-
-        upper_image = Image.open(orig_image).convert('RGBA')
-        lower_image = img
-
-        # Calculate the width and height of the new image
-        width = max(lower_image.width, upper_image.width)
-        height = lower_image.height + upper_image.height
-                    
-        # Create a new blank image with the calculated dimensions
-        combined_image = Image.new("RGB", (width, height), (255, 255, 255))  # White background
-        combined_image.paste(upper_image, (0, 0))
-        combined_image.paste(lower_image, (0, upper_image.height))
-        combined_image.save(os.path.join(output_path, Path(image).stem + ".png"))
+    img = render_overlay(Image.open(image), load_label(labels))
 
-def adjust_polygon(polygon, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height):
-    adjusted = []
+    upper_image = Image.open(orig_image).convert('RGBA')
+    lower_image = img
+
+    # Calculate the width and height of the new image
+    width = max(lower_image.width, upper_image.width)
+    height = lower_image.height + upper_image.height
+                
+    # Create a new blank image with the calculated dimensions
+    combined_image = Image.new("RGB", (width, height), (255, 255, 255))  # White background
+    combined_image.paste(upper_image, (0, 0))
+    combined_image.paste(lower_image, (0, upper_image.height))
+    return combined_image
+
+def generate_debug_image(image, labels, output_path, orig_image):
+    render_debug_image(image, labels, orig_image).save(os.path.join(output_path, Path(image).stem + ".png"))
+
+def adjust_transform(orig_width, orig_height, crop_left, crop_top, cropped_width, cropped_height, target_width, target_height):
+    """Label transform from the original image to the cropped and resized one."""
     scale_x = target_width / cropped_width
     scale_y = target_height / cropped_height
 
-    for i in range(0, len(polygon), 2):
+    return transforms.compose(
         # Convert normalized coordinates to pixel coordinates and adjust for crops
-        x = polygon[i] * orig_width - crop_left
-        y = polygon[i + 1] * orig_height - crop_top
-        
+        transforms.denormalize(orig_width, orig_height),
+        transforms.translate(-crop_left, -crop_top),
         # Clamp to the cropped region
-        x = max(0, min(x, cropped_width))
-        y = max(0, min(y, cropped_height))
-        
+        transforms.clip(0, 0, cropped_width, cropped_height),
         # Scale to target dimensions and normalize
-        x = x * scale_x / target_width
-        y = y * scale_y / target_height
-        
-        adjusted.extend([x, y])
+        transforms.scale(scale_x, scale_y),
+        transforms.normalize(target_width, target_height),
+    )
+
+def adjust_objects(objects, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height, clip="clamp"):
+    """
+    Adjust all polygons of a label file in one array operation (see adjust_polygon).
+
+    With clip="exact" polygons are clipped to the crop instead of having their
+    vertices clamped into it, redundant vertices along the crop edges are
+    removed, and polygons with no area left in the crop are dropped.
+    """
+    class_ids, vertex_offsets, coords = transforms.pack(objects)
+    if clip != "exact":
+        transform = adjust_transform(orig_width, orig_height, crop_left, crop_top, cropped_width, cropped_height, target_width, target_height)
+        return transforms.unpack(class_ids, vertex_offsets, transform(coords))
+
+    coords = transforms.compose(
+        transforms.denormalize(orig_width, orig_height),
+        transforms.translate(-crop_left, -crop_top),
+    )(coords)
+    class_ids, vertex_offsets, coords = clip_objects(class_ids, vertex_offsets, coords, 0, 0, cropped_width, cropped_height)
+    coords = transforms.compose(
+        transforms.scale(target_width / cropped_width, target_height / cropped_height),
+        transforms.normalize(target_width, target_height),
+    )(coords)
+    return transforms.unpack(class_ids, vertex_offsets, coords)
+
+def adjust_polygon(polygon, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height):
+    adjusted = adjust_objects([(0, polygon)], orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height)
+    return adjusted[0][1]
+
+def letterbox_objects(objects, orig_width, orig_height, target_width, target_height, clip="clamp"):
+    """
+    Adjust all polygons of a label file for the image scaled to fit the target
+    size and padded to it (see label_transforms.letterbox_padding).
+
+    Nothing is cropped, so with clip="exact" only the parts of polygons
+    outside the original frame are clipped away.
+
+    Returns:
+        tuple: (adjusted objects, (left, top, right, bottom) padding in target pixels).
+    """
+    scaled_width, scaled_height, left, top, right, bottom = transforms.letterbox_padding(orig_width, orig_height, target_width, target_height)
+    adjusted = adjust_objects(objects, orig_width, orig_height, 0, 0, 0, 0, orig_width, orig_height, scaled_width, scaled_height, clip)
+    class_ids, vertex_offsets, coords = transforms.pack(adjusted)
+    coords = transforms.pad(left, top, right, bottom, scaled_width, scaled_height)(coords)
+    return transforms.unpack(class_ids, vertex_offsets, coords), (left, top, right, bottom)
+
+def prepare_polygons(width, height, polygons, search="exhaustive", clip="clamp"):
+    """
+    Pixel-space polygon data for the crop search calculate_crop will run.
 
-    return adjusted
+    It only depends on the image size and the polygons, not on the crop
+    size, so searches for several targets on one image can share it.
+
+    Returns:
+        The engine's data, or None for the exhaustive search.
+    """
+    if clip == "exact":
+        return frame_polygons(width, height, polygons)
+    if search == "profile":
+        return absolute_polygons(width, height, polygons)
+    if search == "vectorized":
+        return pack_polygons(width, height, polygons)
+    return None
 
-def calculate_crop(width, height, crop_x, crop_y, polygons):
+def calculate_crop(width, height, crop_x, crop_y, polygons, search="exhaustive", stats=None, clip="clamp", prepared=None, cache=None):
     """
     Calculate the optimal cropping strategy to minimize the area of polygons lost.
 
@@ -113,10 +221,46 @@ def calculate_crop(width, height, crop_x, crop_y, polygons):
         crop_y (int): Amount to crop vertically, in total.
         polygons (list): List of polygons in YOLO format, where each polygon is a 
                         list of normalized (x, y) points.
+        search (str): "exhaustive" to score every split, "vectorized" to score
+                      them in NumPy batches, or "profile" to use the prefix-sum
+                      engine in crop_search.py.
+        stats (dict): If given, receives "candidates" (number of splits scored)
+                      and "easy_crop" (index of the one-sided crop taken, or None).
+        clip (str): "clamp" to measure the loss with vertices clamped into the
+                    crop, as the search engines do, or "exact" to measure it
+                    with polygons clipped to the crop (search is then ignored).
+        prepared: prepare_polygons(width, height, polygons, search, clip), if
+                  already computed.
+        cache (CropCache): Crops decided before, looked up by image size,
+                           crop amounts, search, clip and polygon geometry
+                           (see crop_cache.py). A hit scores no candidates.
 
     Returns:
         tuple: Optimal cropping amounts (left_crop, right_crop, top_crop, bottom_crop).
     """
+    if cache is not None:
+        key = cache.key(width, height, crop_x, crop_y, polygons, search, clip)
+        crop = cache.get(key)
+        if crop is not None:
+            if stats is not None:
+                stats["candidates"] = 0
+                stats["easy_crop"] = None
+            return crop
+        crop = calculate_crop(width, height, crop_x, crop_y, polygons, search, stats, clip, prepared)
+        cache.put(key, crop)
+        return crop
+
+    if clip == "exact":
+        return clip_crop(width, height, crop_x, crop_y, polygons, stats, prepared)
+    if search == "profile":
+        return profile_crop(width, height, crop_x, crop_y, polygons, stats, prepared)
+    if search == "vectorized":
+        return vectorized_crop(width, height, crop_x, crop_y, polygons, stats, prepared)
+
+    if stats is None:
+        stats = {}
+    stats["candidates"] = 0
+    stats["easy_crop"] = None
 
     # Convert normalized polygons to absolute pixel coordinates
     absolute_polygons = [
@@ -126,6 +270,7 @@ def calculate_crop(width, height, crop_x, crop_y, polygons):
 
     def crop_loss(left, right, top, bottom):
         """Calculate the loss of polygon area for a given crop."""
+        stats["candidates"] += 1
         cropped_area = 0
         for polygon in absolute_polygons:
             cropped_polygon = [
@@ -149,14 +294,11 @@ def calculate_crop(width, height, crop_x, crop_y, polygons):
         ) / 2
 
     # Check for easy solution: full crop from one side
-    if crop_loss(crop_x, 0, crop_y, 0) == 0:
-        return (crop_x, 0, crop_y, 0)
-    if crop_loss(0, crop_x, crop_y, 0) == 0:
-        return (0, crop_x, crop_y, 0)
-    if crop_loss(crop_x, 0, 0, crop_y) == 0:
-        return (crop_x, 0, 0, crop_y)
-    if crop_loss(0, crop_x, 0, crop_y) == 0:
-        return (0, crop_x, 0, crop_y)
+    easy = [(crop_x, 0, crop_y, 0), (0, crop_x, crop_y, 0), (crop_x, 0, 0, crop_y), (0, crop_x, 0, crop_y)]
+    for index, crop in enumerate(easy):
+        if crop_loss(*crop) == 0:
+            stats["easy_crop"] = index
+            return crop
 
     # Try different cropping splits
     best_loss = float('inf')
@@ -175,12 +317,112 @@ def calculate_crop(width, height, crop_x, crop_y, polygons):
 
     return best_crop
 
-def process_image(image_path, label_path, output_image_path, output_label_path, target_width, target_height):
-    image = Image.open(image_path)
-    orig_width, orig_height = image.size
+def crop_loss_fraction(width, height, crop, polygons, clip="clamp", prepared=None):
+    """
+    Share of the labelled area that a crop loses, measured as calculate_crop
+    measures it for the same clip method.
 
-    objects = load_label(label_path)
+    Args:
+        crop (tuple): (left, right, top, bottom) crop.
+        prepared: prepare_polygons result for clip="exact" or the
+                  "vectorized" search, reused if given.
+
+    Returns:
+        float: Lost area over labelled area, 0.0 for images without polygons.
+    """
+    if clip == "exact":
+        framed = prepared if prepared is not None else frame_polygons(width, height, polygons)
+        loss, area = crop_loss(width, height, crop, polygons, framed)
+    else:
+        packed = prepared if isinstance(prepared, dict) else pack_polygons(width, height, polygons)
+        loss, area = float(crop_losses(packed, [crop])[0]), packed["area"]
+    return loss / area if area > 0 else 0.0
+
+def aligned_crop(width, height, crop, polygons, block, clip="clamp", prepared=None, tolerance=0.0):
+    """
+    Move a crop onto MCU boundaries so it can be cut from the JPEG losslessly
+    (see jpeg_lossless.py).
+
+    Every split whose left and top crops are multiples of the block size is
+    scored, and the one that loses least is taken if it loses at most
+    tolerance (a fraction of the labelled area) more than crop. Ties go to
+    the split closest to crop.
+
+    Args:
+        crop (tuple): (left, right, top, bottom) crop found by calculate_crop.
+        block (tuple): MCU (width, height) in pixels.
+        prepared: prepare_polygons result, reused where it fits.
+
+    Returns:
+        tuple: The aligned crop, or crop if none is good enough.
+    """
+    left, right, top, bottom = crop
+    if is_aligned(left, top, block):
+        return crop
+    crop_x, crop_y = left + right, top + bottom
+    lefts = list(range(0, crop_x + 1, block[0]))
+    tops = list(range(0, crop_y + 1, block[1]))
+    candidates = [(l, crop_x - l, t, crop_y - t) for l in lefts for t in tops]
 
+    if clip == "exact":
+        framed = prepared if prepared is not None else frame_polygons(width, height, polygons)
+        table, area = split_losses(width, height, crop_x, crop_y, lefts, tops, polygons, framed)
+        losses = table.reshape(-1)
+        loss = crop_loss(width, height, crop, polygons, framed)[0]
+    else:
+        packed = prepared if isinstance(prepared, dict) else pack_polygons(width, height, polygons)
+        losses = crop_losses(packed, [crop] + candidates)
+        loss, losses, area = losses[0], losses[1:], packed["area"]
+
+    # Losses within floating point noise of each other count as equal
+    noise = 1e-9 * max(1.0, area)
+    least = min(losses)
+    best = min((i for i in range(len(candidates)) if losses[i] <= least + noise),
+               key=lambda i: abs(candidates[i][0] - left) + abs(candidates[i][2] - top))
+    if losses[best] - loss <= tolerance * area + noise:
+        return candidates[best]
+    return crop
+
+# Reduced-size JPEG decoding must leave the cropped region at least this many
+# times larger than the target, so the final resample still averages over
+# several decoded pixels and the output stays close to a full-size decode
+DRAFT_MIN_OVERSAMPLE = 2.0
+
+def draft_scale(box_width, box_height, target_width, target_height):
+    """
+    Pick the JPEG DCT scaling factor to decode a crop box with.
+
+    Args:
+        box_width (int): Width of the crop box in the full-size image.
+        box_height (int): Height of the crop box in the full-size image.
+        target_width (int): Width the crop box is resized to.
+        target_height (int): Height the crop box is resized to.
+
+    Returns:
+        int: 1, 2, 4 or 8. 1 means the image should be decoded at full size.
+    """
+    for scale in (8, 4, 2):
+        if (box_width / scale >= target_width * DRAFT_MIN_OVERSAMPLE and
+                box_height / scale >= target_height * DRAFT_MIN_OVERSAMPLE):
+            return scale
+    return 1
+
+# How a target aspect ratio is reached: cropping as little labelled area as
+# possible, letterboxing (scaling to fit and padding with black, which loses
+# nothing), or cropping unless the best crop loses more than a threshold
+FIT_METHODS = ("crop", "pad", "hybrid")
+
+# EXIF tag holding the image orientation
+ORIENTATION_TAG = 0x0112
+
+def crop_amounts(orig_width, orig_height, target_width, target_height):
+    """
+    Work out how much has to be cropped to reach the target aspect ratio.
+
+    Returns:
+        tuple: (crop_x, crop_y, cropped_width, cropped_height) where crop_x and
+               crop_y are half the total horizontal/vertical crop.
+    """
     # Calculate target aspect ratio
     target_aspect_ratio = target_width / target_height
     orig_aspect_ratio = orig_width / orig_height
@@ -200,55 +442,772 @@ def process_image(image_path, label_path, output_image_path, output_label_path,
         cropped_width = orig_width
         cropped_height = new_height
 
-    crop_left, crop_right, crop_top, crop_bottom = calculate_crop(orig_width, orig_height, crop_x*2, crop_y*2, [lst for _, lst in objects])
-    cropped_image = image.crop((crop_left, crop_top, orig_width - crop_right, orig_height - crop_bottom))
+    return crop_x, crop_y, cropped_width, cropped_height
+
+def simplify_labels(objects, orig_width, orig_height, targets, tolerance):
+    """
+    Simplify polygons with a tolerance in pixels of the output image.
+
+    The crop size, and so the scale from the original image to the output,
+    only depends on the image and target sizes, so this can run before the
+    crop is chosen. With several targets the tolerance applies at the
+    largest output scale, so it holds for all of them.
 
-    # Resize the image
-    resized_image = cropped_image.resize((target_width, target_height))
+    Args:
+        targets (list): (width, height) output sizes.
 
-    # Adjust the labels
-    adjusted_objects = []
-    for class_index, points in objects:
-        adjusted_points = adjust_polygon(points, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height)
-        adjusted_objects.append((class_index, adjusted_points))
+    Returns:
+        tuple: (objects, stats) as returned by polygon_simplify.simplify_objects.
+    """
+    scale_x = scale_y = 0.0
+    for target_width, target_height in targets:
+        _, _, cropped_width, cropped_height = crop_amounts(orig_width, orig_height, target_width, target_height)
+        scale_x = max(scale_x, orig_width * target_width / cropped_width)
+        scale_y = max(scale_y, orig_height * target_height / cropped_height)
+    return simplify_objects(objects, tolerance, scale_x, scale_y)
 
-    # Save the processed image and labels
-    resized_image.save(output_image_path, "JPEG")
-    save_label(output_label_path, adjusted_objects)
+def plan_image(image_path, label_path, target_width, target_height, search="exhaustive", clip="clamp", simplify=None, cache=None):
+    """
+    Decide the crop for an image from its header and labels, without decoding pixels.
+
+    Returns:
+        dict: Plan row with the image "width", "height", EXIF "orientation" and "crop".
+    """
+    # Image.open only parses the header; pixels are decoded on first access
+    with Image.open(image_path) as image:
+        orig_width, orig_height = image.size
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+
+    objects = load_label(label_path)
+    if simplify is not None:
+        objects, _ = simplify_labels(objects, orig_width, orig_height, [(target_width, target_height)], simplify)
+    crop_x, crop_y, _, _ = crop_amounts(orig_width, orig_height, target_width, target_height)
+    crop = calculate_crop(orig_width, orig_height, crop_x*2, crop_y*2, [lst for _, lst in objects], search, clip=clip, cache=cache)
+    return {"width": orig_width, "height": orig_height, "orientation": orientation, "crop": crop}
+
+def autocrop_image(image, objects, target_width, target_height, search="exhaustive", draft=True, crop=None, clip="clamp", timer=NO_TIMER, backend=None, fit="crop", pad_threshold=0.0):
+    """
+    Crop and resize an opened image and adjust its labels.
+
+    Args:
+        image (PIL.Image): Image as returned by Image.open. Reduced-size JPEG
+                           decoding only applies if its pixels have not been
+                           loaded yet.
+        objects (list): (class_index, points) tuples with normalized points.
+        target_width (int): Width of the output image.
+        target_height (int): Height of the output image.
+        search (str): Crop search engine, see calculate_crop.
+        draft (bool): Allow reduced-size JPEG decoding.
+        crop (tuple): Planned (left, right, top, bottom) crop, or None to search.
+        clip (str): "exact" or "clamp", see calculate_crop and adjust_objects.
+        timer (StageTimer): Receives stage timings and counters (see instrumentation.py).
+        backend (PillowBackend): Resize backend (see image_backends.py), or
+                                 None for Pillow's defaults.
+        fit (str): "crop", "pad" to letterbox instead, or "hybrid" to
+                   letterbox only when the best crop loses more than
+                   pad_threshold of the labelled area (see FIT_METHODS).
+        pad_threshold (float): Lost area fraction above which "hybrid" pads.
+
+    Returns:
+        tuple: (resized image, adjusted objects, (left, right, top, bottom) crop).
+               A letterboxed image has a (0, 0, 0, 0) crop.
+    """
+    return autocrop_targets(image, objects, [(target_width, target_height)], search, draft, [crop], clip, timer, backend, fit, pad_threshold)[0][:3]
+
+def autocrop_targets(image, objects, targets, search="exhaustive", draft=True, crops=None, clip="clamp", timer=NO_TIMER, backend=None, fit="crop", pad_threshold=0.0, cache=None):
+    """
+    Crop and resize an opened image to several sizes, decoding it once.
+
+    The crop for every target is decided first (fit_targets), from the image
+    size and the labels. The image is then decoded once, at the most reduced
+    JPEG scale that every target allows, and each target is cropped and
+    resized from that decode (render_targets).
+
+    Args:
+        targets (list): (width, height) output sizes.
+        crops (list): Planned crop (or None to search) for each target, or
+                      None to search them all. A planned crop is always used,
+                      whatever fit is.
+        cache (CropCache): Crop decision cache, see calculate_crop.
+        Other arguments as in autocrop_image.
+
+    Returns:
+        list: (resized image, adjusted objects, crop, padding) for each
+              target, padding being the (left, top, right, bottom) borders
+              of a letterboxed image or None.
+    """
+    plans = fit_targets(image.size[0], image.size[1], objects, targets, search, crops, clip, timer, fit, pad_threshold, cache=cache)
+    return render_targets(image, objects, plans, draft, clip, timer, backend)
+
+def fit_targets(orig_width, orig_height, objects, targets, search="exhaustive", crops=None, clip="clamp", timer=NO_TIMER, fit="crop", pad_threshold=0.0, block=None, align_tolerance=0.0, cache=None):
+    """
+    Decide how each target is cut from an image, without touching its pixels.
+
+    Args:
+        block (tuple): JPEG MCU size. If given, searched crops that need no
+                       resize are moved to the MCU-aligned split that loses
+                       least, if it loses at most align_tolerance more of
+                       the labelled area (see aligned_crop), so they can be
+                       cropped losslessly.
+        Other arguments as in autocrop_targets.
+
+    Returns:
+        list: (target_width, target_height, cropped_width, cropped_height,
+               crop, pad) plans for render_targets.
+    """
+    polygons = [lst for _, lst in objects]
+
+    prepared = None
+    plans = []
+    for index, (target_width, target_height) in enumerate(targets):
+        crop_x, crop_y, cropped_width, cropped_height = crop_amounts(orig_width, orig_height, target_width, target_height)
+        crop = crops[index] if crops is not None else None
+        pad = False
+
+        if crop is not None:
+            # Planned crop; it has to have been made for an image of this size
+            crop_left, crop_right, crop_top, crop_bottom = crop
+            if crop_left + crop_right != crop_x*2 or crop_top + crop_bottom != crop_y*2:
+                raise ValueError(f"Planned crop {tuple(crop)} does not fit a {orig_width}x{orig_height} image")
+        elif fit == "pad":
+            pad = True
+        else:
+            stats = {} if timer.enabled else None
+            with timer.stage("calculate_crop"):
+                # With a cache, a hit needs no polygon data; a miss prepares its own
+                if prepared is None and cache is None:
+                    prepared = prepare_polygons(orig_width, orig_height, polygons, search, clip)
+                crop_left, crop_right, crop_top, crop_bottom = calculate_crop(orig_width, orig_height, crop_x*2, crop_y*2, polygons, search, stats, clip, prepared, cache)
+                if fit == "hybrid" and crop_x + crop_y > 0:
+                    lost = crop_loss_fraction(orig_width, orig_height, (crop_left, crop_right, crop_top, crop_bottom), polygons, clip, prepared)
+                    pad = lost > pad_threshold
+                    timer.set("lost_fraction", lost)
+                if block is not None and not pad and (orig_width - crop_x*2, orig_height - crop_y*2) == (target_width, target_height):
+                    crop_left, crop_right, crop_top, crop_bottom = aligned_crop(orig_width, orig_height, (crop_left, crop_right, crop_top, crop_bottom),
+                                                                                polygons, block, clip, prepared, align_tolerance)
+            if stats is not None:
+                timer.count("candidates", stats["candidates"])
+                timer.set("easy_crop", stats["easy_crop"])
+
+        if pad:
+            # Keep the whole image; it is scaled to fit and centred on a black canvas
+            crop_left = crop_right = crop_top = crop_bottom = 0
+            cropped_width, cropped_height = orig_width, orig_height
+        plans.append((target_width, target_height, cropped_width, cropped_height, (crop_left, crop_right, crop_top, crop_bottom), pad))
+    return plans
+
+def render_targets(image, objects, plans, draft=True, clip="clamp", timer=NO_TIMER, backend=None):
+    """
+    Decode an opened image once and cut every planned target from it.
+
+    Args:
+        plans (list): Plans from fit_targets.
+        Other arguments as in autocrop_targets.
+
+    Returns:
+        list: (resized image, adjusted objects, crop, padding) for each plan,
+              as returned by autocrop_targets.
+    """
+    if backend is None:
+        backend = PillowBackend()
+    orig_width, orig_height = image.size
+
+    # Let libjpeg decode at 1/2, 1/4 or 1/8 size when every target is small
+    # enough. Targets that would have allowed a smaller decode on their own
+    # resize from a box-reduced copy instead, as DCT scaling does, so they
+    # cost what a separate run would.
+    scales = []
+    for target_width, target_height, _, _, (left, right, top, bottom), pad in plans:
+        if pad:
+            target_width, target_height = transforms.letterbox_padding(orig_width, orig_height, target_width, target_height)[:2]
+        scales.append(draft_scale(orig_width - left - right, orig_height - top - bottom, target_width, target_height) if draft else 1)
+    with timer.stage("decode"):
+        if min(scales) > 1:
+            image.draft(image.mode, (math.ceil(orig_width / min(scales)), math.ceil(orig_height / min(scales))))
+        image.load()
+    timer.set("draft_scale", orig_width // image.size[0])
+    decoded_scale = min(scales) if image.size != (orig_width, orig_height) else 1
+    reduce_targets = len(plans) > 1 and image.format == "JPEG"
+
+    reduced = {1: image}
+    results = []
+    for (target_width, target_height, cropped_width, cropped_height, crop, pad), scale in zip(plans, scales):
+        crop_left, crop_right, crop_top, crop_bottom = crop
+        crop_box = (crop_left, crop_top, orig_width - crop_right, orig_height - crop_bottom)
+        output_size = (target_width, target_height)
+        if pad:
+            scaled_width, scaled_height, pad_left, pad_top = transforms.letterbox_padding(orig_width, orig_height, target_width, target_height)[:4]
+            output_size = (scaled_width, scaled_height)
+        with timer.stage("resize"):
+            factor = scale // decoded_scale if reduce_targets else 1
+            if factor not in reduced:
+                reduced[factor] = image.reduce(factor)
+            source = reduced[factor]
+            if source.size != (orig_width, orig_height):
+                # Map the crop into the reduced image; resize takes a fractional box
+                scale_x = source.size[0] / orig_width
+                scale_y = source.size[1] / orig_height
+                reduced_box = (crop_box[0] * scale_x, crop_box[1] * scale_y, crop_box[2] * scale_x, crop_box[3] * scale_y)
+                resized_image = backend.resize(source, output_size, reduced_box)
+            else:
+                cropped_image = image.crop(crop_box)
+
+                # Resize the image
+                resized_image = backend.resize(cropped_image, output_size)
+
+            if pad:
+                canvas = Image.new(resized_image.mode, (target_width, target_height))
+                canvas.paste(resized_image, (pad_left, pad_top))
+                resized_image = canvas
+
+        # Adjust the labels
+        with timer.stage("label_adjust"):
+            if pad:
+                adjusted_objects, padding = letterbox_objects(objects, orig_width, orig_height, target_width, target_height, clip)
+            else:
+                adjusted_objects = adjust_objects(objects, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom, cropped_width, cropped_height, target_width, target_height, clip)
+                padding = None
+
+        results.append((resized_image, adjusted_objects, crop, padding))
+    return results
+
+def process_image(image_path, label_path, output_image_path, output_label_path, target_width, target_height, search="exhaustive", draft=True, crop=None, clip="clamp", simplify=None, precision=6, backend=None, stats=None, timer=NO_TIMER, fit="crop", pad_threshold=0.0, lossless=False, align_tolerance=0.0, cache=None):
+    target = {"width": target_width, "height": target_height, "crop": crop,
+              "output_image": output_image_path, "output_label": output_label_path}
+    return process_image_targets(image_path, label_path, [target], search, draft, clip, simplify, precision, backend, stats, timer,
+                                 fit, pad_threshold, lossless, align_tolerance, cache)[0][0]
+
+def process_image_targets(image_path, label_path, targets, search="exhaustive", draft=True, clip="clamp", simplify=None, precision=6, backend=None, stats=None, timer=NO_TIMER, fit="crop", pad_threshold=0.0, lossless=False, align_tolerance=0.0, cache=None):
+    """
+    Crop, resize and save an image and its labels for several output sizes,
+    reading and decoding them once (see autocrop_targets).
+
+    Args:
+        targets (list): Dicts with the output "width" and "height", a planned
+                        "crop" or None, and "output_image" and "output_label"
+                        paths or file objects.
+        lossless (bool): Cut JPEG targets that need no resize straight from
+                         the compressed data (see jpeg_lossless.py), with
+                         searched crops moved onto MCU boundaries when that
+                         costs at most align_tolerance of the labelled area.
+                         Other targets, or all of them if no lossless crop
+                         engine is installed, are decoded and re-encoded.
+        cache (CropCache): Crop decision cache, see calculate_crop.
+        Other arguments as in process_image.
+
+    Returns:
+        list: (crop, padding, lossless) of each target; crop and padding as
+              returned by autocrop_targets, lossless True if the image was
+              cut without re-encoding.
+    """
+    with timer.stage("decode"):
+        image = Image.open(image_path)
+    with timer.stage("label_load"):
+        objects = load_label(label_path)
+    orig_width, orig_height = image.size
+
+    sizes = [(target["width"], target["height"]) for target in targets]
+    # A letterboxed image is scaled less than a cropped one, so the tolerance
+    # worked out for cropping holds for padding too
+    if simplify is not None:
+        with timer.stage("simplify"):
+            objects, simplified = simplify_labels(objects, orig_width, orig_height, sizes, simplify)
+        if stats is not None:
+            stats.update(simplified)
+        timer.set("vertices_before_simplify", simplified["vertices_before"])
+        timer.set("max_deviation", simplified["max_deviation"])
+
+    if timer.enabled:
+        timer.set("polygons", len(objects))
+        timer.set("vertices", sum(len(points) // 2 for _, points in objects))
+        timer.count("bytes_read", file_size(image_path) + file_size(label_path))
+
+    block = mcu_size(image) if lossless and available_engine() is not None else None
+    plans = fit_targets(orig_width, orig_height, objects, sizes, search, [target.get("crop") for target in targets],
+                        clip, timer, fit, pad_threshold, block, align_tolerance, cache)
+
+    # Targets that are a plain MCU-aligned crop of the JPEG are copied out of it
+    outputs = {}
+    for index, (target_width, target_height, cropped_width, cropped_height, crop, pad) in enumerate(plans):
+        crop_left, crop_right, crop_top, crop_bottom = crop
+        box_size = (orig_width - crop_left - crop_right, orig_height - crop_top - crop_bottom)
+        if block is None or pad or not is_aligned(crop_left, crop_top, block) or \
+                box_size != (target_width, target_height) or (cropped_width, cropped_height) != box_size:
+            continue
+        try:
+            with timer.stage("lossless_crop"):
+                data = lossless_crop(read_bytes(image_path), crop_left, crop_top, target_width, target_height)
+        except Exception as e:
+            # The re-encoding path always works; say why this one did not
+            print(f"Lossless crop failed, re-encoding instead: {type(e).__name__}: {e}")
+            continue
+        with timer.stage("label_adjust"):
+            adjusted_objects = adjust_objects(objects, orig_width, orig_height, crop_left, crop_right, crop_top, crop_bottom,
+                                              cropped_width, cropped_height, target_width, target_height, clip)
+        timer.count("lossless", 1)
+        outputs[index] = (data, adjusted_objects, crop, None)
+
+    remaining = [index for index in range(len(plans)) if index not in outputs]
+    if remaining:
+        if backend is None:
+            backend = PillowBackend()
+        results = render_targets(image, objects, [plans[index] for index in remaining], draft, clip, timer, backend)
+        outputs.update(zip(remaining, results))
+
+    fits = []
+    for index, target in enumerate(targets):
+        output_image, adjusted_objects, crop, padding = outputs[index]
+        # Save the processed image and labels
+        with timer.stage("encode"):
+            if isinstance(output_image, bytes):
+                write_bytes(target["output_image"], output_image)
+            else:
+                backend.save(output_image, target["output_image"], "JPEG")
+        with timer.stage("label_save"):
+            save_label(target["output_label"], adjusted_objects, precision)
+
+        if timer.enabled:
+            timer.count("bytes_written", file_size(target["output_image"]) + file_size(target["output_label"]))
+        fits.append((crop, padding, isinstance(output_image, bytes)))
+    return fits
+
+def read_inputs(job):
+    """Copy of a crop job with its input files read into memory (runs in a prefetch thread)."""
+    loaded = dict(job)
+    with open(job["image_path"], "rb") as file:
+        loaded["image_data"] = file.read()
+    if not isinstance(job["label_path"], tuple):
+        with open(job["label_path"], "r") as file:
+            loaded["label_data"] = file.read()
+    return loaded
+
+def crop_job(job):
+    """
+    Process one image/label pair described by a job dict from main (runs in a worker process).
+
+    Inputs are taken from "image_data" and "label_data" when read_inputs
+    prefetched them. With "write_behind" set the outputs are encoded in memory
+    and returned instead of written. With "label_store" set the labels are
+    returned for the main process to add to the store.
+
+    Returns:
+        tuple: ((crop, padding, lossless) of each target, timing record or None,
+                simplification stats or None, (path, data) tuples to write or None,
+                crop cache statistics of this job or None,
+                label text of each target or None).
+    """
+    timer = StageTimer() if job["timings"] else NO_TIMER
+    cache = open_cache(*job["cache"]) if job["cache"] is not None else None
+    cache_before = dict(cache.stats) if cache is not None else None
+    image_source = io.BytesIO(job["image_data"]) if "image_data" in job else job["image_path"]
+    label_source = io.StringIO(job["label_data"]) if "label_data" in job else job["label_path"]
+
+    targets = []
+    for target in job["targets"]:
+        if job["write_behind"]:
+            output_image, output_label = io.BytesIO(), io.StringIO()
+        else:
+            output_image, output_label = target["output_image_path"], target["output_label_path"]
+        if job["label_store"]:
+            output_label = io.StringIO()
+        targets.append(dict(target, output_image=output_image, output_label=output_label))
+
+    simplified = {}
+    fits = process_image_targets(image_source, label_source, targets, job["search"], job["draft"], job["clip"],
+                                 job["simplify"], job["precision"], job["backend"], simplified, timer,
+                                 job["fit"], job["pad_threshold"], job["lossless"], job["align_tolerance"], cache)
+
+    files = [] if job["write_behind"] else None
+    labels = [] if job["label_store"] else None
+    for target in targets:
+        label_text = None if isinstance(target["output_label"], str) else target["output_label"].getvalue()
+        if labels is not None:
+            labels.append(label_text)
+        if files is not None:
+            image_data = target["output_image"].getvalue()
+            files.append((target["output_image_path"], image_data))
+            if labels is None:
+                files.append((target["output_label_path"], label_text))
+
+        if target["debug_dir"]:
+            debug_path = os.path.join(target["debug_dir"], Path(target["output_image_path"]).stem + ".png")
+            with timer.stage("debug_image"):
+                if files is None and labels is None:
+                    generate_debug_image(target["output_image_path"], target["output_label_path"], target["debug_dir"], job["image_path"])
+                else:
+                    image_source = io.BytesIO(image_data) if files is not None else target["output_image_path"]
+                    orig_image = io.BytesIO(job["image_data"]) if "image_data" in job else job["image_path"]
+                    debug_image = render_debug_image(image_source, io.StringIO(label_text), orig_image)
+                    if files is None:
+                        debug_image.save(debug_path)
+                    else:
+                        debug_data = io.BytesIO()
+                        debug_image.save(debug_data, "PNG")
+                        files.append((debug_path, debug_data.getvalue()))
+            if timer.enabled:
+                timer.count("bytes_written", len(files[-1][1]) if files is not None else file_size(debug_path))
+
+    cache_stats = None
+    if cache is not None:
+        cache_stats = {name: value - cache_before[name] for name, value in cache.stats.items()}
+    return fits, timer.record(), simplified or None, files, cache_stats, labels
+
+def plan_job(job):
+    """Plan one image/label pair described by a job dict from main (runs in a worker process)."""
+    cache = open_cache(*job["cache"]) if job["cache"] is not None else None
+    return plan_image(job["image_path"], job["label_path"], job["width"], job["height"], job["search"], job["clip"], job["simplify"], cache)
+
+def find_pairs(input_images_dir, input_labels_dir):
+    """
+    List (image_filename, image_path, label_path, stats) for every JPEG that has a label file.
+
+    Both directories are scanned once (see dataset_index.py). If
+    input_labels_dir is a label store, label_path is a (store path, name)
+    tuple. stats holds [size, mtime_ns] of the image and, for .txt labels, of
+    the label file, in the order the manifest fingerprints them.
+    """
+    store = load_store(input_labels_dir) if is_store(input_labels_dir) else None
+    index = DatasetIndex.build(input_images_dir, None if store is not None else input_labels_dir, (".jpg", ".jpeg"))
+
+    for filename in index.duplicates:
+        print(f"Warning: {filename} has the same name as another image or label file. Skipping.")
+
+    pairs = []
+    for base_name in index.images():
+        entry = index.entries[base_name]
+        image_filename = entry["image"]
+        label_filename = f"{base_name}.txt"
+
+        image_path = index.image_path(base_name)
+        if store is not None:
+            label_path = (input_labels_dir, base_name)
+            exists = base_name in store
+            stats = [entry["image_stat"]]
+        else:
+            label_path = index.label_path(base_name)
+            exists = label_path is not None
+            stats = [entry["image_stat"], entry["label_stat"]]
+
+        if not exists:
+            print(f"Warning: Label file {label_filename} does not exist for image {image_filename}. Skipping.")
+            continue
+
+        pairs.append((image_filename, image_path, label_path, stats))
+    return pairs
+
+def cache_settings(args):
+    """Arguments of crop_cache.open_cache for jobs, or None without --crop-cache."""
+    if args.crop_cache is None:
+        return None
+    return (args.crop_cache, args.cache_entries, args.cache_quantum)
+
+def plan_settings(args):
+    """Settings that decide the crops, as recorded in plan files and the manifest."""
+    settings = {"width": args.width, "height": args.height, "clip": args.clip, "simplify": args.simplify}
+    if args.clip != "exact":
+        # Exact clipping does not use the search engine
+        settings["search"] = args.search
+    return settings
+
+def run_plan(args, pairs, workers):
+    """Decide the crop for every pair without decoding pixels and write them to args.plan."""
+    jobs = [
+        {"image": image_filename, "image_path": image_path, "label_path": label_path,
+         "width": args.width, "height": args.height, "search": args.search, "clip": args.clip,
+         "simplify": args.simplify, "cache": cache_settings(args)}
+        for image_filename, image_path, label_path, _ in pairs
+    ]
+
+    rows = {}
+    def on_result(job, row):
+        rows[job["image"]] = row
+
+    describe = lambda job: job["image"]
+    try:
+        failures = run_batch(plan_job, jobs, workers, describe=describe, on_result=on_result)
+    finally:
+        if cache_settings(args) is not None:
+            evict_cache(*cache_settings(args))
+        close_caches()
+    write_plan(args.plan, plan_settings(args), rows)
+    print(f"Plan for {len(rows)} images saved to {args.plan}")
+    print_failures(failures, describe)
+
+def write_label_stores(output_dirs, images, stored_labels, unchanged, previous_stores):
+    """
+    Write the label store of each output size, in input order.
+
+    Args:
+        output_dirs (dict): (images, labels store, debug) paths of each output size.
+        images (list): Image filenames of this run, in input order.
+        stored_labels (dict): Label text of each target, by image filename,
+                              for the images processed in this run.
+        unchanged (set): Image filenames whose labels are carried over from
+                         previous_stores.
+        previous_stores (dict): LabelStore of each output size from the last run.
+    """
+    for index, (size, (_, store_path, _)) in enumerate(output_dirs.items()):
+        writer = StoreWriter(store_path)
+        for image in images:
+            name = os.path.splitext(image)[0]
+            if image in stored_labels:
+                writer.add(name, parse_label_text(stored_labels[image][index]))
+            elif image in unchanged:
+                writer.add(name, previous_stores[size].load(name))
+        writer.close()
 
 def main():
     args = parse_args()
 
     input_images_dir = "./input/images"
-    input_labels_dir = "./input/labels"
-    output_images_dir = "./output/images"
-    output_labels_dir = "./output/labels"
-    output_debug_dir = "./output/debug"
-
-    os.makedirs(output_images_dir, exist_ok=True)
-    os.makedirs(output_labels_dir, exist_ok=True)
-    if args.debug:
-        os.makedirs(output_debug_dir, exist_ok=True)
-
-    for image_filename in os.listdir(input_images_dir):
-        if image_filename.lower().endswith(".jpg") or image_filename.lower().endswith(".jpeg"):
-            base_name = os.path.splitext(image_filename)[0]
-            label_filename = f"{base_name}.txt"
-
-            image_path = os.path.join(input_images_dir, image_filename)
-            label_path = os.path.join(input_labels_dir, label_filename)
-
-            if not os.path.exists(label_path):
-                print(f"Warning: Label file {label_filename} does not exist for image {image_filename}. Skipping.")
+    input_labels_dir = args.labels
+
+    # Output sizes, in order and without repeats. A single size keeps the
+    # ./output/{images,labels,debug} layout; several get a tree each. With
+    # --label-store, labels is a store (labels.ylbl) rather than a directory.
+    sizes = list(dict.fromkeys([(args.width, args.height)] + args.target))
+    output_dirs = {}
+    for width, height in sizes:
+        output_root = "./output" if len(sizes) == 1 else os.path.join("./output", f"{width}x{height}")
+        output_dirs[(width, height)] = (os.path.join(output_root, "images"),
+                                        os.path.join(output_root, "labels.ylbl" if args.label_store else "labels"),
+                                        os.path.join(output_root, "debug"))
+    if len(sizes) > 1 and (args.plan or args.apply):
+        print("Error: --plan and --apply work with a single output size, not with --target.")
+        sys.exit(1)
+    if args.fit != "crop" and (args.plan or args.apply):
+        print("Error: --plan and --apply only record crops, not --fit pad or hybrid.")
+        sys.exit(1)
+
+    workers = args.workers if args.workers > 0 else default_workers()
+    pairs = find_pairs(input_images_dir, input_labels_dir)
+
+    if args.plan:
+        run_plan(args, pairs, workers)
+        return
+
+    planned = None
+    if args.apply:
+        plan_header, planned = read_plan(args.apply)
+        # The plan only holds the crops; clipping and simplifying the labels
+        # still follow the command line, so all settings must agree
+        expected = {key: str(value) for key, value in plan_settings(args).items()}
+        mismatches = [f"{key}={plan_header[key]} in the plan, {value} here" if key in plan_header else f"no {key} in the plan, {value} here"
+                      for key, value in expected.items() if plan_header.get(key) != value]
+        mismatches += [f"{key}={plan_header[key]} in the plan, not used here" for key in plan_header if key not in expected]
+        if mismatches:
+            print(f"Error: {args.apply} was planned with other settings ({'; '.join(mismatches)}). Rerun --plan or match its settings.")
+            sys.exit(1)
+
+    for output_images_dir, output_labels_dir, output_debug_dir in output_dirs.values():
+        os.makedirs(output_images_dir, exist_ok=True)
+        if not args.label_store:
+            os.makedirs(output_labels_dir, exist_ok=True)
+        if args.debug:
+            os.makedirs(output_debug_dir, exist_ok=True)
+
+    # Anything that changes the output invalidates the manifest records
+    settings = dict(plan_settings(args), precision=args.precision, draft=args.draft, debug=args.debug)
+    backend = backend_from_args(args, args.quality)
+    settings["encoding"] = backend.settings()
+    if len(sizes) > 1:
+        settings["targets"] = [[width, height] for width, height in sizes]
+    if args.fit != "crop":
+        settings["fit"] = args.fit
+        if args.fit == "hybrid":
+            settings["pad_threshold"] = args.pad_threshold
+    if args.label_store:
+        settings["label_store"] = True
+    if args.crop_cache is not None and args.cache_quantum > 0:
+        # Crops then depend on which near-identical layout was searched first
+        settings["cache_quantum"] = args.cache_quantum
+    if args.lossless:
+        engine = available_engine()
+        if engine is None:
+            print("Warning: --lossless needs PyTurboJPEG or jpegtran, neither is installed. Re-encoding every image.")
+        settings["lossless"] = engine
+        settings["align_tolerance"] = args.align_tolerance
+    manifest_path = os.path.join("./output", MANIFEST_FILENAME)
+    # Loaded even with --force, which only skips the unchanged check, so
+    # that outputs of removed inputs and stale outputs are still deleted
+    records = load_manifest(manifest_path)
+
+    # Label stores of the last run, to carry over the labels of unchanged images
+    previous_stores = {}
+    if args.label_store:
+        for size, (_, output_labels_dir, _) in output_dirs.items():
+            previous_stores[size] = LabelStore(output_labels_dir) if os.path.exists(output_labels_dir) else None
+
+    jobs = []
+    seen = set()
+    unchanged = set()
+    skipped = 0
+    for image_filename, image_path, label_path, stats in pairs:
+        base_name = os.path.splitext(image_filename)[0]
+
+        crop = None
+        image_settings = settings
+        if planned is not None:
+            if image_filename not in planned:
+                print(f"Warning: {image_filename} is not in {args.apply}. Skipping.")
                 continue
+            crop = planned[image_filename]["crop"]
+            image_settings = dict(settings, crop=list(crop))
 
-            output_image_path = os.path.join(output_images_dir, image_filename)
-            output_label_path = os.path.join(output_labels_dir, label_filename)
+        input_paths = [image_path, label_path]
+        if isinstance(label_path, tuple):
+            # Labels inside a store are fingerprinted by content, not by file
+            input_paths = [image_path]
+            image_settings = dict(image_settings, labels=load_store(label_path[0]).digest(label_path[1]))
 
-            process_image(image_path, label_path, output_image_path, output_label_path, args.width, args.height)
+        seen.add(image_filename)
+        previous = records.get(image_filename)
+        current = fingerprint(input_paths, image_settings, previous, stats)
+        if not args.force and is_up_to_date(previous, current) and \
+                all(store is not None and base_name in store for store in previous_stores.values()):
+            unchanged.add(image_filename)
+            skipped += 1
+            continue
 
+        targets = []
+        outputs = []
+        for (width, height), (output_images_dir, output_labels_dir, output_debug_dir) in output_dirs.items():
+            output_image_path = os.path.join(output_images_dir, image_filename)
+            # Labels in a store are not the image's own file, so not an output
+            # to delete with it
+            output_label_path = None if args.label_store else os.path.join(output_labels_dir, base_name + ".txt")
+            outputs += [output_image_path] if args.label_store else [output_image_path, output_label_path]
             if args.debug:
-                generate_debug_image(output_image_path, output_label_path, output_debug_dir, image_path)
+                outputs.append(os.path.join(output_debug_dir, base_name + ".png"))
+            targets.append({
+                "width": width,
+                "height": height,
+                "output_image_path": output_image_path,
+                "output_label_path": output_label_path,
+                "crop": crop,
+                "debug_dir": output_debug_dir if args.debug else None,
+            })
+
+        if previous is not None:
+            # Outputs of the last run that this one will not write again, e.g.
+            # debug images after --debug is dropped, or another --target
+            remove_outputs({"outputs": [path for path in previous.get("outputs", []) if path not in outputs]})
+
+        jobs.append({
+            "image": image_filename,
+            "image_path": image_path,
+            "label_path": label_path,
+            "targets": targets,
+            "search": args.search,
+            "clip": args.clip,
+            "fit": args.fit,
+            "pad_threshold": args.pad_threshold,
+            "lossless": args.lossless,
+            "align_tolerance": args.align_tolerance,
+            "cache": cache_settings(args),
+            "simplify": args.simplify,
+            "precision": args.precision,
+            "backend": backend,
+            "draft": args.draft,
+            "timings": args.timings is not None,
+            "write_behind": args.write_behind > 0,
+            "label_store": args.label_store,
+            "record": dict(current, image=image_filename, outputs=outputs),
+        })
+
+    writer = ManifestWriter(manifest_path, records)
+
+    # Inputs that disappeared since the last run take their outputs with them
+    removed = [image for image in records if image not in seen]
+    for image in removed:
+        remove_outputs(records[image])
+        writer.remove(image)
+
+    print(f"{len(jobs)} to process, {skipped} unchanged, {len(removed)} removed.")
+
+    timing_log = TimingLog(args.timings) if args.timings else None
+    simplify_report = SimplifyReport()
+    cache_report = CacheReport()
+    prefetcher = Prefetcher(read_inputs, args.prefetch, args.io_threads) if args.prefetch > 0 else None
+    write_behind = WriteBehind(args.write_behind, args.io_threads) if args.write_behind > 0 else None
+    write_failures = []
+    fit_counts = {"cropped": 0, "padded": 0, "lossless": 0}
+    stored_labels = {}
+
+    def add_written(finished):
+        # Images only go into the manifest once their outputs are on disk
+        for (job, record), error in finished:
+            if error is None:
+                writer.add(record)
+            else:
+                write_failures.append((job, error))
+                print(f"Error writing {job['image']}: {error}")
+
+    def on_result(job, result):
+        fits, timings, simplified, files, cache_stats, labels = result
+        if len(fits) == 1:
+            crop, padding, lossless = fits[0]
+            record = dict(job["record"], crop=list(crop))
+            if padding is not None:
+                record["padding"] = list(padding)
+            if args.lossless:
+                record["lossless"] = lossless
+        else:
+            sizes = [f"{target['width']}x{target['height']}" for target in job["targets"]]
+            record = dict(job["record"], crops={size: list(crop) for size, (crop, _, _) in zip(sizes, fits)})
+            paddings = {size: list(padding) for size, (_, padding, _) in zip(sizes, fits) if padding is not None}
+            if paddings:
+                record["paddings"] = paddings
+            if args.lossless:
+                record["lossless"] = [size for size, (_, _, lossless) in zip(sizes, fits) if lossless]
+        for _, padding, lossless in fits:
+            fit_counts["cropped" if padding is None else "padded"] += 1
+            fit_counts["lossless"] += lossless
+        if files is None:
+            writer.add(record)
+        else:
+            write_behind.write(files, (job, record))
+            add_written(write_behind.finished())
+        if timing_log is not None:
+            timing_log.add(job["image"], timings)
+        if simplified is not None:
+            simplify_report.add(simplified)
+        if cache_stats is not None:
+            cache_report.add(cache_stats)
+        if labels is not None:
+            stored_labels[job["image"]] = labels
+
+    describe = lambda job: job["image"]
+    try:
+        failures = run_batch(crop_job, jobs, workers, describe=describe, on_result=on_result, prefetch=prefetcher)
+    finally:
+        if write_behind is not None:
+            add_written(write_behind.close())
+        if args.label_store:
+            write_label_stores(output_dirs, [image for image, _, _, _ in pairs if image in seen],
+                               stored_labels, unchanged, previous_stores)
+        writer.close()
+        if cache_settings(args) is not None:
+            cache_report.add({"evictions": evict_cache(*cache_settings(args))})
+        close_caches()
+        if timing_log is not None:
+            timing_log.close()
+    print_failures(failures + write_failures, describe)
+    if prefetcher is not None:
+        print(prefetcher.summary())
+    if write_behind is not None:
+        print(write_behind.summary())
+    if args.fit != "crop":
+        print(f"Fit: {fit_counts['cropped']} cropped, {fit_counts['padded']} padded.")
+    if args.lossless:
+        written = fit_counts["cropped"] + fit_counts["padded"]
+        print(f"Lossless: {fit_counts['lossless']} of {written} images cut without re-encoding, {written - fit_counts['lossless']} re-encoded.")
+    if args.simplify is not None:
+        print(simplify_report.summary())
+    if args.crop_cache is not None:
+        print(cache_report.summary())
+    if timing_log is not None:
+        print(timing_log.summary())
 
 if __name__ == "__main__":
     main()
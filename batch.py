@@ -0,0 +1,199 @@
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+def default_workers():
+    """Number of worker processes to use when the user asks for "all cores"."""
+    return os.cpu_count() or 1
+
+def _call(function, job):
+    # Runs in the worker: turn exceptions into a message so that one bad file
+    # is reported instead of tearing down the whole pool
+    try:
+        return function(job), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+
+def _run_isolated(function, jobs):
+    """
+    Run (index, job) pairs one at a time in a separate worker process,
+    yielding (index, result, error). A job whose worker dies fails alone, and
+    the next job gets a fresh process.
+    """
+    executor = None
+    try:
+        for index, job in jobs:
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=1)
+            try:
+                result, error = executor.submit(_call, function, job).result()
+            except BrokenProcessPool as e:
+                # This job killed its worker (e.g. a crash in a C library, or
+                # out of memory)
+                result, error = None, f"{type(e).__name__}: worker process died while processing this job ({e})"
+                executor.shutdown(wait=False)
+                executor = None
+            yield index, result, error
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def _imap_bounded(function, jobs, workers, max_in_flight):
+    """
+    Apply function to every job, yielding (index, result, error) as jobs finish.
+
+    With one worker the jobs run in this process. Otherwise at most
+    max_in_flight jobs are submitted to the pool at a time, so neither the
+    pending futures nor their results pile up in memory on large datasets.
+
+    If a worker process dies, the pool is broken for every job in it. Jobs
+    not yet started are resubmitted to a new pool, and the jobs that were
+    in flight are run again one at a time, so that only the job that kills
+    a worker fails.
+    """
+    if workers <= 1:
+        for index, job in enumerate(jobs):
+            result, error = _call(function, job)
+            yield index, result, error
+        return
+
+    jobs = iter(enumerate(jobs))
+    retry = deque()
+    exhausted = False
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = {}
+        while pending or retry or not exhausted:
+            broken = False
+            while len(pending) < max_in_flight:
+                if retry:
+                    item = retry.popleft()
+                else:
+                    item = next(jobs, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                try:
+                    pending[executor.submit(_call, function, item[1])] = item
+                except BrokenProcessPool:
+                    # Not started, so not to blame
+                    retry.appendleft(item)
+                    broken = True
+                    break
+
+            if not pending and not broken:
+                break
+            if not broken:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result, error = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        continue
+                    index, _ = pending.pop(future)
+                    yield index, result, error
+            if not broken:
+                continue
+
+            # Keep what finished before the pool broke; the rest are suspects
+            suspects = []
+            for future, item in sorted(pending.items(), key=lambda entry: entry[1][0]):
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    result, error = future.result()
+                    yield item[0], result, error
+                else:
+                    suspects.append(item)
+            pending = {}
+            executor.shutdown(wait=False, cancel_futures=True)
+            yield from _run_isolated(function, suspects)
+            executor = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        executor.shutdown()
+
+def run_batch(function, jobs, workers=1, max_in_flight=None, describe=str, on_result=None, progress_interval=5.0, prefetch=None):
+    """
+    Run function(job) for every job, serially or across a process pool.
+
+    Progress and throughput are printed every progress_interval seconds and
+    once at the end. Failing jobs are collected instead of stopping the run.
+
+    Args:
+        function (callable): Module-level function taking one job, so it can be
+                             sent to worker processes.
+        jobs (list): Picklable job descriptions.
+        workers (int): Number of worker processes. 1 runs everything in this process.
+        max_in_flight (int): Maximum number of submitted but unfinished jobs.
+                             Defaults to 4 per worker.
+        describe (callable): Turns a job into the name used in messages.
+        on_result (callable): Called in this process as on_result(job, result)
+                              for every successful job.
+        progress_interval (float): Seconds between progress lines.
+        prefetch (callable): Wraps the job iterator, e.g. a prefetch.Prefetcher
+                             that reads inputs ahead. function gets the jobs
+                             it yields; on_result and messages get the
+                             original jobs.
+
+    Returns:
+        list: (job, error) tuples for the failed jobs, in input order.
+    """
+    jobs = list(jobs)
+    total = len(jobs)
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+
+    failures = []
+    completed = 0
+    start = time.monotonic()
+    last_report = start
+
+    source = jobs if prefetch is None else prefetch(jobs)
+    for index, result, error in _imap_bounded(function, source, workers, max_in_flight):
+        completed += 1
+        if error is None:
+            if on_result is not None:
+                on_result(jobs[index], result)
+        else:
+            failures.append((index, jobs[index], error))
+            print(f"Error processing {describe(jobs[index])}: {error.splitlines()[0]}")
+
+        now = time.monotonic()
+        if now - last_report >= progress_interval and completed < total:
+            last_report = now
+            rate = completed / (now - start)
+            print(f"Processed {completed}/{total} ({rate:.1f}/s, {len(failures)} failed)")
+
+    elapsed = time.monotonic() - start
+    rate = completed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {completed}/{total} in {elapsed:.1f}s ({rate:.1f}/s, {len(failures)} failed)")
+
+    failures.sort(key=lambda failure: failure[0])
+    return [(job, error) for _, job, error in failures]
+
+def print_failures(failures, describe=str):
+    """Print a summary of failed jobs, as returned by run_batch."""
+    if not failures:
+        return
+    print(f"{len(failures)} failed:")
+    for job, error in failures:
+        print(f"  {describe(job)}: {error.splitlines()[0]}")
+
+def _check_job(number):
+    # Job for the self-check: number 13 kills its worker process outright
+    if number == 13:
+        os._exit(1)
+    time.sleep(0.01)
+    return number * number
+
+if __name__ == "__main__":
+    # Self-check: a worker dying fails only the job that killed it
+    jobs = list(range(40))
+    results = {}
+    failures = run_batch(_check_job, jobs, workers=4, on_result=lambda job, result: results.__setitem__(job, result))
+    failed = [job for job, _ in failures]
+    assert failed == [13], failed
+    assert results == {number: number * number for number in jobs if number != 13}, results
+    print(f"{len(results)}/{len(jobs) - 1} jobs succeeded, only job 13 failed.")
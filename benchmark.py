@@ -0,0 +1,298 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import PIL
+from PIL import Image
+from PIL import ImageDraw
+from autocrop import calculate_crop, crop_amounts, generate_debug_image, load_label, process_image, save_label
+from crop_search import SEARCH_METHODS
+from polygon_clip import CLIP_METHODS
+from overlay import render_overlay
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Benchmarks for the crop and label paths on a synthetic dataset.
+#
+#   python benchmark.py --images 50 --size 1920x1080 --polygons 20 --edge-fraction 0.5 --output bench.json
+#   python benchmark.py ... --compare bench.json --tolerance 0.25
+#
+# Polygons placed near the edges of the image lose area under every one-sided
+# crop, which forces calculate_crop past its four easy crops into the full
+# split search; --edge-fraction controls how many polygons are placed there.
+#
+# Every stage is timed separately per image and reported as latency
+# percentiles and throughput. Memory is measured in a second, untimed pass
+# with tracemalloc (Python and NumPy allocations; Pillow's pixel buffers are
+# not visible to it), plus the peak resident size of the whole process.
+
+STAGES = ("load_label", "calculate_crop", "process_image", "save_label", "render_preview", "debug_image")
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark autocrop, label I/O and the preview renderers on a synthetic dataset.")
+    parser.add_argument("--images", type=int, default=20, help="Number of synthetic images.")
+    parser.add_argument("--size", type=parse_size, default=(1280, 853), metavar="WIDTHxHEIGHT",
+                        help="Size of the synthetic images. Defaults to 1280x853.")
+    parser.add_argument("--aspect", type=float, default=None,
+                        help="Aspect ratio (width / height) of the synthetic images; overrides the height from --size.")
+    parser.add_argument("--polygons", type=int, default=10, help="Polygons per image.")
+    parser.add_argument("--vertices", type=int, default=16, help="Vertices per polygon.")
+    parser.add_argument("--edge-fraction", type=float, default=0.3,
+                        help="Fraction of polygons placed across the image edges (forces the full crop search).")
+    parser.add_argument("--target", type=parse_size, default=(300, 400), metavar="WIDTHxHEIGHT",
+                        help="Autocrop target size. Defaults to 300x400.")
+    parser.add_argument("--search", choices=SEARCH_METHODS, default="profile", help="Crop search engine to benchmark.")
+    parser.add_argument("--clip", choices=CLIP_METHODS, default="exact", help="Polygon clipping used by the crop search and labels.")
+    parser.add_argument("--precision", type=int, default=6, help="Decimal places per coordinate in the labels written.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic dataset.")
+    parser.add_argument("--dataset", type=str, default=None,
+                        help="Keep the synthetic dataset in this directory instead of a temporary one.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here instead of to stdout.")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Baseline JSON report; exit with status 1 if any stage's median latency regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative median slowdown against --compare. Defaults to 0.2 (20%%).")
+    return parser.parse_args()
+
+def synthetic_polygon(rng, width, height, vertices, near_edge):
+    """
+    A random star-shaped polygon in YOLO format.
+
+    Polygons near the edge are centred on a random edge and reach past it;
+    the others stay inside the middle of the image.
+    """
+    radius = rng.uniform(0.03, 0.15)
+    if near_edge:
+        edge = rng.randrange(4)
+        along = rng.uniform(0.1, 0.9)
+        cx, cy = [(0.0, along), (1.0, along), (along, 0.0), (along, 1.0)][edge]
+    else:
+        cx, cy = rng.uniform(0.35, 0.65), rng.uniform(0.35, 0.65)
+
+    angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(vertices))
+    points = []
+    for angle in angles:
+        r = radius * rng.uniform(0.4, 1.0)
+        # Keep the aspect of the polygon roughly square in pixels
+        points.append(min(max(cx + r * math.cos(angle) * height / max(width, height), 0.0), 1.0))
+        points.append(min(max(cy + r * math.sin(angle) * width / max(width, height), 0.0), 1.0))
+    return points
+
+def generate_dataset(directory, count, width, height, polygons, vertices, edge_fraction, seed=0):
+    """
+    Write a synthetic dataset of JPEGs and YOLO polygon labels.
+
+    Args:
+        directory (str): Directory to create images/ and labels/ in.
+        count (int): Number of images.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        polygons (int): Polygons per image.
+        vertices (int): Vertices per polygon.
+        edge_fraction (float): Fraction of polygons placed across the image edges.
+        seed (int): Random seed; the same seed gives the same dataset.
+
+    Returns:
+        list: (image_path, label_path) pairs.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    image_dir = os.path.join(directory, "images")
+    label_dir = os.path.join(directory, "labels")
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(label_dir, exist_ok=True)
+
+    # Smooth gradient plus noise compresses and decodes like a photo more than flat colour does
+    xs = np.linspace(0, 255, width)[None, :, None]
+    ys = np.linspace(0, 255, height)[:, None, None]
+
+    pairs = []
+    for i in range(count):
+        objects = [
+            (rng.randrange(3), synthetic_polygon(rng, width, height, vertices, rng.random() < edge_fraction))
+            for _ in range(polygons)
+        ]
+
+        tint = np_rng.uniform(0.3, 1.0, size=3)
+        pixels = (xs * tint + ys * tint[::-1]) / 2 + np_rng.normal(0, 12, size=(height, width, 3))
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+        draw = ImageDraw.Draw(image)
+        for class_index, points in objects:
+            pixel_points = [(x * width, y * height) for x, y in zip(points[::2], points[1::2])]
+            draw.polygon(pixel_points, fill=((80, 160, 40), (200, 60, 40), (220, 200, 40))[class_index])
+
+        image_path = os.path.join(image_dir, f"synthetic_{i:05d}.jpg")
+        label_path = os.path.join(label_dir, f"synthetic_{i:05d}.txt")
+        image.save(image_path, quality=90)
+        save_label(label_path, objects)
+        pairs.append((image_path, label_path))
+    return pairs
+
+def stage_calls(pairs, output_dir, target_width, target_height, search, clip, precision=6):
+    """
+    The benchmarked calls for every image, as (stage, callable) in STAGES order.
+    """
+    for image_path, label_path in pairs:
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        output_image = os.path.join(output_dir, "images", stem + ".jpg")
+        output_label = os.path.join(output_dir, "labels", stem + ".txt")
+        state = {}
+
+        def plan(image_path=image_path, state=state):
+            with Image.open(image_path) as image:
+                width, height = image.size
+            crop_x, crop_y, _, _ = crop_amounts(width, height, target_width, target_height)
+            return calculate_crop(width, height, crop_x * 2, crop_y * 2, [points for _, points in state["objects"]], search, clip=clip)
+
+        def preview(image_path=image_path, state=state):
+            with Image.open(image_path) as image:
+                render_overlay(image, state["objects"])
+
+        yield [
+            ("load_label", lambda label_path=label_path, state=state: state.update(objects=load_label(label_path))),
+            ("calculate_crop", plan),
+            ("process_image", lambda a=image_path, b=label_path, c=output_image, d=output_label:
+                process_image(a, b, c, d, target_width, target_height, search, clip=clip, precision=precision)),
+            ("save_label", lambda path=output_label + ".copy", state=state: save_label(path, state["objects"], precision)),
+            ("render_preview", preview),
+            ("debug_image", lambda a=output_image, b=output_label, c=image_path:
+                generate_debug_image(a, b, os.path.join(output_dir, "debug"), c)),
+        ]
+
+def summarize(latencies):
+    """Latency percentiles (ms) and throughput for one stage."""
+    seconds = np.array(latencies)
+    total = float(seconds.sum())
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99]) * 1000
+    return {
+        "count": len(latencies),
+        "total_s": round(total, 6),
+        "throughput_per_s": round(len(latencies) / total, 3) if total > 0 else None,
+        "mean_ms": round(float(seconds.mean()) * 1000, 3),
+        "p50_ms": round(float(p50), 3),
+        "p90_ms": round(float(p90), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(seconds.max()) * 1000, 3),
+    }
+
+def run_benchmark(pairs, output_dir, target_width, target_height, search, clip, precision=6):
+    """
+    Time every stage on every image, then measure its memory in a second pass.
+
+    Returns:
+        dict: Stage name -> summary.
+    """
+    for subdirectory in ("images", "labels", "debug"):
+        os.makedirs(os.path.join(output_dir, subdirectory), exist_ok=True)
+
+    latencies = {stage: [] for stage in STAGES}
+    for calls in stage_calls(pairs, output_dir, target_width, target_height, search, clip, precision):
+        for stage, call in calls:
+            start = time.perf_counter()
+            call()
+            latencies[stage].append(time.perf_counter() - start)
+    stages = {stage: summarize(latencies[stage]) for stage in STAGES}
+
+    # tracemalloc slows allocation down, so memory gets its own pass
+    peaks = {stage: 0 for stage in STAGES}
+    tracemalloc.start()
+    for calls in stage_calls(pairs, output_dir, target_width, target_height, search, clip, precision):
+        for stage, call in calls:
+            tracemalloc.reset_peak()
+            call()
+            peaks[stage] = max(peaks[stage], tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    for stage in STAGES:
+        stages[stage]["peak_python_mb"] = round(peaks[stage] / 2**20, 3)
+    return stages
+
+def peak_rss_mb():
+    """Peak resident size of this process in MB, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def compare(report, baseline, tolerance):
+    """
+    Compare median latencies with a baseline report.
+
+    Returns:
+        list: (stage, baseline p50, current p50) for every stage that is more
+              than tolerance slower than the baseline.
+    """
+    regressions = []
+    for stage, summary in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        if summary["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append((stage, previous["p50_ms"], summary["p50_ms"]))
+    return regressions
+
+def main():
+    args = parse_args()
+    width, height = args.size
+    if args.aspect is not None:
+        height = round(width / args.aspect)
+    target_width, target_height = args.target
+
+    directory = args.dataset or tempfile.mkdtemp(prefix="autocrop_benchmark_")
+    try:
+        pairs = generate_dataset(directory, args.images, width, height, args.polygons, args.vertices, args.edge_fraction, args.seed)
+        stages = run_benchmark(pairs, os.path.join(directory, "output"), target_width, target_height, args.search, args.clip, args.precision)
+    finally:
+        if args.dataset is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "settings": {
+            "images": args.images, "width": width, "height": height, "polygons": args.polygons,
+            "vertices": args.vertices, "edge_fraction": args.edge_fraction,
+            "target_width": target_width, "target_height": target_height,
+            "search": args.search, "clip": args.clip, "precision": args.precision, "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(), "pillow": PIL.__version__, "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        if baseline.get("settings") != report["settings"]:
+            print(f"Warning: {args.compare} was made with different settings.", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, before, after in regressions:
+            print(f"Regression in {stage}: median {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
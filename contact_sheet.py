@@ -0,0 +1,159 @@
+import os
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFont
+
+# Contact sheets pack many small previews into a few paged grid images, so a
+# reviewer can page through a dataset without opening one full-size PNG per
+# image. Each tile is a thumbnail centred in a square cell with the image
+# filename captioned below it. Next to the sheets an index is written:
+#
+#   # columns=8 rows=8 tile=256
+#   image        sheet            row  column
+#   apples.jpg   sheet_0000.jpg   0    0
+#
+# Tiles are placed by the position of the image in the input list, not by the
+# order the thumbnails arrive in, so sheets are identical for any number of
+# workers. A sheet is written as soon as all of its tiles are in.
+
+INDEX_FILENAME = "index.tsv"
+INDEX_COLUMNS = ("image", "sheet", "row", "column")
+
+CAPTION_HEIGHT = 14
+BACKGROUND = (32, 32, 32)
+CAPTION_COLOR = (255, 255, 255)
+
+def parse_grid(text):
+    """Parse a grid size such as "8x8" into (columns, rows)."""
+    columns, _, rows = text.lower().partition("x")
+    columns, rows = int(columns), int(rows or columns)
+    if columns < 1 or rows < 1:
+        raise ValueError(f"invalid grid size: {text}")
+    return columns, rows
+
+def fit_caption(draw, text, font, width):
+    """Shorten text with a trailing ellipsis until it fits in width pixels."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "...", font=font) > width:
+        text = text[:-1]
+    return text + "..."
+
+class ContactSheetWriter:
+    """
+    Collects thumbnails into paged grid images and writes the index.
+
+    Args:
+        output_dir (str): Directory the sheets and index are written to.
+        total (int): Number of tiles that will be added.
+        columns (int): Tiles per row.
+        rows (int): Rows per sheet.
+        tile_size (int): Width and height of the thumbnail cell in pixels.
+        extension (str): Sheet file extension, which selects the format.
+        quality (int): JPEG quality, ignored for other formats.
+    """
+
+    def __init__(self, output_dir, total, columns=8, rows=8, tile_size=256, extension=".jpg", quality=85):
+        self.output_dir = output_dir
+        self.total = total
+        self.columns = columns
+        self.rows = rows
+        self.tile_size = tile_size
+        self.extension = extension
+        self.quality = quality
+        self.per_sheet = columns * rows
+        self.font = ImageFont.load_default()
+        self.sheets = {}  # sheet number -> [image, tiles added]
+        self.index = {}  # tile position -> (image name, sheet filename, row, column)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def sheet_filename(self, sheet):
+        return f"sheet_{sheet:04d}{self.extension}"
+
+    def sheet_tiles(self, sheet):
+        """Number of tiles on a sheet; only the last one can be partly filled."""
+        return min(self.per_sheet, self.total - sheet * self.per_sheet)
+
+    def add(self, position, name, thumbnail):
+        """
+        Place a thumbnail on its sheet.
+
+        Args:
+            position (int): Position of the image in the input list.
+            name (str): Caption and index name, usually the image filename.
+            thumbnail (PIL.Image): Thumbnail no larger than tile_size in either dimension.
+        """
+        sheet, slot = divmod(position, self.per_sheet)
+        row, column = divmod(slot, self.columns)
+        page = self.page(sheet)
+
+        # Centre the thumbnail in its cell and caption it below
+        left = column * self.tile_size
+        top = row * (self.tile_size + CAPTION_HEIGHT)
+        page[0].paste(thumbnail.convert("RGB"), (
+            left + (self.tile_size - thumbnail.width) // 2,
+            top + (self.tile_size - thumbnail.height) // 2,
+        ))
+        draw = ImageDraw.Draw(page[0])
+        caption = fit_caption(draw, name, self.font, self.tile_size - 4)
+        draw.text((left + 2, top + self.tile_size + 1), caption, fill=CAPTION_COLOR, font=self.font)
+
+        self.index[position] = (name, self.sheet_filename(sheet), row, column)
+        self.count(sheet)
+
+    def skip(self, position):
+        """Leave a tile empty (e.g. its image failed) so its sheet still completes."""
+        sheet = position // self.per_sheet
+        self.page(sheet)
+        self.count(sheet)
+
+    def page(self, sheet):
+        """Sheet image and tile count, created blank on first use."""
+        if sheet not in self.sheets:
+            rows = -(-self.sheet_tiles(sheet) // self.columns)
+            size = (self.columns * self.tile_size, rows * (self.tile_size + CAPTION_HEIGHT))
+            self.sheets[sheet] = [Image.new("RGB", size, BACKGROUND), 0]
+        return self.sheets[sheet]
+
+    def count(self, sheet):
+        page = self.sheets[sheet]
+        page[1] += 1
+        if page[1] == self.sheet_tiles(sheet):
+            self.flush(sheet)
+
+    def flush(self, sheet):
+        image, _ = self.sheets.pop(sheet)
+        path = os.path.join(self.output_dir, self.sheet_filename(sheet))
+        if self.extension.lower() in (".jpg", ".jpeg"):
+            image.save(path, quality=self.quality)
+        else:
+            image.save(path)
+
+    def close(self):
+        """Write any incomplete sheets and the index."""
+        for sheet in sorted(self.sheets):
+            self.flush(sheet)
+
+        settings = {"columns": self.columns, "rows": self.rows, "tile": self.tile_size}
+        with open(os.path.join(self.output_dir, INDEX_FILENAME), "w") as file:
+            file.write("# " + " ".join(f"{key}={value}" for key, value in settings.items()) + "\n")
+            file.write("\t".join(INDEX_COLUMNS) + "\n")
+            for position in sorted(self.index):
+                file.write("\t".join(map(str, self.index[position])) + "\n")
+
+def read_index(path):
+    """
+    Read a contact sheet index.
+
+    Returns:
+        dict: Image name -> (sheet filename, row, column).
+    """
+    entries = {}
+    with open(path, "r") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#") or line.startswith(INDEX_COLUMNS[0] + "\t"):
+                continue
+            image, sheet, row, column = line.split("\t")
+            entries[image] = (sheet, int(row), int(column))
+    return entries
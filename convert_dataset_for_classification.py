@@ -1,15 +1,42 @@
 from PIL import Image, ImageDraw
+import argparse
+import numpy as np
 import shutil
 import sys
 import os
+import tempfile
+import label_transforms as transforms
+from batch import default_workers, print_failures, run_batch
+from dataset_index import open_index
+from label_store import parse_label_text
 
 image_dir="./images"
 label_dir="./labels"
+output_dir="./classification"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert an object detection dataset to a classification dataset.")
+    parser.add_argument("--images", default=image_dir, help=f"Input image directory. Defaults to {image_dir}.")
+    parser.add_argument("--labels", default=label_dir, help=f"Input label directory. Defaults to {label_dir}.")
+    parser.add_argument("--output", default=output_dir,
+                        help=f"Output directory, one subdirectory per class. Defaults to {output_dir}.")
+    parser.add_argument("--padding", type=int, default=10, help="Pixels added around each object's bounding box.")
+    parser.add_argument("--no-square", dest="square", action="store_false",
+                        help="Keep the crops rectangular instead of padding them to squares with black bars.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    parser.add_argument("--index", metavar="INDEX_FILE",
+                        help="Reuse the dataset index in INDEX_FILE while the directories are unchanged, and save it there.")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check that crops keep their position in the label file as the object index when earlier objects are skipped.")
+    return parser.parse_args()
 
 def yolo_to_pixel_coordinates(polygon_coords, image_width, image_height):
     """
     Converts YOLO normalized coordinates to pixel coordinates.
-    
+
     Args:
         polygon_coords (list): List of (x, y) normalized coordinates.
         image_width (int): Width of the image in pixels.
@@ -18,31 +45,28 @@ def yolo_to_pixel_coordinates(polygon_coords, image_width, image_height):
     Returns:
         list: List of (x, y) pixel coordinates.
     """
-    return [
-        (int(x * image_width), int(y * image_height))
-        for x, y in polygon_coords
-    ]
+    coords = np.array(polygon_coords, dtype=np.float64).reshape(-1, 2)
+    pixel_coords = transforms.denormalize(image_width, image_height)(coords).astype(int)
+    return [tuple(point) for point in pixel_coords.tolist()]
 
-def crop_polygon(image_filename, yolo_coords):
+def crop_object(image, points, padding=0, square=False):
     """
-    Crops an image around a polygon defined by YOLO coordinates.
-    
+    Crops an already decoded image around one polygon.
+
     Args:
-        image_filename (str): Path to the image file.
-        yolo_coords (str): YOLO polygon coordinates as a string.
-    
+        image (PIL.Image): Decoded RGB image. It is not modified.
+        points (list): Flat list of normalized x, y coordinates.
+        padding (int): Pixels added around the polygon's bounding box.
+        square (bool): Pad the crop to a square with black bars.
+
     Returns:
-        PIL.Image: Cropped image.
+        PIL.Image: Cropped image, or None if the padded bounding box has no
+                   area inside the image (e.g. a polygon wholly outside it).
     """
-    # Load the image
-    image = Image.open(image_filename).convert("RGB")
     image_width, image_height = image.size
 
-    # Parse YOLO coordinates
-    coords = yolo_coords.split()
-    polygon_coords = [(float(coords[i]), float(coords[i + 1])) for i in range(1, len(coords), 2)]
-
     # Convert to pixel coordinates
+    polygon_coords = list(zip(points[::2], points[1::2]))
     pixel_coords = yolo_to_pixel_coordinates(polygon_coords, image_width, image_height)
 
     # Determine the bounding box of the polygon
@@ -50,109 +74,172 @@ def crop_polygon(image_filename, yolo_coords):
     bbox = (min(x_coords), min(y_coords), max(x_coords), max(y_coords))
 
     # Expand the bounding box slightly (optional, for padding)
-    padding = 0  # Adjust padding as needed
     bbox = (
         max(bbox[0] - padding, 0),
         max(bbox[1] - padding, 0),
         min(bbox[2] + padding, image_width),
         min(bbox[3] + padding, image_height)
     )
+    if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        return None
 
     # Crop the image to the bounding box
     cropped_image = image.crop(bbox)
 
+    # Make the image square by adding black padding
+    cropped_width, cropped_height = cropped_image.size
+    if square and cropped_width != cropped_height:
+        square_size = max(cropped_width, cropped_height)
+        square_image = Image.new("RGB", (square_size, square_size), (0, 0, 0))
+        paste_x = (square_size - cropped_width) // 2
+        paste_y = (square_size - cropped_height) // 2
+        square_image.paste(cropped_image, (paste_x, paste_y))
+        return square_image
+
     return cropped_image
 
-# TODO not sure if I need to add padding?
-def crop_polygon_with_padding(image_filename, yolo_coords):
+def crop_polygon(image_filename, yolo_coords):
     """
     Crops an image around a polygon defined by YOLO coordinates.
-    
+
     Args:
         image_filename (str): Path to the image file.
         yolo_coords (str): YOLO polygon coordinates as a string.
-    
+
     Returns:
-        PIL.Image: Cropped image.
+        PIL.Image: Cropped image, or None if the polygon is outside the image (see crop_object).
     """
     # Load the image
     image = Image.open(image_filename).convert("RGB")
-    image_width, image_height = image.size
-
-    # Parse YOLO coordinates
-    coords = yolo_coords.split()
-    polygon_coords = [(float(coords[i]), float(coords[i + 1])) for i in range(1, len(coords), 2)]
-
-    # Convert to pixel coordinates
-    pixel_coords = yolo_to_pixel_coordinates(polygon_coords, image_width, image_height)
-
-    # Determine the bounding box of the polygon
-    x_coords, y_coords = zip(*pixel_coords)
-    bbox = (min(x_coords), min(y_coords), max(x_coords), max(y_coords))
+    return crop_object(image, list(map(float, yolo_coords.split()[1:])))
 
-    # Expand the bounding box slightly (optional, for padding)
-    padding = 10  # Adjust padding as needed
-    bbox = (
-        max(bbox[0] - padding, 0),
-        max(bbox[1] - padding, 0),
-        min(bbox[2] + padding, image_width),
-        min(bbox[3] + padding, image_height)
-    )
+def crop_polygon_with_padding(image_filename, yolo_coords):
+    """
+    Crops an image around a polygon defined by YOLO coordinates, with 10 pixels
+    of padding, and pads the result to a square.
 
-    # Crop the image to the bounding box
-    cropped_image = image.crop(bbox)
+    Args:
+        image_filename (str): Path to the image file.
+        yolo_coords (str): YOLO polygon coordinates as a string.
 
-    # Make the image square by adding black padding
-    cropped_width, cropped_height = cropped_image.size
-    if cropped_width != cropped_height:
-        square_size = max(cropped_width, cropped_height)
-        square_image = Image.new("RGB", (square_size, square_size), (0, 0, 0))
-        paste_x = (square_size - cropped_width) // 2
-        paste_y = (square_size - cropped_height) // 2
-        square_image.paste(cropped_image, (paste_x, paste_y))
-        return square_image
+    Returns:
+        PIL.Image: Cropped image, or None if the polygon is outside the image (see crop_object).
+    """
+    # Load the image
+    image = Image.open(image_filename).convert("RGB")
+    return crop_object(image, list(map(float, yolo_coords.split()[1:])), padding=10, square=True)
 
-    return cropped_image
+def extract_job(job):
+    """
+    Extract every labelled object of one image (runs in a worker process).
 
-def organize_images():
-    # Define the directory where images without a class will go
-    no_class_dir = os.path.join(image_dir, "no_class")
-    os.makedirs(no_class_dir, exist_ok=True)
+    The image is decoded once and every object is cropped from that decoded
+    copy. The source image and label files are only read.
 
-    # List all files in the images directory
-    for image_file in os.listdir(image_dir):
-        image_path = os.path.join(image_dir, image_file)
+    Objects without a point, or whose box has no area inside the image, are
+    skipped; the other crops are named by their object's position in the
+    label file, counting the skipped ones.
 
-        # Skip if not a file
-        if not os.path.isfile(image_path):
+    Returns:
+        tuple: (number of crops written, indices of the skipped objects).
+    """
+    with open(job["label_path"], "r") as lf:
+        objects = parse_label_text(lf.read())
+
+    stem, extension = os.path.splitext(os.path.basename(job["image_path"]))
+    if not any(len(points) >= 2 for _, points in objects):
+        # Nothing to crop; keep the whole image as an example without a class
+        shutil.copy2(job["image_path"], os.path.join(job["output_dir"], "no_class", stem + extension))
+        return 0, []
+
+    with Image.open(job["image_path"]) as source:
+        image = source.convert("RGB")
+
+    skipped = []
+    for index, (class_id, points) in enumerate(objects):
+        cropped_image = crop_object(image, points, job["padding"], job["square"]) if len(points) >= 2 else None
+        if cropped_image is None:
+            skipped.append(index)
             continue
+        target_dir = os.path.join(job["output_dir"], str(class_id))
+        os.makedirs(target_dir, exist_ok=True)
+        cropped_image.save(os.path.join(target_dir, f"{stem}_{index}{extension}"))
+    return len(objects) - len(skipped), skipped
 
-        # Build the corresponding label file path
-        label_file = os.path.splitext(image_file)[0] + ".txt"
-        label_path = os.path.join(label_dir, label_file)
-
-        # Default target directory for images with no class
-        target_dir = no_class_dir
+def check_object_indices():
+    """
+    Check that crops are named by the object's line in the label file when an
+    object before them is skipped.
 
-        # Check if the label file exists
-        if os.path.exists(label_path):
-            # Read the first character (class integer) from the label file
-            with open(label_path, "r") as lf:
-                first_line = lf.readline().strip()
-                class_id = first_line.split(" ")[0]  # Take the first "word"
-                
-                # Ensure the class_id is an integer
-                if class_id.isdigit():
-                    target_dir = os.path.join(image_dir, class_id)
-                    os.makedirs(target_dir, exist_ok=True)
+    Returns:
+        bool: True if the crops got the expected names.
+    """
+    directory = tempfile.mkdtemp(prefix="classification_check_")
+    try:
+        image_path = os.path.join(directory, "image.png")
+        label_path = os.path.join(directory, "image.txt")
+        Image.new("RGB", (100, 100), (255, 255, 255)).save(image_path)
+        with open(label_path, "w") as lf:
+            # A line without points, one outside the image, then two valid objects
+            lf.write("0\n1 1.5 1.5 1.8 1.5 1.8 1.8\n2 0.1 0.1 0.5 0.1 0.5 0.5\n3 0.6 0.6 0.9 0.6 0.9 0.9\n")
+        os.makedirs(os.path.join(directory, "output", "no_class"))
+        job = {"image_path": image_path, "label_path": label_path, "output_dir": os.path.join(directory, "output"),
+               "padding": 10, "square": True}
+        count, skipped = extract_job(job)
+        written = sorted(os.path.join(class_id, name) for class_id in os.listdir(job["output_dir"])
+                         for name in os.listdir(os.path.join(job["output_dir"], class_id)))
+        expected = [os.path.join("2", "image_2.png"), os.path.join("3", "image_3.png")]
+        ok = count == 2 and skipped == [0, 1] and written == expected
+        print(f"Crops written: {', '.join(written)}; skipped objects: {skipped}. {'OK' if ok else 'Expected ' + ', '.join(expected)}")
+        return ok
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
 
-                    dst = os.path.join(target_dir, image_file)
-                    shutil.move(image_path, dst)
+def organize_images():
+    args = parse_args()
+    if args.check:
+        sys.exit(0 if check_object_indices() else 1)
 
-                    cropped_image = crop_polygon_with_padding(dst, first_line)
-                    cropped_image.save(dst)
+    # Define the directory where images without a class will go
+    no_class_dir = os.path.join(args.output, "no_class")
+    os.makedirs(no_class_dir, exist_ok=True)
 
-    print("Image organization complete.")
+    # Images and their label files, from one scan of each directory (or a
+    # saved index that is still current)
+    index = open_index(args.images, args.labels, args.index, IMAGE_EXTENSIONS)
+    missing = len(index.orphan_images())
+
+    jobs = []
+    for stem in index.pairs():
+        jobs.append({
+            "image_path": index.image_path(stem),
+            "label_path": index.label_path(stem),
+            "output_dir": args.output,
+            "padding": args.padding,
+            "square": args.square,
+        })
+
+    if missing:
+        print(f"Warning: {missing} images have no label file. Skipping them.")
+
+    crops = 0
+    skipped = 0
+    describe = lambda job: os.path.basename(job["image_path"])
+    def on_result(job, result):
+        nonlocal crops, skipped
+        count, skipped_objects = result
+        crops += count
+        skipped += len(skipped_objects)
+        if skipped_objects:
+            print(f"Warning: {describe(job)}: objects {', '.join(map(str, skipped_objects))} have no points or lie outside the image. Skipping them.")
+
+    workers = args.workers if args.workers > 0 else default_workers()
+    failures = run_batch(extract_job, jobs, workers, describe=describe, on_result=on_result)
+    print_failures(failures, describe)
+
+    print(f"Image organization complete. {crops} objects saved to {args.output}")
+    if skipped:
+        print(f"{skipped} objects without points or outside their image were skipped.")
 
 if __name__ == "__main__":
-    organize_images()
\ No newline at end of file
+    organize_images()
@@ -1,33 +1,26 @@
-from PIL import Image
-import os
+import argparse
+from batch import default_workers, print_failures
+from pipeline import Greyscale, describe_job, greyscale, greyscale_reference, run_pipeline  # noqa: F401 (re-exported)
 
-# Input and output directories
-input_dir = "./images"
-output_dir = "./greyscale"
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert RGB images to greyscale, keeping them as 3-channel RGB.")
+    parser.add_argument("input_dir", type=str, nargs="?", default="./images", help="Input directory. Defaults to ./images.")
+    parser.add_argument("output_dir", type=str, nargs="?", default="./greyscale", help="Output directory. Defaults to ./greyscale.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    parser.add_argument("--verify", action="store_true",
+                        help="Also run the per-pixel reference conversion and fail if any output differs.")
+    return parser.parse_args()
 
-# Create the output directory if it doesn't exist
-os.makedirs(output_dir, exist_ok=True)
+def main():
+    args = parse_args()
 
-# Process all image files in the input directory
-for filename in os.listdir(input_dir):
-    if filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff")):
-        input_path = os.path.join(input_dir, filename)
-        output_path = os.path.join(output_dir, filename)
+    # A one-stage pipeline over images without labels (see pipeline.py)
+    workers = args.workers if args.workers > 0 else default_workers()
+    failures = run_pipeline(args.input_dir, None, args.output_dir, None, [Greyscale(args.verify)], workers)
+    print_failures(failures, describe_job)
 
-        # Open the image
-        with Image.open(input_path) as img:
-            # Ensure the image is in RGB mode
-            img = img.convert("RGB")
+    print(f"Processed images saved to {args.output_dir}")
 
-            # Extract the greyscale intensity
-            pixels = img.load()
-            for y in range(img.height):
-                for x in range(img.width):
-                    r, g, b = pixels[x, y]
-                    gray = int(0.299 * r + 0.587 * g + 0.114 * b)  # Standard greyscale formula
-                    pixels[x, y] = (gray, gray, gray)  # Set RGB channels to the same value
-
-            # Save the result
-            img.save(output_path)
-
-print(f"Processed images saved to {output_dir}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
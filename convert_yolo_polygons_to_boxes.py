@@ -1,53 +1,67 @@
 import os
 import argparse
+import numpy as np
+import label_transforms as transforms
+from batch import print_failures
+from label_store import LabelStore, is_store, write_arrays
+from label_transforms import objects_to_bboxes  # noqa: F401 (re-exported)
+from pipeline import BoundingBoxes, describe_job, run_pipeline
 
 # Function to calculate bounding box from polygon coordinates
 def polygon_to_bbox(polygon):
-    # Extract x and y coordinates from the polygon
-    x_coords = polygon[0::2]
-    y_coords = polygon[1::2]
-
-    # Calculate min and max for x and y
-    x_min = min(x_coords)
-    x_max = max(x_coords)
-    y_min = min(y_coords)
-    y_max = max(y_coords)
-
-    # Calculate center_x, center_y, width, and height
-    center_x = (x_min + x_max) / 2
-    center_y = (y_min + y_max) / 2
-    width = x_max - x_min
-    height = y_max - y_min
-
+    _, vertex_offsets, coords = transforms.pack([(0, polygon)])
+    center_x, center_y, width, height = transforms.bboxes(vertex_offsets, coords)[0].tolist()
     return center_x, center_y, width, height
 
-# Main function to process files
-def convert_yolo_polygon_to_bbox(input_dir, output_dir):
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def write_bboxes(output_file_path, bboxes):
+    with open(output_file_path, "w") as outfile:
+        for class_id, (center_x, center_y, width, height) in bboxes:
+            # Write to the new file in YOLO format
+            outfile.write(f"{class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
+
+def convert_store(input_store, output_dir):
+    store = LabelStore(input_store)
 
-    for filename in os.listdir(input_dir):
-        if filename.endswith(".txt"):
-            input_file_path = os.path.join(input_dir, filename)
-            output_file_path = os.path.join(output_dir, filename)
+    # Bounding boxes for every object in the store at once
+    bboxes = transforms.bboxes(store.vertex_offsets, store.coords)
 
-            with open(input_file_path, "r") as infile, open(output_file_path, "w") as outfile:
-                for line in infile:
-                    parts = line.strip().split()
-                    class_id = parts[0]
-                    polygon = list(map(float, parts[1:]))
+    # Objects without coordinates have no box; drop them and move each
+    # file's offsets back by the number dropped before it
+    keep = ~np.isnan(bboxes[:, 0])
+    bboxes = bboxes[keep]
+    class_ids = np.asarray(store.class_ids)[keep]
+    file_offsets = np.concatenate(([0], np.cumsum(keep)))[np.asarray(store.file_offsets)]
 
-                    # Convert polygon to bounding box
-                    center_x, center_y, width, height = polygon_to_bbox(polygon)
+    if is_store(output_dir):
+        # Each box is stored as two (x, y) pairs: center, then width/height
+        vertex_offsets = np.arange(0, 2 * len(bboxes) + 1, 2)
+        write_arrays(output_dir, store.names, file_offsets, class_ids, vertex_offsets, bboxes.reshape(-1, 2))
+        return
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    class_ids = class_ids.tolist()
+    bboxes = bboxes.tolist()
+    for i, name in enumerate(store.names):
+        first, last = file_offsets[i], file_offsets[i + 1]
+        write_bboxes(os.path.join(output_dir, name + ".txt"), zip(class_ids[first:last], bboxes[first:last]))
+
+# Main function to process files
+def convert_yolo_polygon_to_bbox(input_dir, output_dir):
+    if is_store(input_dir):
+        # A store is converted in one vectorized pass over all of its objects
+        convert_store(input_dir, output_dir)
+        return
 
-                    # Write to the new file in YOLO format
-                    outfile.write(f"{class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
+    # A one-stage pipeline over labels without images (see pipeline.py)
+    failures = run_pipeline(None, input_dir, None, output_dir, [BoundingBoxes()], precision=6)
+    print_failures(failures, describe_job)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert YOLO polygon annotations to bounding box format.")
-    parser.add_argument("input_dir", type=str, help="Path to the input directory containing YOLO polygon files.")
-    parser.add_argument("output_dir", type=str, help="Path to the output directory to save bounding box files.")
+    parser.add_argument("input_dir", type=str, help="Path to the input directory containing YOLO polygon files, or a label store (.ylbl).")
+    parser.add_argument("output_dir", type=str, help="Path to the output directory to save bounding box files, or a label store (.ylbl).")
 
     args = parser.parse_args()
 
-    convert_yolo_polygon_to_bbox(args.input_dir, args.output_dir)
\ No newline at end of file
+    convert_yolo_polygon_to_bbox(args.input_dir, args.output_dir)
@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Cache of crop decisions, keyed by everything calculate_crop looks at: the
+# image size, the amount to crop, the search engine and clip method, and the
+# polygon geometry. Fixed-mount cameras produce many images with the same
+# size and the same (often copied) labels, and repeated runs with changed
+# output settings search the same crops again; both become lookups.
+#
+# Lookups go to an in-process LRU first and then to an optional SQLite file,
+# which every worker process opens on its own, so runs and workers share it:
+#
+#   CREATE TABLE crops (key TEXT PRIMARY KEY, crop TEXT, used REAL)
+#
+# "used" is the time of the last lookup or insert. Once the file holds more
+# than max_entries crops the least recently used ones are deleted.
+#
+# By default keys hash the exact coordinates, so a hit returns exactly what
+# the search would. With a quantum, coordinates are rounded to that many
+# pixels first and polygon order is ignored, so near-identical layouts share
+# a crop; it is then the crop of whichever layout was searched first.
+
+# Bump when calculate_crop can return something else for the same input
+KEY_VERSION = 1
+
+# Deletions are checked for every this many inserts
+EVICT_INTERVAL = 256
+
+def geometry_key(width, height, crop_x, crop_y, polygons, search, clip, quantum=0.0):
+    """
+    Cache key of a calculate_crop call.
+
+    Args:
+        width, height (int): Image size.
+        crop_x, crop_y (int): Total amount to crop along each axis.
+        polygons (list): Polygons in YOLO format.
+        search, clip (str): calculate_crop's search engine and clip method.
+                            The engine is left out with exact clipping.
+        quantum (float): Pixels to round coordinates to, or 0 for exact keys.
+
+    Returns:
+        str: Hex digest.
+    """
+    if clip == "exact":
+        # Exact clipping does not use the search engine
+        search = ""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{KEY_VERSION}|{width}|{height}|{crop_x}|{crop_y}|{search}|{clip}|{quantum}".encode())
+    parts = []
+    for points in polygons:
+        values = np.asarray(points, dtype=np.float64)
+        if quantum > 0:
+            pairs = values[:len(values) // 2 * 2].reshape(-1, 2) * (width, height)
+            values = np.round(pairs / quantum).astype(np.int64)
+        parts.append(values.tobytes())
+    if quantum > 0:
+        parts.sort()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class CropCache:
+    """
+    Crop decisions in an LRU in memory, backed by an optional SQLite file.
+
+    Args:
+        path (str): SQLite file shared across runs and processes, or None
+                    for an in-memory cache only.
+        max_entries (int): Crops kept in the file.
+        memory_entries (int): Crops kept in memory.
+        quantum (float): See geometry_key.
+    """
+
+    def __init__(self, path=None, max_entries=1000000, memory_entries=4096, quantum=0.0):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.memory_entries = max(1, memory_entries)
+        self.quantum = quantum
+        self.memory = OrderedDict()
+        self.connection = None
+        self.inserts = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _database(self):
+        if self.connection is None and self.path is not None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; WAL lets processes read while one of them writes
+            self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS crops (key TEXT PRIMARY KEY, crop TEXT, used REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS crops_used ON crops (used)")
+        return self.connection
+
+    def key(self, width, height, crop_x, crop_y, polygons, search, clip):
+        return geometry_key(width, height, crop_x, crop_y, polygons, search, clip, self.quantum)
+
+    def _remember(self, key, crop):
+        self.memory[key] = crop
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """The cached (left, right, top, bottom) crop for key, or None."""
+        crop = self.memory.get(key)
+        if crop is not None:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return crop
+
+        database = self._database()
+        if database is not None:
+            row = database.execute("SELECT crop FROM crops WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                crop = tuple(int(value) for value in row[0].split(","))
+                database.execute("UPDATE crops SET used = ? WHERE key = ?", (time.time(), key))
+                self._remember(key, crop)
+                self.stats["disk_hits"] += 1
+                return crop
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, crop):
+        crop = tuple(int(value) for value in crop)
+        self._remember(key, crop)
+        database = self._database()
+        if database is None:
+            return
+        database.execute("INSERT OR REPLACE INTO crops (key, crop, used) VALUES (?, ?, ?)",
+                         (key, ",".join(map(str, crop)), time.time()))
+        self.inserts += 1
+        if self.inserts % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used crops beyond max_entries from the file; returns how many."""
+        database = self._database()
+        if database is None:
+            return 0
+        count = database.execute("SELECT COUNT(*) FROM crops").fetchone()[0]
+        if count <= self.max_entries:
+            return 0
+        database.execute("DELETE FROM crops WHERE key IN (SELECT key FROM crops ORDER BY used LIMIT ?)",
+                         (count - self.max_entries,))
+        self.stats["evictions"] += count - self.max_entries
+        return count - self.max_entries
+
+    def close(self):
+        if self.connection is not None:
+            self.evict()
+            self.connection.close()
+            self.connection = None
+
+# One cache per process and settings, so that a worker process keeps its
+# memory LRU and database connection from one job to the next
+_open_caches = {}
+
+def open_cache(path, max_entries=1000000, quantum=0.0):
+    """The CropCache of this process for these settings, created on first use."""
+    settings = (path, max_entries, quantum)
+    if settings not in _open_caches:
+        _open_caches[settings] = CropCache(path, max_entries, quantum=quantum)
+    return _open_caches[settings]
+
+def evict_cache(path, max_entries=1000000, quantum=0.0):
+    """
+    Bring a cache file back within max_entries at the end of a run.
+
+    Worker processes only evict every EVICT_INTERVAL inserts and are not
+    closed by the main process, so this is called there once the workers
+    are done.
+
+    Returns:
+        int: Number of crops deleted.
+    """
+    return open_cache(path, max_entries, quantum).evict()
+
+def close_caches():
+    """Close the caches this process opened, evicting beyond their size bound."""
+    for cache in _open_caches.values():
+        cache.close()
+    _open_caches.clear()
+
+class CacheReport:
+    """Adds up the per-image cache statistics of a run."""
+
+    def __init__(self):
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def add(self, stats):
+        for name, value in stats.items():
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def summary(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        if not lookups:
+            return "Crop cache: no lookups."
+        return (f"Crop cache: {lookups} lookups, {hits} hits ({100 * hits / lookups:.1f}%: "
+                f"{self.stats['memory_hits']} in memory, {self.stats['disk_hits']} on disk), "
+                f"{self.stats['misses']} searched, {self.stats['evictions']} evicted.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or clear a crop decision cache file.")
+    parser.add_argument("cache", type=str, help="Cache file (SQLite), as given to autocrop.py --crop-cache.")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached crop.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        parser.error(f"{args.cache} does not exist")
+    cache = CropCache(args.cache)
+    database = cache._database()
+    if args.clear:
+        database.execute("DELETE FROM crops")
+        database.execute("VACUUM")
+    count, oldest, newest = database.execute("SELECT COUNT(*), MIN(used), MAX(used) FROM crops").fetchone()
+    print(f"{args.cache}: {count} crops, {os.path.getsize(args.cache) / 1e6:.1f} MB.")
+    if count:
+        print(f"Last used between {time.ctime(oldest)} and {time.ctime(newest)}.")
+    cache.close()
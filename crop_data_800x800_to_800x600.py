@@ -1,5 +1,27 @@
+import argparse
+import contextlib
+import io
 import os
+import shutil
+import sys
+import tempfile
 from PIL import Image
+import label_transforms as transforms
+from batch import default_workers, print_failures
+from pipeline import FixedCrop, describe_job, run_pipeline
+
+def crop_transform(crop_top, crop_bottom, original_height):
+    # Images are square and only cropped vertically, so x stays as it is
+    return transforms.crop(0, crop_top, 0, crop_bottom, original_height, original_height)
+
+def update_yolo_objects(objects, crop_top, crop_bottom, original_height):
+    """
+    Same adjustment as update_yolo_coordinates, for (class_index, points) tuples
+    as read from a label store.
+    """
+    class_ids, vertex_offsets, coords = transforms.pack(objects)
+    coords = crop_transform(crop_top, crop_bottom, original_height)(coords)
+    return transforms.unpack(class_ids, vertex_offsets, coords)
 
 def update_yolo_coordinates(input_file, output_file, crop_top, crop_bottom, original_height):
     """
@@ -12,45 +34,66 @@ def update_yolo_coordinates(input_file, output_file, crop_top, crop_bottom, orig
         crop_bottom (int): Number of pixels cropped from the bottom.
         original_height (int): Original height of the image.
     """
-    with open(input_file, "r") as infile, open(output_file, "w") as outfile:
+    objects = []
+    with open(input_file, "r") as infile:
         for line in infile:
             parts = line.strip().split()
             if len(parts) < 3 or len(parts) % 2 != 1:
                 print(f"Skipping invalid line in {input_file}: {line.strip()}")
                 continue
 
-            class_id = parts[0]
-            coordinates = [float(coord) for coord in parts[1:]]
+            objects.append((int(parts[0]), [float(coord) for coord in parts[1:]]))
 
-            # Group into (x, y) pairs
-            polygon_coords = [(coordinates[i], coordinates[i + 1]) for i in range(0, len(coordinates), 2)]
+    # Adjust y-coordinates based on the crop, for all polygons at once
+    updated_objects = update_yolo_objects(objects, crop_top, crop_bottom, original_height)
 
-            # Adjust y-coordinates based on the crop
-            updated_coords = []
-            for x, y in polygon_coords:
-                new_y = (y * original_height - crop_top) / (original_height - crop_top - crop_bottom)
-                updated_coords.append((x, new_y))
-
-            # Write updated coordinates to the output file
-            updated_line = class_id + " " + " ".join(f"{x:.6f} {y:.6f}" for x, y in updated_coords)
-            outfile.write(updated_line + "\n")
+    # Write updated coordinates to the output file
+    with open(output_file, "w") as outfile:
+        for class_id, coordinates in updated_objects:
+            outfile.write(f"{class_id} " + " ".join(f"{value:.6f}" for value in coordinates) + "\n")
 
     print(f"Updated labels saved to '{output_file}'.")
 
-def process_directory(image_dir, label_dir, output_image_dir, output_label_dir):
+class RequireSize:
+    """Pipeline stage dropping, with a message, images that are not the given size."""
+
+    def __init__(self, width, height):
+        self.size = (width, height)
+
+    def __call__(self, record):
+        if record.image.size != self.size:
+            print(f"Skipping non-{self.size[0]}x{self.size[1]} image: {record.filename}")
+            return None
+        return record
+
+def process_directory(image_dir, label_dir, output_image_dir, output_label_dir, workers=1):
     """
-    Processes a directory of images and labels to resize and update YOLO coordinates.
+    Processes a directory of images and labels to crop 800x800 images to 800x600 and update YOLO coordinates.
+
+    Runs a pipeline (see pipeline.py) cropping 100 pixels from the top and
+    bottom, so each image is decoded and encoded once and labels are adjusted
+    for all polygons at once. Images without labels are skipped.
 
     Args:
         image_dir (str): Path to the directory containing images.
-        label_dir (str): Path to the directory containing YOLO label files.
-        output_image_dir (str): Path to save the resized images.
-        output_label_dir (str): Path to save the updated label files.
+        label_dir (str): Path to the directory containing YOLO label files, or a label store (.ylbl).
+        output_image_dir (str): Path to save the cropped images.
+        output_label_dir (str): Path to save the updated label files, or a label store (.ylbl).
+        workers (int): Number of worker processes.
+    """
+    stages = [RequireSize(800, 800), FixedCrop(0, 100, 0, 100)]
+    failures = run_pipeline(image_dir, label_dir, output_image_dir, output_label_dir, stages, workers)
+    print_failures(failures, describe_job)
+
+    print("Processing complete.")
+
+def process_directory_reference(image_dir, label_dir, output_image_dir, output_label_dir):
     """
-    if not os.path.exists(output_image_dir):
-        os.makedirs(output_image_dir)
-    if not os.path.exists(output_label_dir):
-        os.makedirs(output_label_dir)
+    The original one image at a time loop, for .txt label directories only.
+    Kept as the reference check_directory compares process_directory with.
+    """
+    os.makedirs(output_image_dir, exist_ok=True)
+    os.makedirs(output_label_dir, exist_ok=True)
 
     crop_top = 100
     crop_bottom = 100
@@ -58,36 +101,68 @@ def process_directory(image_dir, label_dir, output_image_dir, output_label_dir):
 
     for filename in os.listdir(image_dir):
         if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            image_path = os.path.join(image_dir, filename)
             label_path = os.path.join(label_dir, os.path.splitext(filename)[0] + ".txt")
-            output_image_path = os.path.join(output_image_dir, filename)
-            output_label_path = os.path.join(output_label_dir, os.path.splitext(filename)[0] + ".txt")
+            if not os.path.exists(label_path):
+                continue
 
-            # Process image
-            with Image.open(image_path) as img:
+            with Image.open(os.path.join(image_dir, filename)) as img:
                 if img.size != (800, 800):
-                    print(f"Skipping non-800x800 image: {filename}")
                     continue
-
                 cropped_img = img.crop((0, crop_top, 800, original_height - crop_bottom))
-                cropped_img.save(output_image_path)
-
-            # Process label
-            if os.path.exists(label_path):
-                update_yolo_coordinates(label_path, output_label_path, crop_top, crop_bottom, original_height)
-
-    print("Processing complete.")
+                cropped_img.save(os.path.join(output_image_dir, filename))
 
-if __name__ == "__main__":
-    import sys
+            output_label_path = os.path.join(output_label_dir, os.path.splitext(filename)[0] + ".txt")
+            update_yolo_coordinates(label_path, output_label_path, crop_top, crop_bottom, original_height)
 
-    if len(sys.argv) != 5:
-        print("Usage: python crop__data_800x800_to_800x600.py <image_dir> <label_dir> <output_image_dir> <output_label_dir>")
-        sys.exit(1)
+def check_directory(image_dir, label_dir, workers=1):
+    """
+    Check that process_directory writes the same bytes as the reference loop.
 
-    image_dir = sys.argv[1]
-    label_dir = sys.argv[2]
-    output_image_dir = sys.argv[3]
-    output_label_dir = sys.argv[4]
+    Returns:
+        bool: True if every output image and label file is identical.
+    """
+    directory = tempfile.mkdtemp(prefix="crop_data_check_")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_directory_reference(image_dir, label_dir, os.path.join(directory, "reference", "images"),
+                                        os.path.join(directory, "reference", "labels"))
+            process_directory(image_dir, label_dir, os.path.join(directory, "pipeline", "images"),
+                              os.path.join(directory, "pipeline", "labels"), workers)
+
+        ok = True
+        for kind in ("images", "labels"):
+            reference_dir = os.path.join(directory, "reference", kind)
+            pipeline_dir = os.path.join(directory, "pipeline", kind)
+            reference_names = sorted(os.listdir(reference_dir))
+            if reference_names != sorted(os.listdir(pipeline_dir)):
+                print(f"Different {kind} written: {reference_names} and {sorted(os.listdir(pipeline_dir))}")
+                ok = False
+                continue
+            for name in reference_names:
+                with open(os.path.join(reference_dir, name), "rb") as reference, open(os.path.join(pipeline_dir, name), "rb") as output:
+                    if reference.read() != output.read():
+                        print(f"{kind}/{name} differs")
+                        ok = False
+        print(f"{len(reference_names)} label files and images compared, {'all identical' if ok else 'differences found'}.")
+        return ok
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
 
-    process_directory(image_dir, label_dir, output_image_dir, output_label_dir)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop 800x800 images to 800x600 and update their YOLO polygon labels.")
+    parser.add_argument("image_dir", type=str, help="Directory containing the images.")
+    parser.add_argument("label_dir", type=str, help="Directory containing YOLO label files, or a label store (.ylbl).")
+    parser.add_argument("output_image_dir", type=str, nargs="?", help="Directory to save the cropped images.")
+    parser.add_argument("output_label_dir", type=str, nargs="?", help="Directory to save the updated label files, or a label store (.ylbl).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check that the pipeline writes the same files as the original one image at a time loop (.txt labels).")
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else default_workers()
+    if args.check:
+        sys.exit(0 if check_directory(args.image_dir, args.label_dir, workers) else 1)
+    if args.output_image_dir is None or args.output_label_dir is None:
+        parser.error("output_image_dir and output_label_dir are required")
+    process_directory(args.image_dir, args.label_dir, args.output_image_dir, args.output_label_dir, workers)
@@ -0,0 +1,71 @@
+import os
+
+# Crop plans let autocrop decide every crop from image headers and labels
+# alone, and apply the decisions later. A plan is a tab separated text file,
+# sorted by image name so plans for different settings diff cleanly:
+#
+#   # width=640 height=480 clip=exact simplify=None
+#   image        width  height  orientation  left  right  top  bottom
+#   apples.jpg   1280   853     1            512   128    0    0
+#
+# The image width/height are the stored (unrotated) pixel dimensions and
+# orientation is the EXIF orientation tag, recorded for review only. The
+# header holds the settings that decide the crops; autocrop --apply refuses a
+# plan whose settings differ from its own.
+
+PLAN_COLUMNS = ("image", "width", "height", "orientation", "left", "right", "top", "bottom")
+
+def write_plan(path, settings, rows):
+    """
+    Write a crop plan.
+
+    Args:
+        path (str): Output file path.
+        settings (dict): Settings the plan was made with (target size, clipping, simplification, search engine).
+        rows (dict): Image filename -> dict with "width", "height", "orientation"
+                     and "crop" (left, right, top, bottom).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w") as file:
+        file.write("# " + " ".join(f"{key}={value}" for key, value in settings.items()) + "\n")
+        file.write("\t".join(PLAN_COLUMNS) + "\n")
+        for image in sorted(rows):
+            row = rows[image]
+            values = [image, row["width"], row["height"], row["orientation"], *row["crop"]]
+            file.write("\t".join(map(str, values)) + "\n")
+
+def read_plan(path):
+    """
+    Read a crop plan written by write_plan.
+
+    Args:
+        path (str): Plan file path.
+
+    Returns:
+        tuple: (settings, rows) in the same shape write_plan takes. Setting
+               values are returned as strings.
+    """
+    settings = {}
+    rows = {}
+    with open(path, "r") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if line.startswith("#"):
+                for item in line[1:].split():
+                    key, _, value = item.partition("=")
+                    settings[key] = value
+                continue
+            if not line or line.startswith(PLAN_COLUMNS[0] + "\t"):
+                continue
+
+            image, width, height, orientation, *crop = line.split("\t")
+            rows[image] = {
+                "width": int(width),
+                "height": int(height),
+                "orientation": int(orientation),
+                "crop": tuple(map(int, crop)),
+            }
+    return settings, rows
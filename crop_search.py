@@ -0,0 +1,458 @@
+import argparse
+import math
+import random
+import numpy as np
+
+# Crop search engines used by autocrop.calculate_crop.
+#
+# The "exhaustive" engine in autocrop.py scores every (left, top) split by
+# clamping each polygon into the crop window and running the shoelace formula,
+# which costs O(crop_x * crop_y * vertices). The "profile" engine below gets
+# the same loss table in roughly O(vertices * log(vertices) + crop_x) per row.
+#
+# It relies on the shoelace area being linear in the x coordinates:
+#
+#     area = 1/2 * sum(x[i] * (y[i - 1] - y[i + 1]))
+#
+# With the y coordinates fixed, clamping x[i] into the window [a, a + W] is a
+# piecewise linear function of the window offset a, with breakpoints at
+# a = x[i] - W and a = x[i]. Each polygon's clamped area is therefore piecewise
+# linear in a, and so is its absolute value once it is split at zero
+# crossings. Those pieces are accumulated into slope/intercept difference
+# arrays over the integer offsets 0..crop_x, which a single prefix sum turns
+# into the area that survives at every offset.
+#
+# The "vectorized" engine keeps the exhaustive search's semantics but scores
+# candidates in batches with NumPy (see pack_polygons and crop_losses).
+
+SEARCH_METHODS = ("profile", "vectorized", "exhaustive")
+
+# Upper bound on candidates * vertices evaluated per batch, to keep the
+# (candidates, vertices) temporaries at a few tens of MB
+BATCH_ELEMENTS = 1 << 21
+
+def absolute_polygons(width, height, polygons):
+    """
+    Polygons in pixel coordinates as lists of (x, y) points.
+
+    Same conversion as autocrop.calculate_crop, dropping polygons the
+    shoelace formula treats as empty (fewer than three vertices). Searches
+    for several crop sizes on one image can share the result (see
+    profile_crop's absolute).
+    """
+    absolute = []
+    for poly in polygons:
+        points = [(x * width, y * height) for x, y in zip(poly[::2], poly[1::2])]
+        if len(points) >= 3:
+            absolute.append(points)
+    return absolute
+
+def _signed_area(xs, ys):
+    n = len(xs)
+    return sum(xs[i] * (ys[i - 1] - ys[(i + 1) % n]) for i in range(n)) / 2
+
+def _remaining_area_profile(polygons, window, steps):
+    """
+    Sum of clamped polygon areas for every integer window offset.
+
+    Args:
+        polygons (list): List of (xs, ys) coordinate lists. The xs are clamped
+                         into the window, the ys are used as given.
+        window (float): Width of the crop window along x.
+        steps (int): Largest window offset; offsets 0..steps are evaluated.
+
+    Returns:
+        list: Remaining (absolute) area for each window offset.
+    """
+    slope = [0.0] * (steps + 2)
+    intercept = [0.0] * (steps + 2)
+
+    def add_segment(start, end, m, c):
+        # Integer offsets a with start < a <= end (the first segment also
+        # owns offset 0). Both neighbouring pieces agree on a breakpoint,
+        # so the boundary convention does not change the result.
+        first = 0 if start <= 0 else math.floor(start) + 1
+        last = steps if end >= steps else math.floor(end)
+        if first > last:
+            return
+        slope[first] += m
+        slope[last + 1] -= m
+        intercept[first] += c
+        intercept[last + 1] -= c
+
+    for xs, ys in polygons:
+        n = len(xs)
+        m = 0.0
+        c = 0.0
+        events = []
+        for i in range(n):
+            x = xs[i]
+            weight = (ys[i - 1] - ys[(i + 1) % n]) / 2
+            if weight == 0:
+                continue
+            # Region of x relative to a window just right of offset 0
+            if x - window > 0:
+                m += weight
+                c += window * weight
+            elif x > 0:
+                c += x * weight
+            else:
+                m += weight
+            if 0 < x - window < steps:
+                events.append((x - window, -weight, (x - window) * weight))
+            if 0 < x < steps:
+                events.append((x, weight, -x * weight))
+        events.sort()
+
+        start = 0.0
+        for position, dm, dc in events + [(float(steps), 0.0, 0.0)]:
+            if position > start:
+                # Split where the signed area crosses zero so |area| stays linear
+                at_start = m * start + c
+                at_end = m * position + c
+                if m != 0 and (at_start < 0 < at_end or at_end < 0 < at_start):
+                    root = -c / m
+                    sign = 1 if at_start > 0 else -1
+                    add_segment(start, root, sign * m, sign * c)
+                    add_segment(root, position, -sign * m, -sign * c)
+                else:
+                    sign = -1 if at_start + at_end < 0 else 1
+                    add_segment(start, position, sign * m, sign * c)
+                start = position
+            m += dm
+            c += dc
+
+    areas = []
+    running_slope = 0.0
+    running_intercept = 0.0
+    for a in range(steps + 1):
+        running_slope += slope[a]
+        running_intercept += intercept[a]
+        areas.append(running_slope * a + running_intercept)
+    return areas
+
+def loss_table(width, height, crop_x, crop_y, polygons, absolute=None):
+    """
+    Compute the polygon area lost for every (left, top) split.
+
+    Args:
+        width (int): Current pixel width of the image.
+        height (int): Current pixel height of the image.
+        crop_x (int): Amount to crop horizontally, in total.
+        crop_y (int): Amount to crop vertically, in total.
+        polygons (list): List of polygons in YOLO format.
+        absolute (list): absolute_polygons(width, height, polygons), if
+                         already computed.
+
+    Returns:
+        tuple: (table, total_area) where table[left][top] is the area lost by
+               cropping left/top pixels from the left/top edges and the rest
+               from the opposite edges.
+    """
+    if absolute is None:
+        absolute = absolute_polygons(width, height, polygons)
+    total_area = sum(
+        abs(_signed_area([x for x, _ in poly], [y for _, y in poly]))
+        for poly in absolute
+    )
+
+    # Sweep along the axis with the larger crop and loop over the other one.
+    # Swapping x and y only flips the sign of the area, not its magnitude.
+    sweep_x = crop_x >= crop_y
+    if sweep_x:
+        sweep_window, sweep_steps = width - crop_x, crop_x
+        fixed_window, fixed_steps = height - crop_y, crop_y
+        coords = [([x for x, _ in p], [y for _, y in p]) for p in absolute]
+    else:
+        sweep_window, sweep_steps = height - crop_y, crop_y
+        fixed_window, fixed_steps = width - crop_x, crop_x
+        coords = [([y for _, y in p], [x for x, _ in p]) for p in absolute]
+
+    rows = []
+    for offset in range(fixed_steps + 1):
+        # The exhaustive search clamps to the window even when nothing is
+        # cropped along an axis, which matters for vertices outside the frame
+        clamped = [
+            (sweep, [max(offset, min(v, offset + fixed_window)) for v in fixed])
+            for sweep, fixed in coords
+        ]
+        remaining = _remaining_area_profile(clamped, sweep_window, sweep_steps)
+        rows.append([total_area - area for area in remaining])
+
+    if sweep_x:
+        # rows[top][left] -> table[left][top]
+        table = [list(column) for column in zip(*rows)]
+    else:
+        # rows[left][top] is already in table order
+        table = rows
+    return table, total_area
+
+def _report(stats, candidates, easy_crop):
+    # Search statistics for instrumentation: number of splits whose loss was
+    # computed, and which of the four one-sided crops was taken (or None)
+    if stats is not None:
+        stats["candidates"] = candidates
+        stats["easy_crop"] = easy_crop
+
+def profile_crop(width, height, crop_x, crop_y, polygons, stats=None, absolute=None):
+    """
+    Find the optimal crop using precomputed area profiles.
+
+    Returns the same split as the exhaustive search in autocrop.calculate_crop,
+    or, where floating point noise makes two splits indistinguishable, a split
+    whose loss is equal to within a tolerance of the total polygon area.
+
+    Args:
+        width (int): Current pixel width of the image.
+        height (int): Current pixel height of the image.
+        crop_x (int): Amount to crop horizontally, in total.
+        crop_y (int): Amount to crop vertically, in total.
+        polygons (list): List of polygons in YOLO format.
+        stats (dict): If given, receives "candidates" (splits scored) and
+                      "easy_crop" (index of the one-sided crop taken, or None).
+        absolute (list): absolute_polygons(width, height, polygons), if
+                         already computed for another crop size.
+
+    Returns:
+        tuple: Optimal cropping amounts (left_crop, right_crop, top_crop, bottom_crop).
+    """
+    table, total_area = loss_table(width, height, crop_x, crop_y, polygons, absolute)
+    tolerance = 1e-9 * max(1.0, total_area)
+
+    # The table scores every split at once
+    _report(stats, (crop_x + 1) * (crop_y + 1), None)
+
+    # Check for easy solution: full crop from one side
+    for easy, (left, top) in enumerate(((crop_x, crop_y), (0, crop_y), (crop_x, 0), (0, 0))):
+        if abs(table[left][top]) <= tolerance:
+            _report(stats, (crop_x + 1) * (crop_y + 1), easy)
+            return (left, crop_x - left, top, crop_y - top)
+
+    # Same visiting order as the exhaustive search, so ties resolve the same
+    # way. Clamping can grow self-intersecting polygons, so losses may be
+    # negative; like the exhaustive search, stop at the first zero loss.
+    for left in range(crop_x + 1):
+        for top in range(crop_y + 1):
+            if abs(table[left][top]) <= tolerance:
+                return (left, crop_x - left, top, crop_y - top)
+
+    best_loss = min(min(row) for row in table)
+    for left in range(crop_x + 1):
+        for top in range(crop_y + 1):
+            if table[left][top] <= best_loss + tolerance:
+                return (left, crop_x - left, top, crop_y - top)
+
+    return (0, 0, 0, 0)
+
+def pack_polygons(width, height, polygons):
+    """
+    Pack all polygons of an image into contiguous pixel-space arrays.
+
+    Args:
+        width (int): Pixel width of the image.
+        height (int): Pixel height of the image.
+        polygons (list): List of polygons in YOLO format.
+
+    Returns:
+        dict: "xs"/"ys" vertex coordinates of all polygons back to back,
+              "prev"/"next" indices of each vertex's neighbours within its
+              polygon, "starts" the first vertex of each polygon, and "area"
+              the total unclamped polygon area.
+    """
+    xs = []
+    ys = []
+    prev = []
+    next_ = []
+    starts = []
+    for poly in polygons:
+        count = len(poly) // 2
+        if count < 3:
+            continue  # Not a valid polygon, contributes no area
+        start = len(xs)
+        starts.append(start)
+        xs.extend(x * width for x in poly[0:2 * count:2])
+        ys.extend(y * height for y in poly[1:2 * count:2])
+        prev.extend(start + (i - 1) % count for i in range(count))
+        next_.extend(start + (i + 1) % count for i in range(count))
+
+    packed = {
+        "width": width,
+        "height": height,
+        "xs": np.array(xs, dtype=np.float64),
+        "ys": np.array(ys, dtype=np.float64),
+        "prev": np.array(prev, dtype=np.intp),
+        "next": np.array(next_, dtype=np.intp),
+        "starts": np.array(starts, dtype=np.intp),
+    }
+    packed["area"] = float(_polygon_areas(packed, packed["xs"][None, :], packed["ys"][None, :]).sum())
+    return packed
+
+def _polygon_areas(packed, xs, ys):
+    # Shoelace formula for every polygon in every row of (candidates, vertices)
+    terms = xs * (ys[:, packed["prev"]] - ys[:, packed["next"]])
+    return np.abs(np.add.reduceat(terms, packed["starts"], axis=1)) / 2
+
+def crop_losses(packed, candidates):
+    """
+    Score a batch of crops against all polygons of an image at once.
+
+    Matches crop_loss in autocrop.calculate_crop: every vertex is clamped into
+    the crop window and the lost area is the original polygon area minus the
+    clamped polygon area, summed over all polygons.
+
+    Args:
+        packed (dict): Polygon arrays from pack_polygons.
+        candidates (array-like): Shape (n, 4) of (left, right, top, bottom) crops.
+
+    Returns:
+        numpy.ndarray: Lost polygon area for each candidate.
+    """
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 4)
+    losses = np.zeros(len(candidates))
+    vertices = len(packed["xs"])
+    if vertices == 0:
+        return losses
+
+    batch = max(1, BATCH_ELEMENTS // vertices)
+    for first in range(0, len(candidates), batch):
+        chunk = candidates[first:first + batch]
+        left, right, top, bottom = (chunk[:, i:i + 1] for i in range(4))
+        xs = np.clip(packed["xs"], left, packed["width"] - right)
+        ys = np.clip(packed["ys"], top, packed["height"] - bottom)
+        remaining = _polygon_areas(packed, xs, ys).sum(axis=1)
+        losses[first:first + len(chunk)] = packed["area"] - remaining
+    return losses
+
+def vectorized_crop(width, height, crop_x, crop_y, polygons, stats=None, packed=None):
+    """
+    Exhaustive crop search, scoring candidates in batches with crop_losses.
+
+    Visits splits in the same order as autocrop.calculate_crop's exhaustive
+    search and stops at the same places, so it returns the same split.
+
+    Args:
+        stats (dict): If given, receives "candidates" and "easy_crop" as in profile_crop.
+        packed (dict): pack_polygons(width, height, polygons), if already
+                       computed for another crop size.
+
+    Returns:
+        tuple: Optimal cropping amounts (left_crop, right_crop, top_crop, bottom_crop).
+    """
+    if packed is None:
+        packed = pack_polygons(width, height, polygons)
+
+    # Check for easy solution: full crop from one side
+    easy = [(crop_x, 0, crop_y, 0), (0, crop_x, crop_y, 0), (crop_x, 0, 0, crop_y), (0, crop_x, 0, crop_y)]
+    for index, (crop, loss) in enumerate(zip(easy, crop_losses(packed, easy))):
+        if loss == 0:
+            _report(stats, len(easy), index)
+            return crop
+    scored = len(easy)
+
+    # Try different cropping splits, in the exhaustive search's order
+    best_loss = float('inf')
+    best_crop = (0, 0, 0, 0)
+    tops = np.arange(crop_y + 1)
+    rows = max(1, BATCH_ELEMENTS // max(1, len(packed["xs"]) * len(tops)))
+    for first_left in range(0, crop_x + 1, rows):
+        lefts = np.arange(first_left, min(crop_x + 1, first_left + rows))
+        grid_left = np.repeat(lefts, len(tops))
+        grid_top = np.tile(tops, len(lefts))
+        candidates = np.stack([grid_left, crop_x - grid_left, grid_top, crop_y - grid_top], axis=1)
+        losses = crop_losses(packed, candidates)
+        scored += len(candidates)
+
+        zero = np.flatnonzero(losses == 0)
+        if len(zero):
+            _report(stats, scored, None)
+            return tuple(int(v) for v in candidates[zero[0]])  # Stop early if no loss
+        index = int(np.argmin(losses))
+        if losses[index] < best_loss:
+            best_loss = losses[index]
+            best_crop = tuple(int(v) for v in candidates[index])
+
+    _report(stats, scored, None)
+    return best_crop
+
+def random_polygons(rng, count, max_vertices):
+    """Generate random polygons in YOLO format, some reaching outside the frame."""
+    polygons = []
+    for _ in range(count):
+        cx, cy = rng.uniform(-0.1, 1.1), rng.uniform(-0.1, 1.1)
+        radius = rng.uniform(0.02, 0.5)
+        vertices = rng.randint(1, max_vertices)
+        angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(vertices))
+        if rng.random() < 0.3:
+            # Self-intersecting / clockwise polygons are legal in label files too
+            rng.shuffle(angles)
+        points = []
+        for angle in angles:
+            r = radius * rng.uniform(0.3, 1.0)
+            points.extend([cx + r * math.cos(angle), cy + r * math.sin(angle)])
+        polygons.append(points)
+    return polygons
+
+def _clamped_loss(width, height, split, polygons):
+    # Direct evaluation of the exhaustive engine's crop_loss for one split
+    left, right, top, bottom = split
+    loss = 0.0
+    for poly in absolute_polygons(width, height, polygons):
+        xs = [x for x, _ in poly]
+        ys = [y for _, y in poly]
+        clamped_xs = [max(left, min(x, width - right)) for x in xs]
+        clamped_ys = [max(top, min(y, height - bottom)) for y in ys]
+        loss += abs(_signed_area(xs, ys)) - abs(_signed_area(clamped_xs, clamped_ys))
+    return loss
+
+def check_agreement(trials, seed):
+    """Compare the profile and vectorized engines with the exhaustive search on random polygon sets."""
+    # Imported here so autocrop can import this module at load time
+    from autocrop import calculate_crop
+
+    rng = random.Random(seed)
+    failures = 0
+    for trial in range(trials):
+        width = rng.randint(8, 80)
+        height = rng.randint(8, 80)
+        crop_x = rng.randint(0, width // 2)
+        crop_y = rng.randint(0, height // 2) if rng.random() < 0.3 else 0
+        polygons = random_polygons(rng, rng.randint(0, 6), 12)
+        tolerance = 1e-6 * max(1.0, width * height)
+
+        # The batch kernel must reproduce crop_loss for arbitrary crops
+        packed = pack_polygons(width, height, polygons)
+        splits = [
+            (left, crop_x - left, top, crop_y - top)
+            for left in range(0, crop_x + 1, max(1, crop_x // 4))
+            for top in range(0, crop_y + 1, max(1, crop_y // 4))
+        ]
+        for split, loss in zip(splits, crop_losses(packed, splits)):
+            if abs(loss - _clamped_loss(width, height, split, polygons)) > tolerance:
+                failures += 1
+                print(f"Trial {trial}: crop_losses disagrees with crop_loss for {split}")
+                break
+
+        expected = calculate_crop(width, height, crop_x, crop_y, polygons, search="exhaustive")
+        for search in ("profile", "vectorized"):
+            actual = calculate_crop(width, height, crop_x, crop_y, polygons, search=search)
+            if expected == actual:
+                continue
+
+            # A different split is only acceptable if it loses the same area
+            expected_loss = _clamped_loss(width, height, expected, polygons)
+            actual_loss = _clamped_loss(width, height, actual, polygons)
+            if abs(expected_loss - actual_loss) > tolerance:
+                failures += 1
+                print(f"Trial {trial}: exhaustive {expected} (loss {expected_loss}) != {search} {actual} (loss {actual_loss})")
+
+    print(f"{trials - failures}/{trials} trials agree.")
+    return failures == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the profile and vectorized crop searches agree with the exhaustive search.")
+    parser.add_argument("--trials", type=int, default=500, help="Number of random polygon sets to compare.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    if not check_agreement(args.trials, args.seed):
+        raise SystemExit(1)
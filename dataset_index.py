@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# One-pass index of a YOLO dataset: which images and label files exist, paired
+# by stem ("apples" for apples.jpg and apples.txt), with their sizes and
+# modification times.
+#
+# Each directory is listed once with os.scandir and the files are stat'ed from
+# a thread pool, instead of tools calling os.path.exists and os.stat once per
+# image in turn. On network storage every one of those calls is a round trip,
+# which adds up to minutes on directories with hundreds of thousands of files.
+#
+# An index can be saved as a JSON lines file:
+#
+#   {"images": "./images", "labels": "./labels", "images_mtime_ns": ..., "labels_mtime_ns": ...}
+#   {"stem": "apples", "image": "apples.jpg", "image_stat": [size, mtime_ns], "label": "apples.txt", "label_stat": [...]}
+#
+# open_index() reuses a saved index while neither directory's modification
+# time has changed, i.e. no file was added, removed or renamed. Files rewritten
+# in place do not change the directory, so a reused index can have stale sizes
+# and times; tools that decide what to reprocess from them (autocrop's
+# manifest) build a fresh index instead.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+LABEL_EXTENSION = ".txt"
+STAT_THREADS = 16
+
+def _scan(directory, extensions):
+    # {stem: filename} of the regular files in directory, plus the names of
+    # files whose stem was already taken by another extension
+    files = {}
+    duplicates = []
+    with os.scandir(directory) as entries:
+        # Sorted so that which of two files with the same stem is kept does
+        # not depend on the directory order
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if extensions is not None and not entry.name.lower().endswith(extensions):
+                continue
+            if not entry.is_file():
+                continue
+            stem = os.path.splitext(entry.name)[0]
+            if stem in files:
+                duplicates.append(entry.name)
+            else:
+                files[stem] = entry.name
+    return files, duplicates
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _directory_mtime(directory):
+    return os.stat(directory).st_mtime_ns if directory is not None else None
+
+class DatasetIndex:
+    """
+    Images and label files of a dataset, paired by stem.
+
+    Args:
+        image_dir (str): Image directory.
+        label_dir (str): Label directory, or None to index images only.
+        entries (dict): stem -> {"image", "image_stat", "label", "label_stat"};
+                        filenames are None and stats are None when missing.
+        duplicates (list): Filenames skipped because another file had the same stem.
+        directory_mtimes (tuple): Modification times of the two directories
+                                  when they were scanned.
+    """
+
+    def __init__(self, image_dir, label_dir, entries, duplicates=(), directory_mtimes=(None, None)):
+        self.image_dir = image_dir
+        self.label_dir = label_dir
+        self.entries = entries
+        self.duplicates = list(duplicates)
+        self.directory_mtimes = directory_mtimes
+
+    @classmethod
+    def build(cls, image_dir, label_dir=None, image_extensions=IMAGE_EXTENSIONS, threads=STAT_THREADS):
+        """
+        Scan the directories once and stat every file from a thread pool.
+
+        Args:
+            image_dir (str): Image directory.
+            label_dir (str): Label directory with .txt files, or None.
+            image_extensions (tuple): Lowercase extensions of the image files,
+                                      or None for every regular file.
+            threads (int): Threads for the stat calls.
+        """
+        directory_mtimes = (_directory_mtime(image_dir), _directory_mtime(label_dir))
+        images, duplicates = _scan(image_dir, image_extensions)
+        labels = {}
+        if label_dir is not None:
+            labels, label_duplicates = _scan(label_dir, (LABEL_EXTENSION,))
+            duplicates += label_duplicates
+
+        paths = [os.path.join(image_dir, name) for name in images.values()]
+        paths += [os.path.join(label_dir, name) for name in labels.values()]
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            stats = list(executor.map(_stat, paths))
+        image_stats = dict(zip(images, stats[:len(images)]))
+        label_stats = dict(zip(labels, stats[len(images):]))
+
+        entries = {}
+        for stem in sorted(set(images) | set(labels)):
+            entries[stem] = {
+                "image": images.get(stem),
+                "image_stat": image_stats.get(stem),
+                "label": labels.get(stem),
+                "label_stat": label_stats.get(stem),
+            }
+        return cls(image_dir, label_dir, entries, duplicates, directory_mtimes)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, stem):
+        return stem in self.entries
+
+    def image_path(self, stem):
+        entry = self.entries.get(stem)
+        if entry is None or entry["image"] is None:
+            return None
+        return os.path.join(self.image_dir, entry["image"])
+
+    def label_path(self, stem):
+        entry = self.entries.get(stem)
+        if entry is None or entry["label"] is None:
+            return None
+        return os.path.join(self.label_dir, entry["label"])
+
+    def images(self):
+        """Sorted stems of every image."""
+        return [stem for stem, entry in self.entries.items() if entry["image"] is not None]
+
+    def pairs(self):
+        """Sorted stems of the images that have a label file."""
+        return [stem for stem, entry in self.entries.items() if entry["image"] is not None and entry["label"] is not None]
+
+    def orphan_images(self):
+        """Sorted stems of the images without a label file."""
+        return [stem for stem, entry in self.entries.items() if entry["image"] is not None and entry["label"] is None]
+
+    def orphan_labels(self):
+        """Sorted stems of the label files without an image."""
+        return [stem for stem, entry in self.entries.items() if entry["image"] is None and entry["label"] is not None]
+
+    def save(self, path):
+        """Write the index as JSON lines (see the format at the top of this file)."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(json.dumps({
+                "images": self.image_dir, "labels": self.label_dir,
+                "images_mtime_ns": self.directory_mtimes[0], "labels_mtime_ns": self.directory_mtimes[1],
+                "duplicates": self.duplicates,
+            }) + "\n")
+            for stem, entry in self.entries.items():
+                file.write(json.dumps(dict(stem=stem, **entry)) + "\n")
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        with open(path, "r") as file:
+            header = json.loads(file.readline())
+            entries = {}
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry.pop("stem")] = entry
+        return cls(header["images"], header["labels"], entries, header.get("duplicates", []),
+                   (header["images_mtime_ns"], header["labels_mtime_ns"]))
+
+    def is_current(self):
+        """True if no file was added to, removed from or renamed in either directory since the scan."""
+        try:
+            return self.directory_mtimes == (_directory_mtime(self.image_dir), _directory_mtime(self.label_dir))
+        except OSError:
+            return False
+
+def open_index(image_dir, label_dir=None, index_path=None, image_extensions=IMAGE_EXTENSIONS):
+    """
+    Load the index at index_path if it is for these directories and still
+    current, otherwise scan them and save the new index there.
+
+    Args:
+        image_dir (str): Image directory.
+        label_dir (str): Label directory, or None.
+        index_path (str): Saved index to reuse and update, or None to always scan.
+        image_extensions (tuple): Lowercase image extensions, or None for every file.
+
+    Returns:
+        DatasetIndex: The index.
+    """
+    if index_path is not None and os.path.exists(index_path):
+        try:
+            index = DatasetIndex.load(index_path)
+        except (OSError, ValueError, KeyError):
+            index = None
+        if index is not None and (index.image_dir, index.label_dir) == (image_dir, label_dir) and index.is_current():
+            return index
+
+    index = DatasetIndex.build(image_dir, label_dir, image_extensions)
+    if index_path is not None:
+        index.save(index_path)
+    return index
+
+def check_label_text(text):
+    """
+    Find malformed lines in the contents of a YOLO .txt label file.
+
+    A line is a class index followed by either a box (4 values) or a polygon
+    (3 or more x, y pairs), all normalized to [0, 1].
+
+    Returns:
+        list: (line_number, problem) tuples, line numbers starting at 1.
+    """
+    problems = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        parts = line.split()
+        if not parts:
+            continue
+        if not parts[0].isdigit():
+            problems.append((line_number, f"class index {parts[0]!r} is not a non-negative integer"))
+            continue
+        try:
+            values = [float(part) for part in parts[1:]]
+        except ValueError as e:
+            problems.append((line_number, str(e)))
+            continue
+        if len(values) % 2:
+            problems.append((line_number, f"odd number of coordinates ({len(values)})"))
+        elif len(values) != 4 and len(values) < 6:
+            problems.append((line_number, f"{len(values) // 2} points, need a box or at least 3 polygon points"))
+        elif any(not 0.0 <= value <= 1.0 for value in values):
+            problems.append((line_number, "coordinate outside [0, 1]"))
+    return problems
+
+def _check_label_file(path):
+    with open(path, "r") as file:
+        return check_label_text(file.read())
+
+def check_labels(index, threads=STAT_THREADS):
+    """
+    Check every label file of an index with check_label_text, reading them from a thread pool.
+
+    Returns:
+        list: (stem, line_number, problem) tuples in stem order.
+    """
+    stems = [stem for stem, entry in index.entries.items() if entry["label"] is not None]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        results = executor.map(_check_label_file, [index.label_path(stem) for stem in stems])
+        return [(stem, line_number, problem) for stem, problems in zip(stems, results) for line_number, problem in problems]
+
+def report(index, problems=None, limit=20):
+    """Text summary of an index: counts, orphans, duplicate stems and malformed label lines."""
+    lines = [f"{len(index.images())} images, {len(index.pairs())} with labels, "
+             f"{len(index.orphan_images())} without labels, {len(index.orphan_labels())} labels without images."]
+    sections = [
+        ("Images without labels", [index.entries[stem]["image"] for stem in index.orphan_images()]),
+        ("Labels without images", [index.entries[stem]["label"] for stem in index.orphan_labels()]),
+        ("Skipped, stem already used by another file", index.duplicates),
+        ("Malformed label lines", [f"{index.entries[stem]['label']}:{line_number}: {problem}"
+                                   for stem, line_number, problem in problems or []]),
+    ]
+    for title, items in sections:
+        if not items:
+            continue
+        lines.append(f"{title} ({len(items)}):")
+        lines.extend(f"  {item}" for item in items[:limit])
+        if len(items) > limit:
+            lines.append(f"  ... and {len(items) - limit} more")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a YOLO dataset and report orphaned files and malformed labels.")
+    parser.add_argument("images", type=str, help="Image directory.")
+    parser.add_argument("labels", type=str, help="Label directory.")
+    parser.add_argument("--index", metavar="INDEX_FILE", help="Save the index to INDEX_FILE (JSONL), for other tools' --index.")
+    parser.add_argument("--no-check", dest="check", action="store_false", help="Do not read the label files to check their lines.")
+    parser.add_argument("--limit", type=int, default=20, help="Files listed per problem.")
+    args = parser.parse_args()
+
+    index = DatasetIndex.build(args.images, args.labels)
+    if args.index:
+        index.save(args.index)
+    print(report(index, check_labels(index) if args.check else None, args.limit))
@@ -1,7 +1,9 @@
+import argparse
 import os
 import shutil
+from dataset_index import DatasetIndex, check_labels, report
 
-def find_unmatched_images(image_dir, text_dir, missing_dir):
+def find_unmatched_images(image_dir, text_dir, missing_dir, index_path=None):
     # Ensure the directories exist
     if not os.path.isdir(image_dir):
         print(f"Error: The directory {image_dir} does not exist.")
@@ -14,21 +16,12 @@ def find_unmatched_images(image_dir, text_dir, missing_dir):
     if not os.path.exists(missing_dir):
         os.makedirs(missing_dir)
 
-    # Get a list of files in each directory
-    image_files = os.listdir(image_dir)
-    text_files = os.listdir(text_dir)
-
-    # Create a set of text file names without the .txt extension
-    text_file_basenames = {os.path.splitext(text_file)[0] for text_file in text_files if text_file.endswith('.txt')}
-
-    # Find image files without a matching .txt file
-    unmatched_images = []
-    for image_file in image_files:
-        #image_basename, _ = os.path.splitext(image_file)
-        if image_file not in text_file_basenames:
-            unmatched_images.append(image_file)
+    # Scan both directories once, pairing images and .txt files by stem
+    index = DatasetIndex.build(image_dir, text_dir)
+    print(report(index, check_labels(index)))
 
     # Move unmatched image files to the missing directory
+    unmatched_images = [index.entries[stem]["image"] for stem in index.orphan_images()]
     if unmatched_images:
         print("Image files without a matching .txt file (moved to missing directory):")
         for unmatched_image in unmatched_images:
@@ -39,10 +32,16 @@ def find_unmatched_images(image_dir, text_dir, missing_dir):
     else:
         print("All image files have matching .txt files.")
 
-if __name__ == "__main__":
-    # Directories
-    image_dir = "./images"
-    text_dir = "./labels"
-    missing_dir = "./missing"
+    if index_path:
+        # Save the index as it is after the moves, for other tools' --index
+        DatasetIndex.build(image_dir, text_dir).save(index_path)
 
-    find_unmatched_images(image_dir, text_dir, missing_dir)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move images without a label file to a separate directory and report dataset problems.")
+    parser.add_argument("--images", default="./images", help="Image directory. Defaults to ./images.")
+    parser.add_argument("--labels", default="./labels", help="Label directory. Defaults to ./labels.")
+    parser.add_argument("--missing", default="./missing", help="Directory for unmatched images. Defaults to ./missing.")
+    parser.add_argument("--index", metavar="INDEX_FILE", help="Save the dataset index to INDEX_FILE afterwards.")
+    args = parser.parse_args()
+
+    find_unmatched_images(args.images, args.labels, args.missing, args.index)
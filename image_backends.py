@@ -0,0 +1,368 @@
+import argparse
+import io
+import os
+import sys
+import time
+import numpy as np
+import PIL
+from PIL import Image
+
+# Resize and JPEG encode backends for autocrop and pipeline.py.
+#
+# A backend resizes a decoded image to the target size and encodes it. Resize
+# and encode are about half the per-image cost once the crop search is fast,
+# so the settings that trade speed against quality are explicit here:
+#
+#   resample       Pillow filter for the final resample
+#   reducing_gap   first shrink by an integer factor with Image.reduce() (a
+#                  box filter) while the image stays at least reducing_gap
+#                  times the target size, then resample; None resamples the
+#                  whole way (Pillow's resize argument of the same name)
+#   quality, subsampling, optimize, progressive
+#                  JPEG encoder settings
+#
+# PillowBackend() with no arguments does exactly what autocrop always did:
+# resize with Pillow's default filter and save at Pillow's default JPEG
+# settings. pillow-simd is a drop-in build of Pillow, so when it is installed
+# the "pillow" backend uses it without any change here. The "vips" backend
+# uses libvips through pyvips if it is installed; make_backend falls back to
+# Pillow when it is not.
+#
+# `python image_backends.py [IMAGE_DIR]` compares the backends' throughput and
+# PSNR on the same images (a synthetic set if no directory is given);
+# `python image_backends.py --check` checks that each backend pickles, as
+# --workers needs.
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+BACKENDS = ("pillow", "vips")
+SUBSAMPLING = ("4:4:4", "4:2:2", "4:2:0")
+
+class PillowBackend:
+    """
+    Resize with Image.resize and encode with Image.save.
+
+    Args:
+        resample (str): Key of RESAMPLE_FILTERS.
+        reducing_gap (float): See the top of this file, or None.
+        quality (int): JPEG quality.
+        subsampling (str): JPEG chroma subsampling, one of SUBSAMPLING, or
+                           None for the encoder default (4:2:0).
+        optimize (bool): Compute optimal Huffman tables (smaller, slower).
+        progressive (bool): Write a progressive JPEG.
+    """
+
+    name = "pillow"
+
+    def __init__(self, resample="bicubic", reducing_gap=None, quality=75, subsampling=None, optimize=False, progressive=False):
+        if resample not in RESAMPLE_FILTERS:
+            raise ValueError(f"unknown resample filter: {resample}")
+        if subsampling is not None and subsampling not in SUBSAMPLING:
+            raise ValueError(f"unknown subsampling: {subsampling}")
+        self.resample = resample
+        self.reducing_gap = reducing_gap
+        self.quality = quality
+        self.subsampling = subsampling
+        self.optimize = optimize
+        self.progressive = progressive
+
+    def settings(self):
+        """The settings that change the output, for manifests and reports."""
+        return {
+            "backend": self.name, "resample": self.resample, "reducing_gap": self.reducing_gap,
+            "quality": self.quality, "subsampling": self.subsampling,
+            "optimize": self.optimize, "progressive": self.progressive,
+        }
+
+    def resize(self, image, size, box=None):
+        """Resize image (or the box region of it) to size."""
+        return image.resize(size, RESAMPLE_FILTERS[self.resample], box=box, reducing_gap=self.reducing_gap)
+
+    def save(self, image, file, format="JPEG"):
+        """Encode image to a path or file object."""
+        if format != "JPEG":
+            image.save(file, format)
+            return
+        options = {"quality": self.quality}
+        if self.subsampling is not None:
+            options["subsampling"] = self.subsampling
+        if self.optimize:
+            options["optimize"] = True
+        if self.progressive:
+            options["progressive"] = True
+        image.save(file, format, **options)
+
+# libvips kernels for the Pillow filter names
+_VIPS_KERNELS = {
+    "nearest": "nearest", "box": "linear", "bilinear": "linear", "hamming": "cubic",
+    "bicubic": "cubic", "lanczos": "lanczos3",
+}
+
+class VipsBackend(PillowBackend):
+    """
+    Resize and encode with libvips (pyvips). Takes the same settings as
+    PillowBackend; libvips always shrinks by integer factors before the final
+    resample, so reducing_gap is ignored. libvips only writes 4:4:4 or 4:2:0
+    JPEGs, so 4:2:2 subsampling raises ValueError.
+    """
+
+    name = "vips"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.subsampling == "4:2:2":
+            # jpegsave's subsample_mode is on (4:2:0) or off (4:4:4); "on"
+            # would silently write 4:2:0
+            raise ValueError("the vips backend cannot write 4:2:2 JPEGs; use 4:4:4, 4:2:0 or --backend pillow")
+        # Fail here, so make_backend can fall back to Pillow, but keep no
+        # reference to the module: backends are pickled into worker jobs
+        import pyvips  # noqa: F401
+
+    def _to_vips(self, image):
+        import pyvips
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        return pyvips.Image.new_from_memory(image.tobytes(), image.width, image.height, len(image.getbands()), "uchar")
+
+    def resize(self, image, size, box=None):
+        vips_image = self._to_vips(image)
+        if box is not None:
+            left, top = int(box[0]), int(box[1])
+            vips_image = vips_image.crop(left, top, round(box[2]) - left, round(box[3]) - top)
+        width, height = size
+        vips_image = vips_image.resize(width / vips_image.width, vscale=height / vips_image.height,
+                                       kernel=_VIPS_KERNELS[self.resample])
+        if (vips_image.width, vips_image.height) != (width, height):
+            # Rounding in libvips can leave the output a pixel off
+            vips_image = vips_image.gravity("centre", width, height, extend="copy")
+        mode = "RGB" if vips_image.bands == 3 else "L"
+        return Image.frombytes(mode, (width, height), vips_image.write_to_memory())
+
+    def save(self, image, file, format="JPEG"):
+        if format != "JPEG":
+            super().save(image, file, format)
+            return
+        options = {"Q": self.quality, "optimize_coding": self.optimize, "interlace": self.progressive}
+        if self.subsampling is not None:
+            options["subsample_mode"] = "off" if self.subsampling == "4:4:4" else "on"
+        data = self._to_vips(image).jpegsave_buffer(**options)
+        if hasattr(file, "write"):
+            file.write(data)
+        else:
+            with open(file, "wb") as output:
+                output.write(data)
+
+def available_backends():
+    """Names of the backends that can be used in this environment."""
+    names = ["pillow"]
+    try:
+        import pyvips  # noqa: F401
+        names.append("vips")
+    except (ImportError, OSError):
+        pass
+    return names
+
+def make_backend(name="pillow", **settings):
+    """
+    Create a backend by name, falling back to Pillow if its library is missing.
+
+    Args:
+        name (str): One of BACKENDS.
+        settings: PillowBackend arguments.
+    """
+    if name == "vips":
+        try:
+            return VipsBackend(**settings)
+        except (ImportError, OSError) as e:
+            print(f"Warning: the vips backend is not available ({e}). Using Pillow.")
+            return PillowBackend(**settings)
+    if name != "pillow":
+        raise ValueError(f"unknown backend: {name}")
+    return PillowBackend(**settings)
+
+def add_backend_arguments(parser):
+    """Add the --backend, --resample, --reducing-gap and JPEG options to an argparse parser."""
+    parser.add_argument("--backend", choices=BACKENDS, default="pillow",
+                        help="Resize and encode with Pillow (or pillow-simd if installed) or libvips (pyvips), if installed.")
+    parser.add_argument("--resample", choices=sorted(RESAMPLE_FILTERS), default="bicubic", help="Resampling filter.")
+    parser.add_argument("--reducing-gap", type=float, default=None, metavar="GAP",
+                        help="Box-shrink by integer factors while the image stays GAP times the target size, then resample. "
+                             "2 or 3 is much faster on large downscales and looks the same.")
+    parser.add_argument("--subsampling", choices=SUBSAMPLING, default=None,
+                        help="JPEG chroma subsampling (encoder default 4:2:0). The vips backend cannot write 4:2:2.")
+    parser.add_argument("--optimize", action="store_true", help="Optimize JPEG Huffman tables (smaller files, slower).")
+    parser.add_argument("--progressive", action="store_true", help="Write progressive JPEGs.")
+
+def backend_from_args(args, quality=75):
+    """The backend selected by the arguments from add_backend_arguments."""
+    try:
+        return make_backend(args.backend, resample=args.resample, reducing_gap=args.reducing_gap, quality=quality,
+                            subsampling=args.subsampling, optimize=args.optimize, progressive=args.progressive)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def check_pickle():
+    """
+    Check that every available backend survives pickling, as it must to be
+    sent to batch.run_batch worker processes.
+
+    Returns:
+        bool: True if every backend came back with the same settings.
+    """
+    import pickle
+
+    ok = True
+    for name in available_backends():
+        backend = make_backend(name, resample="lanczos", reducing_gap=2.0, quality=90, subsampling="4:4:4")
+        try:
+            copy = pickle.loads(pickle.dumps(backend))
+        except Exception as e:
+            print(f"{name}: cannot be pickled ({e})")
+            ok = False
+            continue
+        if type(copy) is not type(backend) or copy.settings() != backend.settings():
+            print(f"{name}: settings changed by pickling")
+            ok = False
+        else:
+            print(f"{name}: pickles")
+    return ok
+
+def psnr(reference, image):
+    """Peak signal-to-noise ratio in dB of image against reference (uint8 arrays)."""
+    error = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    return float("inf") if error == 0 else 10 * np.log10(255.0 ** 2 / error)
+
+def _center_box(width, height, target_width, target_height):
+    # Largest centered box of the target aspect ratio
+    if width * target_height > height * target_width:
+        box_width = height * target_width / target_height
+        return ((width - box_width) / 2, 0, (width + box_width) / 2, height)
+    box_height = width * target_height / target_width
+    return (0, (height - box_height) / 2, width, (height + box_height) / 2)
+
+def compare_backends(paths, target_width, target_height, configurations, draft=True):
+    """
+    Resize and encode the same images with every configuration.
+
+    Each output is decoded again and compared with a reference: the full
+    resolution decode resized with Lanczos and not encoded. Images are
+    decoded like autocrop does (at reduced JPEG scale when draft is True),
+    and the decode is not part of the timings.
+
+    Args:
+        paths (list): Image paths.
+        target_width (int): Output width; each image is center-cropped to the target aspect ratio.
+        target_height (int): Output height.
+        configurations (list): (label, backend) tuples.
+        draft (bool): Decode JPEGs at reduced size when the target is small enough.
+
+    Returns:
+        list: One dict per configuration with "label", "resize_ms", "encode_ms",
+              "images_per_s", "kb" (mean output size) and "psnr" (mean dB).
+    """
+    from autocrop import draft_scale
+
+    inputs = []
+    for path in paths:
+        with Image.open(path) as image:
+            box = _center_box(*image.size, target_width, target_height)
+            reference = np.asarray(image.convert("RGB").resize((target_width, target_height), Image.Resampling.LANCZOS, box=box))
+
+        image = Image.open(path)
+        orig_width, orig_height = image.size
+        scale = draft_scale(box[2] - box[0], box[3] - box[1], target_width, target_height) if draft else 1
+        if scale > 1:
+            image.draft(image.mode, (-(-orig_width // scale), -(-orig_height // scale)))
+        image.load()
+        scale_x, scale_y = image.size[0] / orig_width, image.size[1] / orig_height
+        inputs.append((image, (box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y), reference))
+
+    results = []
+    for label, backend in configurations:
+        resize_seconds = encode_seconds = 0.0
+        sizes = []
+        scores = []
+        for image, box, reference in inputs:
+            start = time.perf_counter()
+            resized = backend.resize(image, (target_width, target_height), box)
+            middle = time.perf_counter()
+            output = io.BytesIO()
+            backend.save(resized, output, "JPEG")
+            end = time.perf_counter()
+            resize_seconds += middle - start
+            encode_seconds += end - middle
+            sizes.append(output.tell())
+            output.seek(0)
+            scores.append(psnr(reference, np.asarray(Image.open(output).convert("RGB"))))
+        count = len(inputs)
+        results.append({
+            "label": label,
+            "resize_ms": resize_seconds / count * 1000,
+            "encode_ms": encode_seconds / count * 1000,
+            "images_per_s": count / (resize_seconds + encode_seconds),
+            "kb": sum(sizes) / count / 1000,
+            "psnr": sum(scores) / count,
+        })
+    return results
+
+def default_configurations(quality=75):
+    """The configurations compared by `python image_backends.py`."""
+    configurations = [
+        ("pillow (autocrop default)", PillowBackend(quality=quality)),
+        ("pillow reducing_gap=3", PillowBackend(reducing_gap=3.0, quality=quality)),
+        ("pillow reducing_gap=2", PillowBackend(reducing_gap=2.0, quality=quality)),
+        ("pillow bilinear gap=2", PillowBackend("bilinear", 2.0, quality=quality)),
+        ("pillow lanczos", PillowBackend("lanczos", quality=quality)),
+        ("pillow optimize", PillowBackend(quality=quality, optimize=True)),
+        ("pillow progressive", PillowBackend(quality=quality, progressive=True)),
+        ("pillow 4:4:4", PillowBackend(quality=quality, subsampling="4:4:4")),
+    ]
+    if "vips" in available_backends():
+        configurations.append(("vips", VipsBackend(quality=quality)))
+        configurations.append(("vips lanczos", VipsBackend("lanczos", quality=quality)))
+    return configurations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare resize/encode backends by throughput and PSNR.")
+    parser.add_argument("image_dir", nargs="?", default=None,
+                        help="Directory of JPEGs to use. Defaults to a synthetic set (see benchmark.py).")
+    parser.add_argument("--target", default="640x480", metavar="WIDTHxHEIGHT", help="Output size.")
+    parser.add_argument("--images", type=int, default=20, help="Number of images (synthetic set, or first N of IMAGE_DIR).")
+    parser.add_argument("--size", default="4000x3000", metavar="WIDTHxHEIGHT", help="Size of the synthetic images.")
+    parser.add_argument("--quality", type=int, default=75, help="JPEG quality.")
+    parser.add_argument("--no-draft", dest="draft", action="store_false", help="Decode JPEGs at full size.")
+    parser.add_argument("--check", action="store_true", help="Only check that every available backend can be pickled into worker jobs.")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_pickle() else 1)
+
+    target_width, target_height = (int(value) for value in args.target.lower().split("x"))
+    directory = None
+    if args.image_dir is None:
+        import tempfile
+        from benchmark import generate_dataset
+        directory = tempfile.mkdtemp(prefix="image_backends_")
+        width, height = (int(value) for value in args.size.lower().split("x"))
+        paths = [image_path for image_path, _ in generate_dataset(directory, args.images, width, height, 5, 24, 0.3)]
+    else:
+        paths = sorted(os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+                       if name.lower().endswith((".jpg", ".jpeg")))[:args.images]
+
+    print(f"Pillow {PIL.__version__}, backends available: {', '.join(available_backends())}")
+    print(f"{len(paths)} images -> {target_width}x{target_height}, draft decoding {'on' if args.draft else 'off'}")
+    print(f"{'configuration':<28}{'resize ms':>10}{'encode ms':>10}{'images/s':>10}{'KB':>8}{'PSNR dB':>9}")
+    for result in compare_backends(paths, target_width, target_height, default_configurations(args.quality), args.draft):
+        print(f"{result['label']:<28}{result['resize_ms']:>10.2f}{result['encode_ms']:>10.2f}"
+              f"{result['images_per_s']:>10.1f}{result['kb']:>8.1f}{result['psnr']:>9.2f}")
+
+    if directory is not None:
+        import shutil
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,97 @@
+import io
+import shutil
+import subprocess
+
+# Lossless JPEG cropping: cut a region out of a JPEG by copying its DCT blocks,
+# without decoding to pixels and encoding again. This is what jpegtran -crop
+# does. It takes a few milliseconds even on 4K images and adds no generation
+# loss, but only works when nothing is resized and the left and top edges of
+# the crop fall on MCU (minimum coded unit) boundaries: 8 pixels, or 16 along
+# chroma-subsampled axes (16x16 for the common 4:2:0). The right and bottom
+# edges can be anywhere.
+#
+# Two engines are supported, whichever is installed: PyTurboJPEG, which runs
+# libjpeg-turbo's transform in-process, or the jpegtran command line tool.
+# Without either, callers decode and re-encode as usual.
+
+def mcu_size(image):
+    """
+    MCU size of an opened JPEG, from its header.
+
+    Args:
+        image (PIL.Image): Image as returned by Image.open.
+
+    Returns:
+        tuple: (width, height) in pixels, or None if the image is not a JPEG.
+    """
+    if image.format != "JPEG" or not getattr(image, "layer", None):
+        return None
+    if len(image.layer) == 1:
+        # Single-component scans always use 8x8 blocks
+        return 8, 8
+    return 8 * max(h for _, h, _, _ in image.layer), 8 * max(v for _, _, v, _ in image.layer)
+
+def is_aligned(left, top, block):
+    """True if a crop whose left and top edges are at left and top pixels can be done losslessly."""
+    return block is not None and left % block[0] == 0 and top % block[1] == 0
+
+def available_engine():
+    """
+    Name of the installed lossless crop engine: "turbojpeg", "jpegtran" or None.
+    """
+    try:
+        import turbojpeg  # noqa: F401
+        return "turbojpeg"
+    except ImportError:
+        pass
+    # PyTurboJPEG imports but fails without the libturbojpeg library; that
+    # surfaces in lossless_crop, which callers treat as a fallback
+    if shutil.which("jpegtran"):
+        return "jpegtran"
+    return None
+
+_turbojpeg = None
+
+def lossless_crop(data, left, top, width, height, engine=None):
+    """
+    Crop JPEG data without re-encoding it. Metadata (EXIF, comments) is
+    dropped, as when Pillow saves a JPEG.
+
+    Args:
+        data (bytes): The JPEG file.
+        left (int): Left edge of the crop, a multiple of the MCU width.
+        top (int): Top edge of the crop, a multiple of the MCU height.
+        width (int): Width of the crop.
+        height (int): Height of the crop.
+        engine (str): "turbojpeg" or "jpegtran". Defaults to available_engine().
+
+    Returns:
+        bytes: The cropped JPEG file.
+    """
+    global _turbojpeg
+    engine = engine or available_engine()
+    if engine == "turbojpeg":
+        if _turbojpeg is None:
+            from turbojpeg import TurboJPEG
+            _turbojpeg = TurboJPEG()
+        return _turbojpeg.crop(data, left, top, width, height, copynone=True)
+    if engine == "jpegtran":
+        result = subprocess.run(["jpegtran", "-copy", "none", "-crop", f"{width}x{height}+{left}+{top}"],
+                                input=data, capture_output=True, check=True)
+        return result.stdout
+    raise RuntimeError("no lossless JPEG crop engine installed (PyTurboJPEG or jpegtran)")
+
+def read_bytes(source):
+    """Contents of a path or of a BytesIO, e.g. an input prefetched into memory."""
+    if isinstance(source, io.BytesIO):
+        return source.getvalue()
+    with open(source, "rb") as file:
+        return file.read()
+
+def write_bytes(target, data):
+    """Write data to a path or a file object."""
+    if hasattr(target, "write"):
+        target.write(data)
+        return
+    with open(target, "wb") as file:
+        file.write(data)
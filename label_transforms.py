@@ -0,0 +1,204 @@
+import numpy as np
+
+# Vectorized YOLO coordinate transforms shared by the label tools.
+#
+# Labels are handled in the same columnar layout as a label store:
+#
+#   class_ids       (objects,)      class index of each object
+#   vertex_offsets  (objects + 1,)  vertex range of each object in coords
+#   coords          (vertices, 2)   x, y pairs
+#
+# A transform is a function from a coords array to a new coords array, so one
+# call handles every polygon of a file, or of a whole batch of files. The
+# helpers below build the usual transforms; compose() chains them. Each
+# transform performs the same float operations, in the same order, as the
+# per-vertex loops it replaces, so results are bit-for-bit identical.
+#
+# Parameters may be plain numbers or per-vertex arrays of shape (vertices,)
+# (see per_vertex), to transform many files with different sizes at once.
+
+def pack(objects, dtype=np.float64):
+    """
+    Convert (class_index, points) tuples, as returned by autocrop.load_label,
+    to (class_ids, vertex_offsets, coords) arrays.
+    """
+    class_ids = np.array([class_index for class_index, _ in objects], dtype=np.int64)
+    counts = [len(points) // 2 for _, points in objects]
+    vertex_offsets = np.zeros(len(objects) + 1, dtype=np.int64)
+    np.cumsum(counts, out=vertex_offsets[1:])
+    coords = np.fromiter(
+        (value for _, points in objects for value in points[:2 * (len(points) // 2)]),
+        dtype=dtype,
+        count=2 * int(vertex_offsets[-1]),
+    ).reshape(-1, 2)
+    return class_ids, vertex_offsets, coords
+
+def unpack(class_ids, vertex_offsets, coords):
+    """Inverse of pack: (class_index, points) tuples with points as a flat list of floats."""
+    flat = np.asarray(coords).reshape(-1).tolist()
+    offsets = np.asarray(vertex_offsets).tolist()
+    return [
+        (int(class_id), flat[2 * start:2 * end])
+        for class_id, start, end in zip(np.asarray(class_ids).tolist(), offsets[:-1], offsets[1:])
+    ]
+
+def per_vertex(values, vertex_offsets):
+    """Repeat one value per object (or per file, given file-level offsets) for each of its vertices."""
+    return np.repeat(np.asarray(values), np.diff(vertex_offsets))
+
+def _column(value):
+    # Per-vertex parameters have to broadcast against a single coordinate column
+    return value if np.ndim(value) == 0 else np.asarray(value)
+
+def _per_axis(x_function, y_function):
+    def transform(coords):
+        coords = np.asarray(coords)
+        result = np.array(coords, dtype=coords.dtype if coords.dtype.kind == "f" else np.float64)
+        if x_function is not None:
+            result[:, 0] = x_function(result[:, 0])
+        if y_function is not None:
+            result[:, 1] = y_function(result[:, 1])
+        return result
+    return transform
+
+def compose(*transforms):
+    """Chain transforms, applying them left to right."""
+    def transform(coords):
+        for step in transforms:
+            coords = step(coords)
+        return coords
+    return transform
+
+def denormalize(width, height):
+    """Normalized (0..1) coordinates to pixels."""
+    width, height = _column(width), _column(height)
+    return _per_axis(lambda x: x * width, lambda y: y * height)
+
+def normalize(width, height):
+    """Pixel coordinates to normalized (0..1) coordinates."""
+    width, height = _column(width), _column(height)
+    return _per_axis(lambda x: x / width, lambda y: y / height)
+
+def translate(dx, dy):
+    """Shift coordinates. An axis with a shift of exactly 0 is left untouched."""
+    dx, dy = _column(dx), _column(dy)
+    return _per_axis(
+        None if np.ndim(dx) == 0 and dx == 0 else lambda x: x + dx,
+        None if np.ndim(dy) == 0 and dy == 0 else lambda y: y + dy,
+    )
+
+def scale(sx, sy):
+    """Multiply coordinates by per-axis factors."""
+    sx, sy = _column(sx), _column(sy)
+    return _per_axis(lambda x: x * sx, lambda y: y * sy)
+
+def clip(x_min, y_min, x_max, y_max):
+    """Clamp every vertex into a rectangle."""
+    x_min, y_min, x_max, y_max = map(_column, (x_min, y_min, x_max, y_max))
+    return _per_axis(lambda x: np.minimum(np.maximum(x, x_min), x_max),
+                     lambda y: np.minimum(np.maximum(y, y_min), y_max))
+
+def flip_horizontal():
+    """Mirror normalized coordinates left to right."""
+    return _per_axis(lambda x: 1 - x, None)
+
+def flip_vertical():
+    """Mirror normalized coordinates top to bottom."""
+    return _per_axis(None, lambda y: 1 - y)
+
+def _crop_axis(before, after, size):
+    # Normalized coordinate after removing `before` pixels in front and `after` behind
+    if np.ndim(before) == 0 and np.ndim(after) == 0 and before == 0 and after == 0:
+        return None
+    before, after, size = map(_column, (before, after, size))
+    return lambda v: (v * size - before) / (size - before - after)
+
+def _pad_axis(before, after, size):
+    # Normalized coordinate after adding `before` pixels in front and `after` behind
+    if np.ndim(before) == 0 and np.ndim(after) == 0 and before == 0 and after == 0:
+        return None
+    before, after, size = map(_column, (before, after, size))
+    return lambda v: (v * size + before) / (size + before + after)
+
+def crop(left, top, right, bottom, width, height):
+    """
+    Normalized coordinates of an image to normalized coordinates of a crop of it.
+
+    Args:
+        left, top, right, bottom: Pixels removed from each side.
+        width, height: Size of the image before cropping.
+    """
+    return _per_axis(_crop_axis(left, right, width), _crop_axis(top, bottom, height))
+
+def pad(left, top, right, bottom, width, height):
+    """
+    Normalized coordinates of an image to normalized coordinates of the image
+    with borders added.
+
+    Args:
+        left, top, right, bottom: Pixels added on each side.
+        width, height: Size of the image before padding.
+    """
+    return _per_axis(_pad_axis(left, right, width), _pad_axis(top, bottom, height))
+
+def letterbox_padding(width, height, target_width, target_height):
+    """
+    Borders that centre an image scaled to fit target_width x target_height.
+
+    Returns:
+        tuple: (scaled_width, scaled_height, left, top, right, bottom) in target pixels.
+    """
+    ratio = min(target_width / width, target_height / height)
+    scaled_width = min(target_width, round(width * ratio))
+    scaled_height = min(target_height, round(height * ratio))
+    left = (target_width - scaled_width) // 2
+    top = (target_height - scaled_height) // 2
+    return scaled_width, scaled_height, left, top, target_width - scaled_width - left, target_height - scaled_height - top
+
+def letterbox(width, height, target_width, target_height):
+    """Normalized coordinates of an image to those of its letterboxed (scaled to fit and padded) version."""
+    scaled_width, scaled_height, left, top, right, bottom = letterbox_padding(width, height, target_width, target_height)
+    # Scaling does not move normalized coordinates; only the padding does
+    return pad(left, top, right, bottom, scaled_width, scaled_height)
+
+def bboxes(vertex_offsets, coords):
+    """
+    Bounding box of every polygon, in YOLO box format.
+
+    Returns:
+        numpy.ndarray: (objects, 4) array of (center_x, center_y, width, height).
+                       Objects without vertices get an all-NaN row.
+    """
+    vertex_offsets = np.asarray(vertex_offsets)
+    coords = np.asarray(coords)
+    result = np.full((len(vertex_offsets) - 1, 4), np.nan)
+    nonempty = np.diff(vertex_offsets) > 0
+    if not np.any(nonempty):
+        return result
+
+    starts = vertex_offsets[:-1][nonempty]
+    x_coords = coords[:, 0]
+    y_coords = coords[:, 1]
+    x_min = np.minimum.reduceat(x_coords, starts)
+    x_max = np.maximum.reduceat(x_coords, starts)
+    y_min = np.minimum.reduceat(y_coords, starts)
+    y_max = np.maximum.reduceat(y_coords, starts)
+
+    result[nonempty] = np.stack([(x_min + x_max) / 2, (y_min + y_max) / 2, x_max - x_min, y_max - y_min], axis=1)
+    return result
+
+def objects_to_bboxes(objects):
+    """
+    Replace the polygons of (class_index, points) tuples by their YOLO boxes.
+
+    Returns:
+        list: (class_index, [center_x, center_y, width, height]) tuples.
+              Objects without coordinates have no box and are dropped.
+    """
+    class_ids, vertex_offsets, coords = pack(objects)
+    result = bboxes(vertex_offsets, coords)
+    return [
+        (class_id, bbox)
+        for class_id, bbox in zip(class_ids.tolist(), result.tolist())
+        if not np.isnan(bbox[0])
+    ]
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+# Run manifest for incremental autocrop runs.
+#
+# The manifest is a JSON lines file in the output directory with one record
+# per processed image:
+#
+#   {"image": "apples.jpg", "digest": "...", "stats": [[size, mtime_ns], ...],
+#    "settings": {"width": 300, ...}, "crop": [left, right, top, bottom],
+#    "outputs": ["./output/images/apples.jpg", ...]}
+#
+# Records are appended as soon as an image is done, so an interrupted run
+# keeps everything it finished. When an image is seen again, later lines
+# replace earlier ones, and {"image": ..., "removed": true} drops it. The file
+# is rewritten without superseded lines at the end of each run.
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+def load_manifest(path):
+    """
+    Load a manifest written by ManifestWriter.
+
+    Args:
+        path (str): Path to the manifest file.
+
+    Returns:
+        dict: Latest record for every image name. Empty if the file does not exist.
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partially written last line after a crash
+                continue
+            if record.get("removed"):
+                records.pop(record["image"], None)
+            else:
+                records[record["image"]] = record
+    return records
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _digest(paths, settings):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    for path in paths:
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def fingerprint(paths, settings, previous=None, stats=None):
+    """
+    Fingerprint a set of input files together with the run settings.
+
+    Files are only hashed when their size or modification time differs from
+    the previous record, so unchanged datasets are checked with stat calls.
+
+    Args:
+        paths (list): Input file paths (image and label).
+        settings (dict): Settings that change the output, e.g. target size.
+        previous (dict): Previous manifest record for the same image, if any.
+        stats (list): [size, mtime_ns] of each path if already known, e.g.
+                      from a DatasetIndex, so the files are not stat'ed again.
+
+    Returns:
+        dict: "digest", "stats" and "settings" fields for a manifest record.
+    """
+    if stats is None:
+        stats = [_file_stat(path) for path in paths]
+    if previous is not None and previous.get("stats") == stats and previous.get("settings") == settings:
+        return {"digest": previous["digest"], "stats": stats, "settings": settings}
+    return {"digest": _digest(paths, settings), "stats": stats, "settings": settings}
+
+def is_up_to_date(previous, current):
+    """True if previous was produced from the same inputs and its outputs still exist."""
+    if previous is None or previous.get("digest") != current["digest"]:
+        return False
+    return all(os.path.exists(path) for path in previous.get("outputs", []))
+
+def remove_outputs(record):
+    """Delete the output files listed in a manifest record."""
+    for path in record.get("outputs", []):
+        if os.path.exists(path):
+            os.remove(path)
+
+class ManifestWriter:
+    """Appends manifest records, flushing each one so a crash loses nothing finished."""
+
+    def __init__(self, path, records):
+        self.path = path
+        self.records = records
+        self.file = open(path, "a")
+
+    def add(self, record):
+        self.records[record["image"]] = record
+        self._append(record)
+
+    def remove(self, image):
+        self.records.pop(image, None)
+        self._append({"image": image, "removed": True})
+
+    def _append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """Rewrite the manifest with only the latest record for each image."""
+        self.file.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            for image in sorted(self.records):
+                file.write(json.dumps(self.records[image]) + "\n")
+        os.replace(temp_path, self.path)
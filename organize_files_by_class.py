@@ -1,31 +1,31 @@
+import argparse
 import os
 import shutil
+from dataset_index import open_index
 
 image_dir="./images"
 label_dir="./labels"
 
-def organize_images():
+def organize_images(index_path=None):
+    # Images and their label files, from one scan of each directory (or a
+    # saved index that is still current)
+    index = open_index(image_dir, label_dir, index_path)
+
     # Define the directory where images without a class will go
     no_class_dir = os.path.join(image_dir, "no_class")
     os.makedirs(no_class_dir, exist_ok=True)
 
-    # List all files in the images directory
-    for image_file in os.listdir(image_dir):
-        image_path = os.path.join(image_dir, image_file)
-
-        # Skip if not a file
-        if not os.path.isfile(image_path):
-            continue
-
-        # Build the corresponding label file path
-        label_file = os.path.splitext(image_file)[0] + ".txt"
-        label_path = os.path.join(label_dir, label_file)
+    for stem in index.images():
+        image_file = index.entries[stem]["image"]
+        image_path = index.image_path(stem)
+        label_file = index.entries[stem]["label"]
+        label_path = index.label_path(stem)
 
         # Default target directory for images with no class
         target_dir = no_class_dir
 
         # Check if the label file exists
-        if os.path.exists(label_path):
+        if label_path is not None:
             try:
                 # Read the first character (class integer) from the label file
                 with open(label_path, "r") as lf:
@@ -48,4 +48,8 @@ def organize_images():
     print("Image organization complete.")
 
 if __name__ == "__main__":
-    organize_images()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Move images into one subdirectory per class, from the first object of their label file.")
+    parser.add_argument("--index", metavar="INDEX_FILE",
+                        help="Reuse the dataset index in INDEX_FILE while the directories are unchanged, and save it there.")
+    args = parser.parse_args()
+    organize_images(args.index)
\ No newline at end of file
@@ -0,0 +1,115 @@
+from PIL import Image
+from PIL import ImageDraw
+import label_transforms as transforms
+from label_store import load_from_store, parse_label_text
+
+# Polygon overlay renderer shared by preview.py, preview_all.py and
+# autocrop.generate_debug_image.
+#
+# All polygons are drawn onto one copy of the image, which is then blended
+# with the original once. Pixels outside every polygon blend with themselves
+# and keep their exact value, and pixels inside a single polygon get the same
+# 50% tint as blending once per polygon did, so non-overlapping masks look
+# identical to the old per-polygon blending at a fraction of the cost.
+# Where polygons overlap, the pixel gets a single 50% tint in the colour of
+# the polygon drawn last (the later line of the label file).
+
+DEFAULT_COLOR = "green"
+
+# Distinct colours for --class-colors, indexed by class modulo the length
+CLASS_COLORS = (
+    "green", "red", "blue", "yellow", "magenta", "cyan", "orange", "purple",
+    "lime", "pink", "teal", "brown", "navy", "olive", "maroon", "white",
+)
+
+def class_color(class_index):
+    """Colour used for a class when polygons are coloured by class."""
+    return CLASS_COLORS[class_index % len(CLASS_COLORS)]
+
+def render_overlay(img, objects, color_by_class=False, alpha=0.5):
+    """
+    Draw label polygons over an image.
+
+    Args:
+        img (PIL.Image): Image to draw on. It is not modified.
+        objects (list): (class_index, points) tuples with normalized points, as
+                        returned by autocrop.load_label.
+        color_by_class (bool): Colour each polygon by class instead of all green.
+        alpha (float): Opacity of the polygon fill.
+
+    Returns:
+        PIL.Image: RGBA image with the polygons blended in.
+    """
+    img = img.convert('RGBA')
+    width, height = img.size
+
+    # Convert from percentages to actual pixel values, truncated to ints
+    class_ids, vertex_offsets, coords = transforms.pack(objects)
+    pixels = transforms.denormalize(width, height)(coords).astype(int).tolist()
+    offsets = vertex_offsets.tolist()
+
+    polygon_image = img.copy()
+    draw = ImageDraw.Draw(polygon_image)
+    for class_index, start, end in zip(class_ids.tolist(), offsets[:-1], offsets[1:]):
+        if end == start:
+            continue
+        fill = class_color(class_index) if color_by_class else DEFAULT_COLOR
+        draw.polygon([tuple(point) for point in pixels[start:end]], fill=fill)
+
+    return Image.blend(img, polygon_image, alpha)
+
+def render_thumbnail(img, objects, size, color_by_class=False):
+    """
+    Draw label polygons over a thumbnail of an image.
+
+    The image is shrunk to fit in size x size before drawing, so the overlay
+    is rasterized at thumbnail resolution. JPEGs are decoded at a reduced
+    scale by Image.thumbnail (via draft) instead of at full resolution.
+
+    Args:
+        img (PIL.Image): Freshly opened image. It is shrunk in place.
+        objects (list): (class_index, points) tuples with normalized points.
+        size (int): Maximum width and height of the thumbnail.
+        color_by_class (bool): Colour each polygon by class instead of all green.
+
+    Returns:
+        PIL.Image: RGB thumbnail with the polygons blended in.
+    """
+    img.thumbnail((size, size))
+    return render_overlay(img, objects, color_by_class).convert("RGB")
+
+def _job_objects(job):
+    objects = job.get("objects")
+    if objects is None:
+        label_path = job["label_path"]
+        if isinstance(label_path, tuple):
+            # (store path, name): loaded here so a missing name fails this job only
+            return load_from_store(*label_path)
+        with open(label_path) as polygons:
+            objects = parse_label_text(polygons.read())
+    return objects
+
+def render_job(job):
+    """
+    Render one preview described by a job dict (runs in a worker process).
+
+    The job has "image_path", "objects" (or "label_path": a .txt path or a
+    (label store path, name) tuple), "output_path" and optionally
+    "color_by_class".
+    """
+    objects = _job_objects(job)
+    with Image.open(job["image_path"]) as img:
+        preview = render_overlay(img, objects, job.get("color_by_class", False))
+    preview.save(job["output_path"])
+
+def thumbnail_job(job):
+    """
+    Render one preview thumbnail described by a job dict (runs in a worker process).
+
+    The job has "image_path", "objects" (or "label_path", as for
+    render_job), "thumbnail_size" and optionally "color_by_class". The thumbnail is returned rather than
+    saved, for the caller to place on a contact sheet.
+    """
+    objects = _job_objects(job)
+    with Image.open(job["image_path"]) as img:
+        return render_thumbnail(img, objects, job["thumbnail_size"], job.get("color_by_class", False))
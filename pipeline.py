@@ -0,0 +1,431 @@
+import argparse
+import os
+import sys
+from contextlib import nullcontext
+import numpy as np
+from PIL import Image
+import label_transforms as transforms
+from autocrop import FIT_METHODS, autocrop_image
+from batch import default_workers, print_failures, run_batch
+from crop_search import SEARCH_METHODS
+from image_backends import add_backend_arguments, backend_from_args
+from label_store import StoreWriter, format_label_text, is_store, load_from_store, open_labels, parse_label_text
+from polygon_clip import CLIP_METHODS
+from polygon_simplify import simplify_objects
+
+# Chain dataset preparation steps over in-memory (image, labels) records, so
+# that each image is decoded once and encoded once no matter how many steps
+# run, instead of every script writing a full set of JPEGs and .txt files for
+# the next one to read back:
+#
+#   python pipeline.py ./images ./labels ./out/images ./out/labels \
+#       --stage crop:0,100,0,100 --stage autocrop:640x480 --stage greyscale --stage boxes
+#
+#   python pipeline.py ./images ./labels ./out/images ./out/labels --stage letterbox:800x800
+#
+# A stage is a picklable callable taking a Record and returning it (changed in
+# place or replaced), or None to drop the record. convert_to_greyscale.py and
+# convert_yolo_polygons_to_boxes.py are wrappers running a single stage over
+# images without labels and labels without images respectively. Images are opened lazily, so
+# a stage that can decode at reduced size (autocrop) does so when it is the
+# first to touch the pixels. With --workers each record runs through all
+# stages in one worker process, and at most a few records per worker are in
+# flight at a time.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+
+class Record:
+    """
+    One image and its labels on their way through a pipeline.
+
+    Args:
+        name (str): Label name (the image filename without extension).
+        filename (str): Image filename, used for the output image.
+        image (PIL.Image): Image, possibly opened but not yet decoded, or None
+                           when only labels are processed.
+        objects (list): (class_index, points) tuples with normalized points.
+                        Empty when only images are processed.
+    """
+
+    def __init__(self, name, filename, image, objects):
+        self.name = name
+        self.filename = filename
+        self.image = image
+        self.objects = objects
+
+class FixedCrop:
+    """Remove a fixed number of pixels from each side."""
+
+    def __init__(self, left, top, right, bottom):
+        self.amounts = (left, top, right, bottom)
+
+    def __call__(self, record):
+        left, top, right, bottom = self.amounts
+        width, height = record.image.size
+        if left + right >= width or top + bottom >= height:
+            raise ValueError(f"cannot crop {self.amounts} from a {width}x{height} image")
+
+        record.image = record.image.crop((left, top, width - right, height - bottom))
+        class_ids, vertex_offsets, coords = transforms.pack(record.objects)
+        coords = transforms.crop(left, top, right, bottom, width, height)(coords)
+        record.objects = transforms.unpack(class_ids, vertex_offsets, coords)
+        return record
+
+class Pad:
+    """Add black borders of a fixed number of pixels to each side."""
+
+    def __init__(self, left, top, right, bottom):
+        self.amounts = (left, top, right, bottom)
+
+    def __call__(self, record):
+        left, top, right, bottom = self.amounts
+        width, height = record.image.size
+
+        padded = Image.new(record.image.mode, (left + width + right, top + height + bottom))
+        padded.paste(record.image, (left, top))
+        record.image = padded
+        class_ids, vertex_offsets, coords = transforms.pack(record.objects)
+        coords = transforms.pad(left, top, right, bottom, width, height)(coords)
+        record.objects = transforms.unpack(class_ids, vertex_offsets, coords)
+        return record
+
+class AutoCrop:
+    """
+    Crop to the target aspect ratio losing as little labelled area as
+    possible, or letterbox to it depending on fit, then resize (see autocrop.py).
+    """
+
+    def __init__(self, width, height, search="profile", draft=True, clip="exact", backend=None, fit="crop", pad_threshold=0.01):
+        self.width = width
+        self.height = height
+        self.search = search
+        self.draft = draft
+        self.clip = clip
+        self.backend = backend
+        self.fit = fit
+        self.pad_threshold = pad_threshold
+
+    def __call__(self, record):
+        record.image, record.objects, _ = autocrop_image(record.image, record.objects, self.width, self.height,
+                                                         self.search, self.draft, clip=self.clip, backend=self.backend,
+                                                         fit=self.fit, pad_threshold=self.pad_threshold)
+        return record
+
+class Simplify:
+    """Drop polygon vertices that move the outline by less than tolerance pixels of the current image (see polygon_simplify.py)."""
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+
+    def __call__(self, record):
+        width, height = record.image.size
+        record.objects, _ = simplify_objects(record.objects, self.tolerance, width, height)
+        return record
+
+def greyscale_reference(img):
+    """Per-pixel reference implementation of greyscale. Slow; used by Greyscale(verify=True)."""
+    img = img.convert("RGB")
+
+    # Extract the greyscale intensity
+    pixels = img.load()
+    for y in range(img.height):
+        for x in range(img.width):
+            r, g, b = pixels[x, y]
+            gray = int(0.299 * r + 0.587 * g + 0.114 * b)  # Standard greyscale formula
+            pixels[x, y] = (gray, gray, gray)  # Set RGB channels to the same value
+    return img
+
+def greyscale(img):
+    """
+    Convert an image to greyscale, returned as 3-channel RGB.
+
+    Uses the same BT.601 weights, float64 arithmetic in the same order and the
+    same truncation as greyscale_reference, so the output is byte-identical.
+    Pillow's convert("L") rounds instead of truncating, so it is not used.
+    """
+    rgb = np.asarray(img.convert("RGB"), dtype=np.float64)
+    gray = (0.299 * rgb[..., 0] + 0.587 * rgb[..., 1] + 0.114 * rgb[..., 2]).astype(np.uint8)
+    channel = Image.fromarray(gray, "L")
+    return Image.merge("RGB", (channel, channel, channel))
+
+class Greyscale:
+    """
+    Convert to greyscale, kept as 3-channel RGB. With verify, also run the
+    per-pixel reference conversion and fail if the result differs.
+    """
+
+    def __init__(self, verify=False):
+        self.verify = verify
+
+    def __call__(self, record):
+        image = greyscale(record.image)
+        if self.verify and image.tobytes() != greyscale_reference(record.image).tobytes():
+            raise ValueError("vectorized output differs from the reference conversion")
+        record.image = image
+        return record
+
+class BoundingBoxes:
+    """Replace polygons by YOLO center/size boxes."""
+
+    def __call__(self, record):
+        record.objects = transforms.objects_to_bboxes(record.objects)
+        return record
+
+def _amounts(text):
+    values = [int(value) for value in text.split(",")]
+    if len(values) != 4:
+        raise ValueError(f"expected LEFT,TOP,RIGHT,BOTTOM, got {text}")
+    return values
+
+def _size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+def parse_stage(spec, search="profile", draft=True, clip="exact", backend=None, fit="crop", pad_threshold=0.01):
+    """
+    Build a stage from its command line form.
+
+    Args:
+        spec (str): "crop:LEFT,TOP,RIGHT,BOTTOM", "pad:LEFT,TOP,RIGHT,BOTTOM",
+                    "autocrop:WIDTHxHEIGHT", "letterbox:WIDTHxHEIGHT",
+                    "simplify:PIXELS", "greyscale" or "boxes".
+        search (str): Crop search engine for autocrop stages.
+        draft (bool): Allow reduced-size JPEG decoding in autocrop stages.
+        clip (str): How autocrop stages cut polygons at the crop, "exact" or "clamp".
+        backend (PillowBackend): Resize backend for autocrop stages (see image_backends.py).
+        fit (str): "crop", "pad" or "hybrid" for autocrop stages (see autocrop.FIT_METHODS).
+                   letterbox stages always pad.
+        pad_threshold (float): Lost area fraction above which "hybrid" pads.
+    """
+    name, _, argument = spec.partition(":")
+    if name == "crop":
+        return FixedCrop(*_amounts(argument))
+    if name == "pad":
+        return Pad(*_amounts(argument))
+    if name == "autocrop":
+        return AutoCrop(*_size(argument), search, draft, clip, backend, fit, pad_threshold)
+    if name == "letterbox":
+        return AutoCrop(*_size(argument), search, draft, clip, backend, "pad")
+    if name == "simplify":
+        return Simplify(float(argument))
+    if name == "greyscale":
+        return Greyscale()
+    if name == "boxes":
+        return BoundingBoxes()
+    raise ValueError(f"unknown stage: {spec}")
+
+def run_stages(record, stages):
+    """Apply the stages to one record; returns None if a stage dropped it."""
+    for stage in stages:
+        record = stage(record)
+        if record is None:
+            return None
+    return record
+
+def read_records(image_dir, labels):
+    """
+    Lazily yield a Record for every image that has labels.
+
+    Images are opened but not decoded; labels is a directory of .txt files or
+    a label store.
+    """
+    source = open_labels(labels)
+    for filename in sorted(os.listdir(image_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        name = os.path.splitext(filename)[0]
+        if name not in source:
+            continue
+        yield Record(name, filename, Image.open(os.path.join(image_dir, filename)), source.load(name))
+
+def stream(records, stages):
+    """
+    Run records through the stages in this process, yielding each result as
+    soon as it is ready. Only one record is held at a time.
+    """
+    for record in records:
+        record = run_stages(record, stages)
+        if record is not None:
+            yield record
+
+def save_image(image, path, quality=75, backend=None):
+    """
+    Encode an image once, in the format given by the file extension.
+
+    JPEGs are encoded by backend (see image_backends.py) if given, otherwise
+    by Pillow at the given quality.
+    """
+    if path.lower().endswith((".jpg", ".jpeg")):
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if backend is not None:
+            backend.save(image, path, "JPEG")
+        else:
+            image.save(path, quality=quality)
+    else:
+        image.save(path)
+
+def write_record(record, image_dir, label_dir, precision=6, quality=75, backend=None):
+    """Write the image of a record unless image_dir is None, and its labels unless label_dir is None."""
+    if image_dir is not None:
+        save_image(record.image, os.path.join(image_dir, record.filename), quality, backend)
+    if label_dir is not None:
+        with open(os.path.join(label_dir, record.name + ".txt"), "w") as file:
+            file.write(format_label_text(record.objects, precision))
+
+def pipeline_job(job):
+    """
+    Read, transform and write one image described by a job dict (runs in a worker process).
+
+    Returns:
+        list: The output objects if they go to a label store (written by the
+              main process), True if the record was written, False if a
+              stage dropped it.
+    """
+    label_path = job["label_path"]
+    if label_path is None:
+        objects = []
+    elif isinstance(label_path, tuple):
+        objects = load_from_store(*label_path)
+    else:
+        with open(label_path, "r") as file:
+            objects = parse_label_text(file.read())
+
+    image_path = job["image_path"]
+    with Image.open(image_path) if image_path is not None else nullcontext() as image:
+        record = run_stages(Record(job["name"], job["filename"], image, objects), job["stages"])
+        if record is None:
+            return False
+        write_record(record, job["output_image_dir"], job["output_label_dir"], job["precision"], job["quality"], job["backend"])
+
+    return record.objects if job["store_labels"] else True
+
+def describe_job(job):
+    return job["filename"] or job["name"] + ".txt"
+
+def run_pipeline(image_dir, labels, output_image_dir, output_labels, stages, workers=1, precision=6, quality=75, backend=None):
+    """
+    Run every image with labels through the stages and write the results.
+
+    Either side can be left out: with labels and output_labels None every
+    image is processed without labels, and with image_dir and
+    output_image_dir None every label file is processed without an image.
+
+    Args:
+        image_dir (str): Input image directory, or None.
+        labels (str): Input label directory or label store, or None.
+        output_image_dir (str): Output image directory, or None.
+        output_labels (str): Output label directory or label store, or None.
+        stages (list): Stages, applied in order.
+        workers (int): Number of worker processes.
+        precision (int): Decimal places in output .txt labels, or None for the
+                         shortest text that reads back as the same value.
+                         Defaults to 6, as autocrop.py.
+        quality (int): JPEG quality of the output images.
+        backend (PillowBackend): JPEG encoder (see image_backends.py); its own
+                                 quality replaces quality. None uses Pillow.
+
+    Returns:
+        list: (job, error) tuples for the images that failed.
+    """
+    source = open_labels(labels) if labels is not None else None
+    if output_image_dir is not None:
+        os.makedirs(output_image_dir, exist_ok=True)
+    writer = StoreWriter(output_labels) if output_labels is not None and is_store(output_labels) else None
+    if writer is None and output_labels is not None:
+        os.makedirs(output_labels, exist_ok=True)
+
+    if image_dir is not None:
+        filenames = [filename for filename in sorted(os.listdir(image_dir)) if filename.lower().endswith(IMAGE_EXTENSIONS)]
+        names = [os.path.splitext(filename)[0] for filename in filenames]
+    else:
+        names = list(source.names)
+        filenames = [None] * len(names)
+
+    jobs = []
+    for name, filename in zip(names, filenames):
+        if source is None:
+            label_path = None
+        elif name not in source:
+            print(f"Warning: no labels for {filename}. Skipping.")
+            continue
+        else:
+            label_path = (labels, name) if is_store(labels) else os.path.join(labels, name + ".txt")
+        jobs.append({
+            "name": name,
+            "filename": filename,
+            "image_path": os.path.join(image_dir, filename) if filename is not None else None,
+            "label_path": label_path,
+            "stages": stages,
+            "output_image_dir": output_image_dir,
+            "output_label_dir": None if writer is not None else output_labels,
+            "store_labels": writer is not None,
+            "precision": precision,
+            "quality": quality,
+            "backend": backend,
+        })
+
+    # Labels bound for a store come back to this process; add them in input
+    # order so the store does not depend on the number of workers
+    stored = {}
+    def on_result(job, result):
+        if isinstance(result, list):
+            stored[job["name"]] = result
+
+    failures = run_batch(pipeline_job, jobs, workers, describe=describe_job, on_result=on_result)
+
+    if writer is not None:
+        for job in jobs:
+            if job["name"] in stored:
+                writer.add(job["name"], stored[job["name"]])
+        writer.close()
+    return failures
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run images and YOLO labels through a chain of preparation steps, decoding and encoding each image once.")
+    parser.add_argument("image_dir", type=str, help="Input image directory.")
+    parser.add_argument("labels", type=str, help="Input label directory or label store (.ylbl).")
+    parser.add_argument("output_image_dir", type=str, help="Output image directory.")
+    parser.add_argument("output_labels", type=str, help="Output label directory or label store (.ylbl).")
+    parser.add_argument("--stage", dest="stages", action="append", default=[], metavar="STAGE",
+                        help="Add a stage, in order: crop:LEFT,TOP,RIGHT,BOTTOM, pad:LEFT,TOP,RIGHT,BOTTOM, "
+                             "autocrop:WIDTHxHEIGHT, letterbox:WIDTHxHEIGHT, simplify:PIXELS, greyscale or boxes. Can be repeated.")
+    parser.add_argument("--search", choices=SEARCH_METHODS, default=None,
+                        help="Crop search engine for autocrop stages with --clip clamp (default 'profile'). --clip exact has a search of its own.")
+    parser.add_argument("--no-draft", dest="draft", action="store_false",
+                        help="Always decode JPEGs at full size in autocrop stages.")
+    parser.add_argument("--clip", choices=CLIP_METHODS, default="exact",
+                        help="How autocrop stages cut polygons at the crop: 'exact' clipping or legacy 'clamp'.")
+    parser.add_argument("--fit", choices=FIT_METHODS, default="crop",
+                        help="How autocrop stages reach the aspect ratio: 'crop', 'pad' (letterbox) or 'hybrid' (pad when a crop loses more than --pad-threshold).")
+    parser.add_argument("--pad-threshold", type=float, default=0.01, metavar="FRACTION",
+                        help="Share of the labelled area an autocrop stage may lose before --fit hybrid pads instead.")
+    parser.add_argument("--precision", type=int, default=6,
+                        help="Decimal places in output .txt labels. Defaults to 6, as autocrop.py.")
+    parser.add_argument("--quality", type=int, default=75, help="JPEG quality of the output images.")
+    add_backend_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    args = parser.parse_args()
+    if args.search is not None and args.clip == "exact":
+        parser.error("--search only applies to --clip clamp; exact clipping scores crops with its own search")
+    if args.search is None:
+        args.search = "profile"
+    return args
+
+def main():
+    args = parse_args()
+    backend = backend_from_args(args, args.quality)
+    try:
+        stages = [parse_stage(spec, args.search, args.draft, args.clip, backend, args.fit, args.pad_threshold) for spec in args.stages]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    workers = args.workers if args.workers > 0 else default_workers()
+    failures = run_pipeline(args.image_dir, args.labels, args.output_image_dir, args.output_labels,
+                            stages, workers, args.precision, args.quality, backend)
+    print_failures(failures, describe_job)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+import numpy as np
+import label_transforms as transforms
+
+# Exact rectangle clipping for YOLO polygons, in the columnar layout of
+# label_transforms.py (class_ids, vertex_offsets, coords).
+#
+# Clamping every vertex into the crop window, as the legacy code does, keeps
+# the vertex count but not the geometry: a vertex outside a corner is pulled
+# onto the corner and the polygon gains area that was never inside the
+# window, and runs of clamped vertices collapse onto the window edge as
+# zero-length and collinear edges. Here polygons are clipped
+# Sutherland-Hodgman style, one half-plane at a time, with every polygon of
+# a file handled by the same array operations. Each pass, every vertex
+# emits the intersection of the edge ending in it (if the edge crosses the
+# boundary) followed by itself (if it is inside).
+#
+# For the crop search, the area of a polygon inside a slab u in [a, b] is
+# found without clipping at all: by Green's theorem the signed area of the
+# part of a polygon with u <= c is the line integral of min(u, c) dv along
+# its edges. As a function of the cut c, each edge's integral is linear below
+# the edge, quadratic across it and constant above it, so, as in the
+# "profile" crop search engine (crop_search.py), the pieces of all edges go
+# into coefficient difference arrays over the sorted cuts and one prefix sum
+# gives every polygon's area at every cut (slab_area_profile). slab_areas
+# evaluates every (cut, edge) pair directly and is kept as the reference.
+
+CLIP_METHODS = ("exact", "clamp")
+
+# Number of (cut, edge) pairs scored per batch in slab_areas
+BATCH_ELEMENTS = 1 << 20
+
+# Edges spanning at most this many cuts are evaluated at those cuts directly
+# in slab_area_profile. Their quadratic pieces can be arbitrarily steep, which
+# would swamp the prefix sums with rounding error.
+DIRECT_CUTS = 2
+
+def _previous(vertex_offsets, count):
+    # Index of the previous vertex of the same polygon, wrapping around
+    previous = np.arange(count) - 1
+    starts = vertex_offsets[:-1][np.diff(vertex_offsets) > 0]
+    ends = vertex_offsets[1:][np.diff(vertex_offsets) > 0]
+    previous[starts] = ends - 1
+    return previous
+
+def _next(vertex_offsets, count):
+    # Index of the next vertex of the same polygon, wrapping around
+    following = np.arange(count) + 1
+    nonempty = np.diff(vertex_offsets) > 0
+    following[vertex_offsets[1:][nonempty] - 1] = vertex_offsets[:-1][nonempty]
+    return following
+
+def _offsets_after(vertex_offsets, keep_counts):
+    # New vertex offsets after vertex i is replaced by keep_counts[i] vertices
+    totals = np.zeros(len(keep_counts) + 1, dtype=np.int64)
+    np.cumsum(keep_counts, out=totals[1:])
+    return totals[vertex_offsets]
+
+def segment_sums(values, vertex_offsets):
+    """Sum values (last axis per vertex) over each polygon; empty polygons sum to 0."""
+    values = np.asarray(values)
+    vertex_offsets = np.asarray(vertex_offsets)
+    result = np.zeros(values.shape[:-1] + (len(vertex_offsets) - 1,))
+    nonempty = np.diff(vertex_offsets) > 0
+    if nonempty.any():
+        result[..., nonempty] = np.add.reduceat(values, vertex_offsets[:-1][nonempty], axis=-1)
+    return result
+
+def signed_areas(vertex_offsets, coords):
+    """Shoelace signed area of every polygon. Polygons with fewer than 3 vertices have area 0."""
+    coords = np.asarray(coords, dtype=np.float64)
+    following = _next(vertex_offsets, len(coords))
+    x, y = coords[:, 0], coords[:, 1]
+    terms = x * y[following] - x[following] * y
+    areas = segment_sums(terms, vertex_offsets) / 2
+    areas[np.diff(vertex_offsets) < 3] = 0.0
+    return areas
+
+def clip_half_plane(vertex_offsets, coords, axis, bound, keep_below):
+    """
+    Clip every polygon against one axis-aligned half-plane.
+
+    Args:
+        vertex_offsets (numpy.ndarray): Vertex range of each polygon.
+        coords (numpy.ndarray): (vertices, 2) coordinates.
+        axis (int): 0 to clip on x, 1 to clip on y.
+        bound (float): Position of the boundary.
+        keep_below (bool): Keep the side with coordinates <= bound, else >= bound.
+
+    Returns:
+        tuple: (vertex_offsets, coords) of the clipped polygons. Polygons
+               entirely outside become empty; the polygon count is unchanged.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) == 0:
+        return vertex_offsets, coords
+    values = coords[:, axis]
+    inside = values <= bound if keep_below else values >= bound
+
+    previous = _previous(vertex_offsets, len(coords))
+    crossing = inside != inside[previous]
+    counts = inside.astype(np.int64) + crossing
+
+    # Where the edge from the previous vertex crosses the boundary
+    start, end = coords[previous[crossing]], coords[crossing]
+    t = (bound - start[:, axis]) / (end[:, axis] - start[:, axis])
+    intersections = start + t[:, None] * (end - start)
+    intersections[:, axis] = bound
+
+    positions = np.cumsum(counts) - counts
+    clipped = np.empty((int(counts.sum()), 2))
+    clipped[positions[crossing]] = intersections
+    clipped[positions[inside] + crossing[inside]] = coords[inside]
+    return _offsets_after(vertex_offsets, counts), clipped
+
+def clip_rectangle(vertex_offsets, coords, x_min, y_min, x_max, y_max):
+    """Clip every polygon to a rectangle (see clip_half_plane)."""
+    for axis, bound, keep_below in ((0, x_min, False), (0, x_max, True), (1, y_min, False), (1, y_max, True)):
+        vertex_offsets, coords = clip_half_plane(vertex_offsets, coords, axis, bound, keep_below)
+    return vertex_offsets, coords
+
+def remove_redundant_vertices(vertex_offsets, coords):
+    """
+    Drop repeated vertices and vertices in the middle of a straight run.
+
+    Both leave the polygon's area and outline unchanged. Clipping produces
+    them wherever a polygon runs along the window edge.
+
+    Returns:
+        tuple: (vertex_offsets, coords) with the same number of polygons.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    for pass_ in ("repeated", "collinear"):
+        if len(coords) == 0:
+            break
+        previous = _previous(vertex_offsets, len(coords))
+        if pass_ == "repeated":
+            keep = np.any(coords != coords[previous], axis=1)
+        else:
+            following = _next(vertex_offsets, len(coords))
+            before = coords - coords[previous]
+            after = coords[following] - coords
+            keep = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0] != 0
+        vertex_offsets = _offsets_after(vertex_offsets, keep.astype(np.int64))
+        coords = coords[keep]
+    return vertex_offsets, coords
+
+def clip_objects(class_ids, vertex_offsets, coords, x_min, y_min, x_max, y_max):
+    """
+    Clip labelled objects to a rectangle, for writing out cropped labels.
+
+    Polygons (3 or more vertices) are clipped exactly, have redundant vertices
+    removed, and are dropped if nothing with a non-zero area is left. Objects
+    with fewer than 3 vertices (points, lines) have no area to clip and are
+    clamped into the rectangle as before.
+
+    Returns:
+        tuple: (class_ids, vertex_offsets, coords) of the remaining objects.
+    """
+    class_ids = np.asarray(class_ids)
+    vertex_offsets = np.asarray(vertex_offsets)
+    coords = np.asarray(coords, dtype=np.float64)
+    polygon = np.diff(vertex_offsets) >= 3
+
+    clipped_offsets, clipped = clip_rectangle(vertex_offsets, coords, x_min, y_min, x_max, y_max)
+    clipped_offsets, clipped = remove_redundant_vertices(clipped_offsets, clipped)
+    clamped = np.column_stack([np.clip(coords[:, 0], x_min, x_max), np.clip(coords[:, 1], y_min, y_max)])
+
+    # Take each object from the clipped or the clamped coordinates
+    counts = np.where(polygon, np.diff(clipped_offsets), np.diff(vertex_offsets))
+    keep = ~polygon | ((counts >= 3) & (signed_areas(clipped_offsets, clipped) != 0))
+    starts = np.where(polygon, clipped_offsets[:-1], vertex_offsets[:-1])[keep]
+    counts = counts[keep]
+    sources = np.repeat(polygon[keep], counts)
+    index = np.repeat(starts, counts) + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    result = np.empty((len(index), 2))
+    result[sources] = clipped[index[sources]]
+    result[~sources] = clamped[index[~sources]]
+    new_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    return class_ids[keep], new_offsets, result
+
+def slab_areas(vertex_offsets, coords, axis, cuts):
+    """
+    Signed area of the part of every polygon with coordinate <= cut on axis.
+
+    Args:
+        axis (int): 0 for x, 1 for y.
+        cuts (numpy.ndarray): Cut positions.
+
+    Returns:
+        numpy.ndarray: (cuts, polygons) signed areas, with the same sign
+                       convention as signed_areas.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    cuts = np.asarray(cuts, dtype=np.float64)
+    following = _next(vertex_offsets, len(coords))
+    u0, v0 = coords[:, axis], coords[:, 1 - axis]
+    u1, v1 = u0[following], v0[following]
+    # Area is the integral of x dy, or of -y dx
+    sign = 1.0 if axis == 0 else -1.0
+
+    result = np.empty((len(cuts), len(vertex_offsets) - 1))
+    rows = max(1, BATCH_ELEMENTS // max(1, len(coords)))
+    for first in range(0, len(cuts), rows):
+        c = cuts[first:first + rows, None]
+        m0, m1 = np.minimum(u0, c), np.minimum(u1, c)
+        # Integral of min(u, c) dv along each edge; edges crossing the cut are
+        # split where they reach it
+        crosses = (u0 < c) != (u1 < c)
+        straight = (m0 + m1) / 2 * (v1 - v0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Not used for edges parallel to the cut, where this divides by zero
+            vm = v0 + (c - u0) / (u1 - u0) * (v1 - v0)
+            split = (m0 + c) / 2 * (vm - v0) + (c + m1) / 2 * (v1 - vm)
+        terms = sign * np.where(crosses, split, straight)
+        result[first:first + rows] = segment_sums(terms, vertex_offsets)
+    result[:, np.diff(vertex_offsets) < 3] = 0.0
+    return result
+
+def _edge_integrals(u0, v0, u1, v1, c):
+    # Integral of min(u, c) dv along edges, as in slab_areas
+    m0, m1 = np.minimum(u0, c), np.minimum(u1, c)
+    crosses = (u0 < c) != (u1 < c)
+    straight = (m0 + m1) / 2 * (v1 - v0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vm = v0 + (c - u0) / (u1 - u0) * (v1 - v0)
+        split = (m0 + c) / 2 * (vm - v0) + (c + m1) / 2 * (v1 - vm)
+    return np.where(crosses, split, straight)
+
+def slab_area_profile(vertex_offsets, coords, axis, cuts):
+    """
+    Same result as slab_areas, in O(vertices * log(cuts) + polygons * cuts)
+    instead of O(vertices * cuts).
+
+    Args:
+        axis (int): 0 for x, 1 for y.
+        cuts (numpy.ndarray): Cut positions.
+
+    Returns:
+        numpy.ndarray: (cuts, polygons) signed areas.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    cuts = np.asarray(cuts, dtype=np.float64)
+    vertex_offsets = np.asarray(vertex_offsets)
+    polygons, count = len(vertex_offsets) - 1, len(cuts)
+    order = np.argsort(cuts, kind="stable")
+    sorted_cuts = cuts[order]
+
+    following = _next(vertex_offsets, len(coords))
+    u0, v0 = coords[:, axis], coords[:, 1 - axis]
+    u1, v1 = u0[following], v0[following]
+    # Area is the integral of x dy, or of -y dx
+    sign = 1.0 if axis == 0 else -1.0
+    dv = sign * (v1 - v0)
+    owner = np.repeat(np.arange(polygons), np.diff(vertex_offsets))
+
+    # Cuts [0, low) are below the edge, [low, high) across it, [high, count) above it
+    low = np.searchsorted(sorted_cuts, np.minimum(u0, u1), "left")
+    high = np.searchsorted(sorted_cuts, np.maximum(u0, u1), "left")
+    direct = high - low <= DIRECT_CUTS
+    swept = ~direct
+
+    # Coefficients of q * c**2 + m * c + k for each piece. Below the edge the
+    # integral is c * dv and above it (u0 + u1) / 2 * dv. Across it, with
+    # s = dv / (u1 - u0), it is s * (c * u1 - (c**2 + u0**2) / 2) for edges
+    # running towards larger u and s * ((c**2 + u1**2) / 2 - c * u0) for the
+    # others.
+    above = (u0 + u1) / 2 * dv
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(swept, dv / (u1 - u0), 0.0)
+    forward = u0 < u1
+    q = np.where(forward, -slope / 2, slope / 2)
+    m = np.where(forward, slope * u1, -slope * u0)
+    k = np.where(forward, -slope * u0 * u0 / 2, slope * u1 * u1 / 2)
+
+    def scatter(index, values):
+        # Add values at (owner, index) of a (polygons, count + 1) difference array
+        return np.bincount(owner * (count + 1) + index, weights=values, minlength=polygons * (count + 1))
+
+    zeros = np.zeros(len(owner), dtype=np.int64)
+    quadratic = scatter(low, np.where(swept, q, 0.0)) - scatter(high, np.where(swept, q, 0.0))
+    linear = scatter(zeros, dv) + scatter(low, np.where(swept, m, 0.0) - dv) - scatter(high, np.where(swept, m, 0.0))
+    constant = scatter(low, np.where(swept, k, 0.0)) + scatter(high, above - np.where(swept, k, 0.0))
+
+    shape = (polygons, count + 1)
+    quadratic = np.cumsum(quadratic.reshape(shape), axis=1)[:, :count]
+    linear = np.cumsum(linear.reshape(shape), axis=1)[:, :count]
+    constant = np.cumsum(constant.reshape(shape), axis=1)[:, :count]
+    result = (quadratic * sorted_cuts + linear) * sorted_cuts + constant
+
+    # Edges spanning few cuts: evaluate them exactly at the cuts they span
+    edges = np.flatnonzero(direct & (high > low))
+    if len(edges):
+        spans = high[edges] - low[edges]
+        edges = np.repeat(edges, spans)
+        index = np.repeat(low[np.flatnonzero(direct & (high > low))], spans)
+        index += np.arange(len(index)) - np.repeat(np.cumsum(spans) - spans, spans)
+        values = sign * _edge_integrals(u0[edges], v0[edges], u1[edges], v1[edges], sorted_cuts[index])
+        result += np.bincount(owner[edges] * count + index, weights=values, minlength=polygons * count).reshape(polygons, count)
+
+    areas = np.empty((count, polygons))
+    areas[order] = result.T
+    areas[:, np.diff(vertex_offsets) < 3] = 0.0
+    return areas
+
+def frame_polygons(width, height, polygons):
+    """
+    Pixel polygons clipped to the frame, and the area of each inside it.
+
+    This only depends on the image size and the polygons, so searches for
+    several crop sizes on one image can share it (see clip_crop's framed).
+
+    Returns:
+        tuple: (vertex_offsets, coords, areas).
+    """
+    vertex_offsets, coords = _pack_pixels(width, height, polygons)
+    vertex_offsets, coords = clip_rectangle(vertex_offsets, coords, 0, 0, width, height)
+    return vertex_offsets, coords, np.abs(signed_areas(vertex_offsets, coords))
+
+def _clip_loss_table(width, height, crop_x, crop_y, framed, lefts=None, tops=None):
+    """
+    Area lost by splits, as a table indexed by [left][top].
+
+    Args:
+        framed (tuple): (vertex_offsets, coords, areas) from frame_polygons.
+        lefts, tops (numpy.ndarray): Left and top crops to score. Default to
+                                     every split, 0..crop_x and 0..crop_y.
+    """
+    vertex_offsets, coords, inside = framed
+    lefts = np.arange(crop_x + 1) if lefts is None else np.asarray(lefts)
+    tops = np.arange(crop_y + 1) if tops is None else np.asarray(tops)
+
+    # The axis with fewer candidate cuts is looped over with exact clipping,
+    # the other is scored for all cuts at once with slab_area_profile
+    if len(lefts) <= len(tops):
+        outer_axis, outer_cuts, outer_crop, outer_size = 0, lefts, crop_x, width
+        inner_axis, inner_cuts, inner_crop, inner_size = 1, tops, crop_y, height
+    else:
+        outer_axis, outer_cuts, outer_crop, outer_size = 1, tops, crop_y, height
+        inner_axis, inner_cuts, inner_crop, inner_size = 0, lefts, crop_x, width
+
+    before = inner_cuts.astype(np.float64)
+    after = inner_size - (inner_crop - before)
+    table = np.empty((len(outer_cuts), len(inner_cuts)))
+    for row, outer in enumerate(outer_cuts.tolist()):
+        offsets, slab = vertex_offsets, coords
+        if outer_crop:
+            offsets, slab = clip_half_plane(offsets, slab, outer_axis, outer, False)
+            offsets, slab = clip_half_plane(offsets, slab, outer_axis, outer_size - (outer_crop - outer), True)
+        remaining = np.abs(slab_area_profile(offsets, slab, inner_axis, after) - slab_area_profile(offsets, slab, inner_axis, before))
+        table[row] = (inside - remaining).sum(axis=1)
+
+    return table.T if outer_axis == 1 else table
+
+def _pack_pixels(width, height, polygons):
+    # Polygons in YOLO format to pixel coordinates in the columnar layout
+    _, vertex_offsets, coords = transforms.pack([(0, points) for points in polygons])
+    return vertex_offsets, transforms.denormalize(width, height)(coords)
+
+def clip_crop(width, height, crop_x, crop_y, polygons, stats=None, framed=None):
+    """
+    Find the crop that loses the least polygon area, measured by exact clipping.
+
+    Splits are visited in the same order as autocrop.calculate_crop's
+    exhaustive search: the four one-sided crops first, then every split,
+    returning the first one that loses nothing, or else the first one with
+    the least loss. Loss is counted against the polygon area inside the
+    frame, so polygons that already reach outside the image do not stop the
+    search from finding a loss-free crop.
+
+    Args:
+        width (int): Current pixel width of the image.
+        height (int): Current pixel height of the image.
+        crop_x (int): Amount to crop horizontally, in total.
+        crop_y (int): Amount to crop vertically, in total.
+        polygons (list): List of polygons in YOLO format.
+        stats (dict): If given, receives "candidates" and "easy_crop" as in
+                      crop_search.profile_crop.
+        framed (tuple): frame_polygons(width, height, polygons), if already
+                        computed for another crop size.
+
+    Returns:
+        tuple: Optimal cropping amounts (left_crop, right_crop, top_crop, bottom_crop).
+    """
+    if framed is None:
+        framed = frame_polygons(width, height, polygons)
+    tolerance = 1e-9 * max(1.0, float(framed[2].sum()))
+
+    # Check for easy solution: full crop from one side, before scoring every split
+    easy_table = _clip_loss_table(width, height, crop_x, crop_y, framed, [crop_x, 0], [crop_y, 0])
+    for easy, (row, column) in enumerate(((0, 0), (1, 0), (0, 1), (1, 1))):
+        if abs(easy_table[row, column]) <= tolerance:
+            if stats is not None:
+                stats["candidates"] = easy_table.size
+                stats["easy_crop"] = easy
+            left, top = (crop_x, 0)[row], (crop_y, 0)[column]
+            return (left, crop_x - left, top, crop_y - top)
+
+    table = _clip_loss_table(width, height, crop_x, crop_y, framed)
+    if stats is not None:
+        stats["candidates"] = easy_table.size + table.size
+        stats["easy_crop"] = None
+
+    # Row-major order is the exhaustive search's visiting order. Self-intersecting
+    # polygons can have negative losses; like the exhaustive search, stop at
+    # the first split that loses nothing.
+    flat = table.reshape(-1)
+    zero = np.flatnonzero(np.abs(flat) <= tolerance)
+    index = int(zero[0]) if len(zero) else int(np.flatnonzero(flat <= flat.min() + tolerance)[0])
+    left, top = divmod(index, crop_y + 1)
+    return (left, crop_x - left, top, crop_y - top)
+
+def crop_loss(width, height, split, polygons, framed=None):
+    """
+    Polygon area one split loses, measured by exact clipping as in clip_crop.
+
+    Args:
+        split (tuple): (left, right, top, bottom) crop.
+        framed (tuple): frame_polygons(width, height, polygons), if already computed.
+
+    Returns:
+        tuple: (lost area, polygon area inside the frame), in pixels.
+    """
+    left, right, top, bottom = split
+    table, area = split_losses(width, height, left + right, top + bottom, [left], [top], polygons, framed)
+    return float(table[0, 0]), area
+
+def split_losses(width, height, crop_x, crop_y, lefts, tops, polygons, framed=None):
+    """
+    Polygon area lost by every split made of one of lefts and one of tops,
+    measured by exact clipping as in clip_crop.
+
+    Args:
+        crop_x (int): Amount to crop horizontally, in total.
+        crop_y (int): Amount to crop vertically, in total.
+        lefts, tops (list): Left and top crops to score.
+        framed (tuple): frame_polygons(width, height, polygons), if already computed.
+
+    Returns:
+        tuple: (table indexed by [left][top], polygon area inside the frame), in pixels.
+    """
+    if framed is None:
+        framed = frame_polygons(width, height, polygons)
+    return _clip_loss_table(width, height, crop_x, crop_y, framed, lefts, tops), float(framed[2].sum())
+
+def _direct_loss(width, height, split, polygons):
+    # Reference loss of one split: clip each polygon with plain Python loops
+    left, right, top, bottom = split
+    window = (left, top, width - right, height - bottom)
+    loss = 0.0
+    for points in polygons:
+        polygon = [(x * width, y * height) for x, y in zip(points[::2], points[1::2])]
+        if len(polygon) < 3:
+            continue
+        inside = _clip_python(polygon, (0, 0, width, height))
+        kept = _clip_python(inside, window)
+        loss += abs(_area_python(inside)) - abs(_area_python(kept))
+    return loss
+
+def _clip_python(polygon, rectangle):
+    x_min, y_min, x_max, y_max = rectangle
+    for axis, bound, below in ((0, x_min, False), (0, x_max, True), (1, y_min, False), (1, y_max, True)):
+        output = []
+        for i, current in enumerate(polygon):
+            previous = polygon[i - 1]
+            current_in = current[axis] <= bound if below else current[axis] >= bound
+            previous_in = previous[axis] <= bound if below else previous[axis] >= bound
+            if current_in != previous_in:
+                t = (bound - previous[axis]) / (current[axis] - previous[axis])
+                point = [previous[0] + t * (current[0] - previous[0]), previous[1] + t * (current[1] - previous[1])]
+                point[axis] = bound
+                output.append(tuple(point))
+            if current_in:
+                output.append(current)
+        polygon = output
+    return polygon
+
+def _area_python(polygon):
+    if len(polygon) < 3:
+        return 0.0
+    return sum(polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1] for i in range(len(polygon))) / 2
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    from crop_search import random_polygons
+
+    parser = argparse.ArgumentParser(description="Check the vectorized clipping against a plain Python Sutherland-Hodgman implementation.")
+    parser.add_argument("--trials", type=int, default=200, help="Number of random polygon sets to compare.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = 0
+    for trial in range(args.trials):
+        width, height = rng.randint(20, 120), rng.randint(20, 120)
+        crop_x, crop_y = (rng.randint(1, width // 2), 0) if rng.random() < 0.5 else (0, rng.randint(1, height // 2))
+        if rng.random() < 0.2:
+            crop_x, crop_y = rng.randint(1, width // 3), rng.randint(1, height // 3)
+        polygons = random_polygons(rng, rng.randint(1, 6), 12)
+
+        framed = frame_polygons(width, height, polygons)
+        table, total_area = _clip_loss_table(width, height, crop_x, crop_y, framed), float(framed[2].sum())
+        for left in range(crop_x + 1):
+            for top in range(crop_y + 1):
+                expected = _direct_loss(width, height, (left, crop_x - left, top, crop_y - top), polygons)
+                if abs(table[left, top] - expected) > 1e-6 * max(1.0, total_area):
+                    failures += 1
+                    print(f"Trial {trial}: split {(left, top)} loss {table[left, top]} != {expected}")
+
+        # The chosen split loses nothing, or no more than any other
+        split = clip_crop(width, height, crop_x, crop_y, polygons)
+        loss = _direct_loss(width, height, split, polygons)
+        tolerance = 1e-6 * max(1.0, total_area)
+        if abs(loss) > tolerance and loss > float(table.min()) + tolerance:
+            failures += 1
+            print(f"Trial {trial}: clip_crop chose {split}, which is not a least-loss split")
+
+        # Clipped labels keep exactly the area inside the window
+        window = (rng.uniform(0, width / 2), rng.uniform(0, height / 2), rng.uniform(width / 2, width), rng.uniform(height / 2, height))
+        vertex_offsets, coords = _pack_pixels(width, height, polygons)
+        _, clipped_offsets, clipped = clip_objects(np.zeros(len(polygons)), vertex_offsets, coords, *window)
+        expected = sum(abs(_area_python(_clip_python([(x * width, y * height) for x, y in zip(p[::2], p[1::2])], window)))
+                       for p in polygons if len(p) >= 6)
+        actual = np.abs(signed_areas(clipped_offsets, clipped)).sum()
+        if abs(actual - expected) > 1e-6 * max(1.0, expected):
+            failures += 1
+            print(f"Trial {trial}: clipped area {actual} != {expected}")
+
+    print(f"{args.trials - failures}/{args.trials} trials agree." if not failures else f"{failures} mismatches.")
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Douglas-Peucker simplification of YOLO polygons.
+#
+# Annotation tools often export masks with hundreds of vertices per object,
+# many of them closer together than an output pixel. Every later step (the
+# crop search, label adjustment, label formatting, preview rasterization)
+# scales with the vertex count, so dropping vertices that move the outline by
+# less than a tolerance makes all of them cheaper.
+#
+# Labels are normalized, so the tolerance is applied in a pixel space given by
+# per-axis scale factors: for autocrop these map normalized coordinates to
+# pixels of the target image, since the crop size is known before the crop
+# position is. A polygon is simplified as a closed ring: it is split at its
+# first vertex and the vertex farthest from it, and each half is simplified
+# as an open chain. Polygons always keep at least 3 vertices.
+
+def _segment_distances(points, start, end):
+    # Distance of each point to the segment from start to end
+    direction = end - start
+    length = float(direction @ direction)
+    if length == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ direction / length, 0.0, 1.0)
+    closest = start + t[:, None] * direction
+    return np.hypot(*(points - closest).T)
+
+def _max_deviation(points, keep):
+    # Largest distance of a dropped vertex from the edge of the simplified
+    # polygon that replaced it
+    kept = np.flatnonzero(keep)
+    ring = np.vstack([points, points])
+    deviation = 0.0
+    for first, last in zip(kept, np.append(kept[1:], kept[0] + len(points))):
+        if last - first > 1:
+            deviation = max(deviation, float(_segment_distances(ring[first + 1:last], ring[first], ring[last]).max()))
+    return deviation
+
+def simplify_ring(points, tolerance):
+    """
+    Simplify a closed polygon with the Douglas-Peucker algorithm.
+
+    Args:
+        points (numpy.ndarray): (vertices, 2) coordinates in the tolerance's units.
+        tolerance (float): Largest distance a dropped vertex may have from
+                           the simplified outline.
+
+    Returns:
+        tuple: (keep, max_deviation) where keep is a boolean mask of the
+               vertices to keep and max_deviation the largest distance of a
+               dropped vertex from the simplified outline.
+    """
+    count = len(points)
+    keep = np.ones(count, dtype=bool)
+    if count <= 3:
+        return keep, 0.0
+
+    keep[:] = False
+    ring = np.vstack([points, points[:1]])
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    if far == 0:
+        # Every vertex is at the same position
+        keep[:3] = True
+        return keep, 0.0
+    keep[0] = keep[far] = True
+
+    stack = [(0, far), (far, count)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(ring[first + 1:last], ring[first], ring[last])
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle % count] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+
+    if keep.sum() < 3:
+        # Thinner than the tolerance: keep the vertex farthest from the chord
+        # so the object stays a polygon
+        distances = _segment_distances(points, points[0], points[far])
+        distances[keep] = -1.0
+        keep[int(np.argmax(distances))] = True
+    return keep, _max_deviation(points, keep)
+
+def simplify_objects(objects, tolerance, scale_x=1.0, scale_y=1.0):
+    """
+    Simplify every polygon of a label file.
+
+    Args:
+        objects (list): (class_index, points) tuples with normalized points.
+        tolerance (float): Largest deviation allowed, in scaled units.
+        scale_x (float): Factor from normalized x to the tolerance's units.
+        scale_y (float): Factor from normalized y to the tolerance's units.
+
+    Returns:
+        tuple: (objects, stats) where stats has "vertices_before",
+               "vertices_after" and "max_deviation" (in scaled units).
+    """
+    simplified = []
+    before = after = 0
+    max_deviation = 0.0
+    scale = np.array([scale_x, scale_y], dtype=np.float64)
+    for class_index, points in objects:
+        coords = np.asarray(points[:2 * (len(points) // 2)], dtype=np.float64).reshape(-1, 2)
+        keep, deviation = simplify_ring(coords * scale, tolerance)
+        before += len(coords)
+        after += int(keep.sum())
+        max_deviation = max(max_deviation, deviation)
+        simplified.append((class_index, coords[keep].reshape(-1).tolist()))
+    return simplified, {"vertices_before": before, "vertices_after": after, "max_deviation": max_deviation}
+
+class SimplifyReport:
+    """Totals of simplify_objects stats over a run."""
+
+    def __init__(self):
+        self.images = 0
+        self.vertices_before = 0
+        self.vertices_after = 0
+        self.max_deviation = 0.0
+
+    def add(self, stats):
+        self.images += 1
+        self.vertices_before += stats["vertices_before"]
+        self.vertices_after += stats["vertices_after"]
+        self.max_deviation = max(self.max_deviation, stats["max_deviation"])
+
+    def summary(self, unit="px"):
+        if not self.vertices_before:
+            return f"Simplified {self.images} images: no vertices."
+        reduction = 1 - self.vertices_after / self.vertices_before
+        return (f"Simplified {self.images} images: {self.vertices_before} -> {self.vertices_after} vertices "
+                f"({reduction:.1%} fewer), max deviation {self.max_deviation:.3f} {unit}.")
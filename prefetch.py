@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Read-ahead and write-behind file I/O for runs on high-latency storage.
+#
+# On NFS or object-store mounts every open() waits on a round trip while the
+# CPU does nothing. Prefetcher wraps the job iterator given to run_batch: a
+# few threads read the next jobs' input files into memory while the current
+# ones are being computed, so the compute stage gets its inputs from memory.
+# WriteBehind takes the encoded outputs of finished jobs and writes them from
+# threads, so the next job does not wait for the previous one's files.
+#
+# Both are bounded by a depth (jobs read ahead, or job outputs waiting to be
+# written) so memory stays flat on datasets of any size, and both measure how
+# long the compute side waited on them: if the stall times stay near zero the
+# run is CPU-bound.
+
+class Prefetcher:
+    """
+    Iterate over jobs with their inputs read ahead by a thread pool.
+
+    Use as run_batch(..., prefetch=Prefetcher(read)). Jobs come out in input
+    order. If reading a job fails, the original job is passed on so that the
+    job function reads the file itself and reports the error as usual.
+
+    Args:
+        read (callable): Takes a job and returns it with its inputs loaded.
+                         Runs in a thread, so it should only do I/O.
+        depth (int): Maximum number of jobs read ahead.
+        threads (int): Number of reader threads.
+    """
+
+    def __init__(self, read, depth=16, threads=4):
+        self.read = read
+        self.depth = max(1, depth)
+        self.threads = max(1, threads)
+        self.jobs = 0
+        self.stall_seconds = 0.0
+        self.ready_total = 0
+
+    def __call__(self, jobs):
+        jobs = iter(jobs)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            def fill():
+                while len(pending) < self.depth:
+                    try:
+                        job = next(jobs)
+                    except StopIteration:
+                        return
+                    pending.append((job, executor.submit(self.read, job)))
+
+            fill()
+            while pending:
+                # Queue depth: reads already finished when the next job is wanted
+                self.ready_total += sum(future.done() for _, future in pending)
+                job, future = pending.popleft()
+                start = time.perf_counter()
+                try:
+                    loaded = future.result()
+                except Exception:
+                    loaded = job
+                self.stall_seconds += time.perf_counter() - start
+                self.jobs += 1
+                fill()
+                yield loaded
+
+    def summary(self):
+        if not self.jobs:
+            return "Prefetch: no jobs."
+        return (f"Prefetch: {self.jobs} jobs, waited {self.stall_seconds:.2f}s for reads, "
+                f"{self.ready_total / self.jobs:.1f} of {self.depth} reads ready on average.")
+
+class WriteBehind:
+    """
+    Write job outputs from a thread pool while later jobs are computed.
+
+    write() blocks once depth jobs' outputs are waiting, so a slow disk slows
+    the run down instead of filling memory. Outputs of one job are written in
+    order by one thread. finished() reports which writes are done, and should
+    be called from the thread that calls write().
+
+    Args:
+        depth (int): Maximum number of jobs whose outputs wait to be written.
+        threads (int): Number of writer threads.
+    """
+
+    def __init__(self, depth=16, threads=4):
+        self.depth = max(1, depth)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.slots = threading.Semaphore(self.depth)
+        self.done = queue.SimpleQueue()
+        self.pending = 0
+        self.max_pending = 0
+        self.stall_seconds = 0.0
+        self.jobs = 0
+        self.bytes_written = 0
+
+    def write(self, files, key=None):
+        """
+        Queue files for writing.
+
+        Args:
+            files (list): (path, data) tuples; bytes are written in binary
+                          mode, str in text mode.
+            key: Returned by finished() once the files are written.
+        """
+        start = time.perf_counter()
+        self.slots.acquire()
+        self.stall_seconds += time.perf_counter() - start
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        self.executor.submit(self._write, files, key)
+
+    def _write(self, files, key):
+        size = 0
+        error = None
+        try:
+            for path, data in files:
+                with open(path, "wb" if isinstance(data, bytes) else "w") as file:
+                    file.write(data)
+                size += len(data)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.done.put((key, size, error))
+        self.slots.release()
+
+    def finished(self):
+        """
+        Writes completed since the last call.
+
+        Returns:
+            list: (key, error) tuples, error being None for successful writes.
+        """
+        results = []
+        while True:
+            try:
+                key, size, error = self.done.get_nowait()
+            except queue.Empty:
+                return results
+            self.pending -= 1
+            self.jobs += 1
+            self.bytes_written += size
+            results.append((key, error))
+
+    def close(self):
+        """Wait for every queued write; returns the finished() results."""
+        self.executor.shutdown(wait=True)
+        return self.finished()
+
+    def summary(self):
+        return (f"Write-behind: {self.jobs} jobs, {self.bytes_written / 1e6:.1f} MB, "
+                f"waited {self.stall_seconds:.2f}s for writes, at most {self.max_pending} of {self.depth} jobs queued.")
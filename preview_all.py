@@ -2,12 +2,31 @@ import argparse
 import os
 import re
 import sys
-from PIL import Image
-from PIL import ImageDraw
+from batch import default_workers, print_failures, run_batch
+from label_store import is_store
+from contact_sheet import ContactSheetWriter, INDEX_FILENAME, parse_grid
+from overlay import render_job, thumbnail_job
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Draw the polygons of YOLOv11 labels on a directory of images.")
+    parser.add_argument("--labels", type=str, default="./labels",
+                        help="Directory of .txt label files or a label store (.ylbl). Defaults to ./labels.")
+    parser.add_argument("--class-colors", action="store_true", help="Colour polygons by class instead of all green.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes (0 = one per CPU, {default_workers()} here).")
+    parser.add_argument("--sheets", action="store_true",
+                        help="Write paged contact sheets of thumbnails and an index instead of one full-size PNG per image.")
+    parser.add_argument("--grid", type=parse_grid, default=(8, 8), metavar="COLUMNSxROWS",
+                        help="Thumbnails per contact sheet. Defaults to 8x8.")
+    parser.add_argument("--thumbnail-size", type=int, default=256,
+                        help="Maximum thumbnail width and height in pixels. Defaults to 256.")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     image_dir = "./images"
-    label_dir = "./labels"
+    label_dir = args.labels
     preview_dir = "./previews"
 
     # Ensure directories exist
@@ -22,45 +41,46 @@ def main():
         sys.exit(1)
 
     # Get a list of files in each directory
-    image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-    
-    for image_file in image_files:
-        img = Image.open(os.path.join(image_dir, image_file)).convert('RGBA')
-        width = img.size[0]
-        height = img.size[1]
-
-        label_file = os.path.join(label_dir, re.sub(r'\.(jpeg|jpg|JPEG|JPG|png|PNG)$', '.txt', image_file))
+    image_files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
 
-        # YOLOv11 labels file format:
-        # https://docs.ultralytics.com/datasets/segment/#supported-dataset-formats
-        with open(label_file) as polygons:
-            for line in polygons:
-                if line.strip() == "":
-                    continue
-
-                x = []
-                y = []
-
-                points = line.split()[1:]
-                x = points[::2] # all even indexes
-                y = points[1::2] # all odd indexes
+    jobs = []
+    for image_file in image_files:
+        name = re.sub(r'\.(jpeg|jpg|JPEG|JPG|png|PNG)$', '', image_file)
+        job = {
+            "image_path": os.path.join(image_dir, image_file),
+            "output_path": os.path.join(preview_dir, 'preview_' + image_file + ".png"),
+            "color_by_class": args.class_colors,
+        }
+        if is_store(label_dir):
+            # Each job loads its own labels, like pipeline.py does
+            job["label_path"] = (label_dir, name)
+        else:
+            job["label_path"] = os.path.join(label_dir, name + ".txt")
+        jobs.append(job)
 
-                # Convert from percentages to actual pixel values
-                x = [float(pt) * width for pt in x]
-                y = [float(pt) * height for pt in y]
+    workers = args.workers if args.workers > 0 else default_workers()
+    describe = lambda job: os.path.basename(job["image_path"])
 
-                # convert values to ints
-                x = map(int, x)
-                y = map(int, y)
+    if not args.sheets:
+        failures = run_batch(render_job, jobs, workers, describe=describe)
+        print_failures(failures, describe)
+        return
 
-                img2 = img.copy()
-                draw = ImageDraw.Draw(img2)
-                draw.polygon(list(zip(x,y)), fill = "green")
+    columns, rows = args.grid
+    writer = ContactSheetWriter(preview_dir, len(jobs), columns, rows, args.thumbnail_size)
+    for position, job in enumerate(jobs):
+        job["position"] = position
+        job["thumbnail_size"] = args.thumbnail_size
 
-                img3 = Image.blend(img, img2, 0.5)
-                img = img3
+    def on_result(job, thumbnail):
+        writer.add(job["position"], describe(job), thumbnail)
 
-            img.save(os.path.join(preview_dir, 'preview_' + image_file + ".png"))
+    failures = run_batch(thumbnail_job, jobs, workers, describe=describe, on_result=on_result)
+    for job, _ in failures:
+        writer.skip(job["position"])
+    writer.close()
+    print_failures(failures, describe)
+    print(f"Contact sheets and {INDEX_FILENAME} written to {preview_dir}")
 
 if __name__ == "__main__":
     main()